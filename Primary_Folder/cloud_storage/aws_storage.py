@@ -1,15 +1,18 @@
-import boto3
 from Primary_Folder.configuration.aws_connection import S3Client
 from io import StringIO
-from typing import Union,List
+from typing import TYPE_CHECKING,Dict,Union,List
 import os,sys
 from Primary_Folder.logger import logging
-from mypy_boto3_s3.service_resource import Bucket
 from Primary_Folder.exceptions import final_except
-from botocore.exceptions import ClientError
 from pandas import DataFrame,read_csv
 import pickle
 
+logger = logging.getLogger(__name__)
+
+if TYPE_CHECKING:
+    # type stubs only, importing them at runtime costs more than boto3 itself
+    from mypy_boto3_s3.service_resource import Bucket
+
 
 class SimpleStorageService:
 
@@ -43,7 +46,7 @@ class SimpleStorageService:
         Version     :   1.2
         Revisions   :   moved setup to cloud
         """
-        logging.info("Entered the read_object method of S3Operations class")
+        logger.info("Entered the read_object method of S3Operations class")
 
         try:
             func = (
@@ -52,13 +55,13 @@ class SimpleStorageService:
                 else object_name.get()["Body"].read()
             )
             conv_func = lambda: StringIO(func()) if make_readable is True else func()
-            logging.info("Exited the read_object method of S3Operations class")
+            logger.info("Exited the read_object method of S3Operations class")
             return conv_func()
 
         except Exception as e:
             raise final_except(e, sys) from e
 
-    def get_bucket(self, bucket_name: str) -> Bucket:
+    def get_bucket(self, bucket_name: str) -> "Bucket":
         """
         Method Name :   get_bucket
         Description :   This method gets the bucket object based on the bucket_name
@@ -69,11 +72,11 @@ class SimpleStorageService:
         Version     :   1.2
         Revisions   :   moved setup to cloud
         """
-        logging.info("Entered the get_bucket method of S3Operations class")
+        logger.info("Entered the get_bucket method of S3Operations class")
 
         try:
             bucket = self.s3_resource.Bucket(bucket_name)
-            logging.info("Exited the get_bucket method of S3Operations class")
+            logger.info("Exited the get_bucket method of S3Operations class")
             return bucket
         except Exception as e:
             raise final_except(e, sys) from e
@@ -89,7 +92,7 @@ class SimpleStorageService:
         Version     :   1.2
         Revisions   :   moved setup to cloud
         """
-        logging.info("Entered the get_file_object method of S3Operations class")
+        logger.info("Entered the get_file_object method of S3Operations class")
 
         try:
             bucket = self.get_bucket(bucket_name)
@@ -99,7 +102,7 @@ class SimpleStorageService:
             func = lambda x: x[0] if len(x) == 1 else x
 
             file_objs = func(file_objects)
-            logging.info("Exited the get_file_object method of S3Operations class")
+            logger.info("Exited the get_file_object method of S3Operations class")
 
             return file_objs
 
@@ -117,7 +120,7 @@ class SimpleStorageService:
         Version     :   1.2
         Revisions   :   moved setup to cloud
         """
-        logging.info("Entered the load_model method of S3Operations class")
+        logger.info("Entered the load_model method of S3Operations class")
 
         try:
             func = (
@@ -129,12 +132,84 @@ class SimpleStorageService:
             file_object = self.get_file_object(model_file, bucket_name)
             model_obj = self.read_object(file_object, decode=False)
             model = pickle.loads(model_obj)
-            logging.info("Exited the load_model method of S3Operations class")
+            logger.info("Exited the load_model method of S3Operations class")
             return model
 
         except Exception as e:
             raise final_except(e, sys) from e
 
+    def get_object_etag(self, key: str, bucket_name: str) -> str:
+        """
+        Method Name :   get_object_etag
+        Description :   This method reads the ETag of the key object in bucket_name bucket without downloading it
+
+        Output      :   ETag of the object is returned
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        logger.info("Entered the get_object_etag method of S3Operations class")
+
+        try:
+            response = self.s3_client.head_object(Bucket=bucket_name, Key=key)
+            logger.info("Exited the get_object_etag method of S3Operations class")
+            return response["ETag"]
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def get_object_metadata(self, key: str, bucket_name: str) -> Dict[str, str]:
+        """
+        Method Name :   get_object_metadata
+        Description :   This method reads the user metadata of the key object in bucket_name bucket without downloading it
+
+        Output      :   Metadata of the object is returned
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        logger.info("Entered the get_object_metadata method of S3Operations class")
+
+        try:
+            response = self.s3_client.head_object(Bucket=bucket_name, Key=key)
+            logger.info("Exited the get_object_metadata method of S3Operations class")
+            return response.get("Metadata", {})
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def delete_object(self, key: str, bucket_name: str) -> None:
+        """
+        Method Name :   delete_object
+        Description :   This method deletes the key object of bucket_name bucket, a missing object is not an error
+
+        Output      :   Object is deleted from s3 bucket
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        logger.info("Entered the delete_object method of S3Operations class")
+
+        try:
+            self.s3_client.delete_object(Bucket=bucket_name, Key=key)
+            logger.info(f"Deleted {key} from {bucket_name} bucket")
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def download_file(self, key: str, bucket_name: str, to_filename: str, etag: str = None) -> None:
+        """
+        Method Name :   download_file
+        Description :   This method downloads the key object of bucket_name bucket to the to_filename local file,
+                        failing if etag is given and the object no longer has it
+
+        Output      :   File is written at to_filename
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        logger.info("Entered the download_file method of S3Operations class")
+
+        try:
+            extra_args = None if etag is None else {"IfMatch": etag}
+            self.s3_client.download_file(bucket_name, key, to_filename, ExtraArgs=extra_args)
+            logger.info(f"Downloaded {key} from {bucket_name} bucket to {to_filename}")
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
     def create_folder(self, folder_name: str, bucket_name: str) -> None:
         """
         Method Name :   create_folder
@@ -146,7 +221,8 @@ class SimpleStorageService:
         Version     :   1.2
         Revisions   :   moved setup to cloud
         """
-        logging.info("Entered the create_folder method of S3Operations class")
+        logger.info("Entered the create_folder method of S3Operations class")
+        from botocore.exceptions import ClientError
 
         try:
             self.s3_resource.Object(bucket_name, folder_name).load()
@@ -157,12 +233,14 @@ class SimpleStorageService:
                 self.s3_client.put_object(Bucket=bucket_name, Key=folder_obj)
             else:
                 pass
-            logging.info("Exited the create_folder method of S3Operations class")
+            logger.info("Exited the create_folder method of S3Operations class")
 
-    def upload_file(self, from_filename: str, to_filename: str,  bucket_name: str,  remove: bool = True):
+    def upload_file(self, from_filename: str, to_filename: str,  bucket_name: str,  remove: bool = True,
+                    metadata: Dict[str, str] = None):
         """
         Method Name :   upload_file
-        Description :   This method uploads the from_filename file to bucket_name bucket with to_filename as bucket filename
+        Description :   This method uploads the from_filename file to bucket_name bucket with to_filename as bucket filename,
+                        and metadata as its user metadata
 
         Output      :   Folder is created in s3 bucket
         On Failure  :   Write an exception log and then raise an exception
@@ -170,30 +248,31 @@ class SimpleStorageService:
         Version     :   1.2
         Revisions   :   moved setup to cloud
         """
-        logging.info("Entered the upload_file method of S3Operations class")
+        logger.info("Entered the upload_file method of S3Operations class")
 
         try:
-            logging.info(
+            logger.info(
                 f"Uploading {from_filename} file to {to_filename} file in {bucket_name} bucket"
             )
 
             self.s3_resource.meta.client.upload_file(
-                from_filename, bucket_name, to_filename
+                from_filename, bucket_name, to_filename,
+                ExtraArgs=None if metadata is None else {"Metadata": metadata}
             )
 
-            logging.info(
+            logger.info(
                 f"Uploaded {from_filename} file to {to_filename} file in {bucket_name} bucket"
             )
 
             if remove is True:
                 os.remove(from_filename)
 
-                logging.info(f"Remove is set to {remove}, deleted the file")
+                logger.info(f"Remove is set to {remove}, deleted the file")
 
             else:
-                logging.info(f"Remove is set to {remove}, not deleted the file")
+                logger.info(f"Remove is set to {remove}, not deleted the file")
 
-            logging.info("Exited the upload_file method of S3Operations class")
+            logger.info("Exited the upload_file method of S3Operations class")
 
         except Exception as e:
             raise final_except(e, sys) from e
@@ -209,14 +288,14 @@ class SimpleStorageService:
         Version     :   1.2
         Revisions   :   moved setup to cloud
         """
-        logging.info("Entered the upload_df_as_csv method of S3Operations class")
+        logger.info("Entered the upload_df_as_csv method of S3Operations class")
 
         try:
             data_frame.to_csv(local_filename, index=None, header=True)
 
             self.upload_file(local_filename, bucket_filename, bucket_name)
 
-            logging.info("Exited the upload_df_as_csv method of S3Operations class")
+            logger.info("Exited the upload_df_as_csv method of S3Operations class")
 
         except Exception as e:
             raise final_except(e, sys) from e
@@ -232,12 +311,12 @@ class SimpleStorageService:
         Version     :   1.2
         Revisions   :   moved setup to cloud
         """
-        logging.info("Entered the get_df_from_object method of S3Operations class")
+        logger.info("Entered the get_df_from_object method of S3Operations class")
 
         try:
             content = self.read_object(object_, make_readable=True)
             df = read_csv(content, na_values="na")
-            logging.info("Exited the get_df_from_object method of S3Operations class")
+            logger.info("Exited the get_df_from_object method of S3Operations class")
             return df
         except Exception as e:
             raise final_except(e, sys) from e
@@ -253,12 +332,12 @@ class SimpleStorageService:
         Version     :   1.2
         Revisions   :   moved setup to cloud
         """
-        logging.info("Entered the read_csv method of S3Operations class")
+        logger.info("Entered the read_csv method of S3Operations class")
 
         try:
             csv_obj = self.get_file_object(filename, bucket_name)
             df = self.get_df_from_object(csv_obj)
-            logging.info("Exited the read_csv method of S3Operations class")
+            logger.info("Exited the read_csv method of S3Operations class")
             return df
         except Exception as e:
             raise final_except(e, sys) from e
\ No newline at end of file
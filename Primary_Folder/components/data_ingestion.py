@@ -1,47 +1,334 @@
 import os
+import shutil
 import sys
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterator, Optional, Tuple
+import numpy as np
 import pandas as pd
+from bson import json_util
 from pandas import DataFrame
 from sklearn.model_selection import train_test_split
+from Primary_Folder.constants import SCHEMA_FILE_PATH
 from Primary_Folder.entity.config_entity import DataIngestionConfig
 from Primary_Folder.entity.artifact_entity import DataIngestionArtifact
 from Primary_Folder.exceptions import final_except
 from Primary_Folder.logger import logging
 from Primary_Folder.database_access.db_extract import USvisaData
+from Primary_Folder.pipline.artifact_store import ArtifactStore
+from Primary_Folder.utils.main import (NON_NUMERIC_VALUES_ATTR, DataFrameChunkWriter, apply_schema_dtypes,
+                                       count_non_numeric_values, get_schema_column_types, iter_dataframe_chunks,
+                                       read_dataframe, read_yaml_file, write_dataframe, write_dataframe_chunks)
 
 class DataIngestion:
-    def __init__(self, data_ingestion_config: DataIngestionConfig = DataIngestionConfig()):
+    def __init__(self, data_ingestion_config: DataIngestionConfig = DataIngestionConfig(),
+                 artifact_store: Optional[ArtifactStore] = None):
         """
         :param data_ingestion_config: configuration for data ingestion
+        :param artifact_store: Optional store handing the train and test sets to the next stages in memory
         """
         try:
             self.data_ingestion_config = data_ingestion_config
+            self.artifact_store = artifact_store
+            self._schema_config = read_yaml_file(file_path=SCHEMA_FILE_PATH)
+            # values of the numeric columns that were not numbers and were exported as missing, per column
+            self.non_numeric_values: Dict[str, int] = defaultdict(int)
+        except Exception as e:
+            raise final_except(e, sys)
+
+    @property
+    def column_types(self) -> Dict[str, str]:
+        return get_schema_column_types(self._schema_config)
+
+    def _iter_export_chunks(self, usvisa_data: USvisaData, query: Optional[dict] = None) -> Iterator[DataFrame]:
+        config = self.data_ingestion_config
+        if query is None and config.export_n_partitions > 1:
+            return usvisa_data.iter_collection_chunks_parallel(
+                collection_name=config.collection_name, batch_size=config.export_batch_size,
+                n_partitions=config.export_n_partitions, max_workers=config.export_max_workers,
+                column_types=self.column_types)
+        return usvisa_data.iter_collection_chunks(
+            collection_name=config.collection_name, batch_size=config.export_batch_size,
+            query=query, column_types=self.column_types)
+
+    def _count_non_numeric_values(self, chunks: Iterator[DataFrame]) -> Iterator[DataFrame]:
+        for chunk in chunks:
+            for column, n_values in chunk.attrs.get(NON_NUMERIC_VALUES_ATTR, {}).items():
+                self.non_numeric_values[column] += n_values
+            yield chunk
+
+    def stream_data_into_feature_store(self) -> int:
+        """
+        Method Name :   stream_data_into_feature_store
+        Description :   This method streams data from mongodb to csv file batch by batch, each batch is
+                        converted to typed columns and appended to the file as it arrives, so memory
+                        stays bounded by export_batch_size whatever the size of the collection.
+                        With export_n_partitions > 1 the _id ranges are read concurrently
+
+        Output      :   number of exported rows
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            feature_store_file_path = self.data_ingestion_config.feature_store_file_path
+            logging.info(f"Streaming data from mongodb into feature store file path: {feature_store_file_path}")
+            n_rows = write_dataframe_chunks(feature_store_file_path,
+                                            self._count_non_numeric_values(self._iter_export_chunks(USvisaData())),
+                                            column_types=self.column_types)
+            logging.info(f"Exported {n_rows} rows into feature store file path: {feature_store_file_path}")
+            return n_rows
+
+        except Exception as e:
+            raise final_except(e, sys)
+
+    def read_watermark(self) -> Optional[dict]:
+        """
+        Method Name :   read_watermark
+        Description :   This method reads the high-water mark saved with the snapshot by the previous run
+
+        Output      :   dict with the watermark field, value and n_rows of the snapshot, None when there is no
+                        usable snapshot
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            config = self.data_ingestion_config
+            if not (os.path.exists(config.watermark_file_path) and os.path.exists(config.snapshot_file_path)):
+                return None
+            with open(config.watermark_file_path) as watermark_file:
+                watermark = json_util.loads(watermark_file.read())
+            if watermark.get("field") != config.watermark_field:
+                logging.info(f"Snapshot watermark is on {watermark.get('field')}, not {config.watermark_field}")
+                return None
+            return watermark
+
+        except Exception as e:
+            raise final_except(e, sys)
+
+    def write_watermark(self, value: object, n_rows: int) -> None:
+        config = self.data_ingestion_config
+        tmp_file_path = config.watermark_file_path + ".tmp"
+        with open(tmp_file_path, "w") as watermark_file:
+            watermark_file.write(json_util.dumps({"field": config.watermark_field, "value": value, "n_rows": n_rows,
+                                                  NON_NUMERIC_VALUES_ATTR: dict(self.non_numeric_values),
+                                                  "updated_at": datetime.now().isoformat()}))
+        os.replace(tmp_file_path, config.watermark_file_path)
+
+    def merge_into_snapshot(self, delta_file_path: str) -> int:
+        """
+        Method Name :   merge_into_snapshot
+        Description :   This method merges the new and changed rows of delta_file_path into the snapshot chunk by
+                        chunk: snapshot rows whose key_column is in the delta are replaced by the delta rows.
+                        Values are kept as text, so untouched rows are written back unchanged
+
+        Output      :   number of rows of the merged snapshot
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            config = self.data_ingestion_config
+            read_options = dict(dtype=str, keep_default_na=False, chunksize=config.export_batch_size)
+            columns = list(pd.read_csv(config.snapshot_file_path, nrows=0).columns)
+            delta_keys = set()
+            if config.key_column in columns:
+                delta_keys = set(pd.read_csv(delta_file_path, usecols=[config.key_column], dtype=str,
+                                             keep_default_na=False)[config.key_column])
+
+            def merged_chunks() -> Iterator[DataFrame]:
+                for chunk in pd.read_csv(config.snapshot_file_path, **read_options):
+                    yield chunk[~chunk[config.key_column].isin(delta_keys)] if delta_keys else chunk
+                yield from pd.read_csv(delta_file_path, **read_options)
+
+            n_rows = write_dataframe_chunks(config.snapshot_file_path, merged_chunks(), columns=columns)
+            logging.info(f"Merged {delta_file_path} into snapshot, {len(delta_keys)} keys updated or added")
+            return n_rows
+
+        except Exception as e:
+            raise final_except(e, sys)
+
+    def export_incremental_into_feature_store(self) -> int:
+        """
+        Method Name :   export_incremental_into_feature_store
+        Description :   This method pulls only the documents above the watermark of the previous run, merges them
+                        into the snapshot kept outside the timestamped artifact dir and copies the snapshot into the
+                        feature store. Without a snapshot, or with full_refresh, the whole collection is exported.
+                        Deleted documents are only dropped from the snapshot by a full refresh
+
+        Output      :   number of rows in the feature store
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            config = self.data_ingestion_config
+            usvisa_data = USvisaData()
+            watermark = None if config.full_refresh else self.read_watermark()
+
+            if watermark is None:
+                # taken before the export: documents written meanwhile are pulled again next run and
+                # replaced by key, never missed
+                high_water_mark = usvisa_data.get_max_value(config.collection_name, config.watermark_field)
+                logging.info(f"Full export into snapshot, watermark {config.watermark_field} = {high_water_mark}")
+                n_rows = write_dataframe_chunks(config.snapshot_file_path,
+                                                self._count_non_numeric_values(self._iter_export_chunks(usvisa_data)))
+            else:
+                # counted when the rows were exported, the snapshot only keeps them as missing values
+                self.non_numeric_values.update(watermark.get(NON_NUMERIC_VALUES_ATTR, {}))
+                query = {config.watermark_field: {"$gt": watermark["value"]}}
+                high_water_mark = usvisa_data.get_max_value(config.collection_name, config.watermark_field, query)
+                if high_water_mark is None:
+                    logging.info(f"No documents above watermark {watermark['value']}, snapshot is current")
+                    n_rows = watermark["n_rows"]
+                else:
+                    query[config.watermark_field]["$lte"] = high_water_mark
+                    delta_file_path = config.snapshot_file_path + ".delta"
+                    n_delta_rows = write_dataframe_chunks(delta_file_path, self._count_non_numeric_values(
+                        self._iter_export_chunks(usvisa_data, query=query)))
+                    logging.info(f"Pulled {n_delta_rows} documents above watermark {watermark['value']}")
+                    n_rows = self.merge_into_snapshot(delta_file_path)
+                    os.remove(delta_file_path)
+
+            if high_water_mark is not None:
+                self.write_watermark(high_water_mark, n_rows)
+
+            feature_store_file_path = config.feature_store_file_path
+            os.makedirs(os.path.dirname(feature_store_file_path), exist_ok=True)
+            if os.path.splitext(feature_store_file_path)[1] == os.path.splitext(config.snapshot_file_path)[1]:
+                shutil.copyfile(config.snapshot_file_path, feature_store_file_path)
+            else:
+                snapshot_chunks = (pd.read_csv(config.snapshot_file_path, chunksize=config.export_batch_size)
+                                   if n_rows else iter(()))
+                write_dataframe_chunks(feature_store_file_path, snapshot_chunks, column_types=self.column_types)
+            logging.info(f"Copied snapshot of {n_rows} rows into feature store file path: {feature_store_file_path}")
+            return n_rows
+
         except Exception as e:
             raise final_except(e, sys)
 
     def export_data_into_feature_store(self) -> DataFrame:
         """
         Method Name :   export_data_into_feature_store
-        Description :   This method exports data from mongodb to csv file
+        Description :   This method exports data from mongodb to csv file, incrementally on top of the previous
+                        snapshot when incremental is set, streamed batch by batch when streaming_export is set
         
         Output      :   data is returned as artifact of data ingestion components
         On Failure  :   Write an exception log and then raise an exception
         """
         try:
+            if self.data_ingestion_config.incremental or self.data_ingestion_config.streaming_export:
+                if self.data_ingestion_config.incremental:
+                    n_rows = self.export_incremental_into_feature_store()
+                else:
+                    n_rows = self.stream_data_into_feature_store()
+                if n_rows == 0:
+                    return DataFrame()
+                return read_dataframe(self.data_ingestion_config.feature_store_file_path,
+                                      column_types=self.column_types)
+
             logging.info(f"Exporting data from mongodb")
             usvisa_data = USvisaData()
             dataframe = usvisa_data.export_collection_as_dataframe(collection_name=self.data_ingestion_config.collection_name)
             logging.info(f"Shape of dataframe: {dataframe.shape}")
+            self.non_numeric_values.update(count_non_numeric_values(dataframe, self.column_types))
+            dataframe = apply_schema_dtypes(dataframe, self.column_types)
             feature_store_file_path = self.data_ingestion_config.feature_store_file_path
-            dir_path = os.path.dirname(feature_store_file_path)
-            os.makedirs(dir_path, exist_ok=True)
             logging.info(f"Saving exported data into feature store file path: {feature_store_file_path}")
-            dataframe.to_csv(feature_store_file_path, index=False, header=True)
+            write_dataframe(feature_store_file_path, dataframe)
             return dataframe
 
         except Exception as e:
             raise final_except(e, sys)
 
+    def export_feature_store(self) -> int:
+        """
+        Method Name :   export_feature_store
+        Description :   This method exports data from mongodb to the feature store file without keeping it in memory,
+                        unless neither incremental nor streaming_export is set
+
+        Output      :   number of rows in the feature store
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            if self.data_ingestion_config.incremental:
+                return self.export_incremental_into_feature_store()
+            if self.data_ingestion_config.streaming_export:
+                return self.stream_data_into_feature_store()
+            return len(self.export_data_into_feature_store())
+
+        except Exception as e:
+            raise final_except(e, sys)
+
+    @staticmethod
+    def get_split_hashes(keys: pd.Series) -> np.ndarray:
+        """
+        Returns a stable uint64 hash per key, the same for a key whatever its dtype, chunk or run
+        """
+        return pd.util.hash_pandas_object(keys.astype(str), index=False).to_numpy()
+
+    def get_stratified_split_thresholds(self) -> Dict[str, Optional[int]]:
+        """
+        Method Name :   get_stratified_split_thresholds
+        Description :   This method reads the key and stratify columns of the feature store and returns, per class,
+                        the largest hash that goes to the test set, so that train_test_split_ratio of every class
+                        goes to test. Only 8 bytes per row are kept in memory
+
+        Output      :   class label to hash threshold, None when no row of the class goes to test
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            config = self.data_ingestion_config
+            hashes_by_class = defaultdict(list)
+            for chunk in iter_dataframe_chunks(config.feature_store_file_path, config.export_batch_size,
+                                               columns=[config.key_column, config.split_stratify_column]):
+                hashes = self.get_split_hashes(chunk[config.key_column])
+                labels = chunk[config.split_stratify_column].astype(str).to_numpy()
+                for label in np.unique(labels):
+                    hashes_by_class[label].append(hashes[labels == label])
+
+            thresholds = {}
+            for label, hashes in hashes_by_class.items():
+                hashes = np.sort(np.concatenate(hashes))
+                n_test = int(round(len(hashes) * config.train_test_split_ratio))
+                thresholds[label] = int(hashes[n_test - 1]) if n_test > 0 else None
+            return thresholds
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def split_feature_store_by_hash(self) -> Tuple[int, int]:
+        """
+        Method Name :   split_feature_store_by_hash
+        Description :   This method streams the feature store into the train and test files chunk by chunk, a row goes
+                        to test when the hash of its key_column is below train_test_split_ratio of the hash range,
+                        or, with split_stratify_column, below the threshold of its class. The split needs no seed,
+                        is the same on every run and never holds the dataset in memory
+
+        Output      :   (number of train rows, number of test rows)
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        logging.info("Entered split_feature_store_by_hash method of Data_Ingestion class")
+
+        try:
+            config = self.data_ingestion_config
+            thresholds = self.get_stratified_split_thresholds() if config.split_stratify_column else None
+            ratio_threshold = min(int(config.train_test_split_ratio * 2 ** 64), 2 ** 64 - 1)
+
+            with DataFrameChunkWriter(config.training_file_path, column_types=self.column_types) as train_writer, \
+                    DataFrameChunkWriter(config.testing_file_path, column_types=self.column_types) as test_writer:
+                for chunk in iter_dataframe_chunks(config.feature_store_file_path, config.export_batch_size):
+                    hashes = self.get_split_hashes(chunk[config.key_column])
+                    if thresholds is None:
+                        is_test = hashes < np.uint64(ratio_threshold)
+                    else:
+                        labels = chunk[config.split_stratify_column].astype(str).to_numpy()
+                        is_test = np.zeros(len(chunk), dtype=bool)
+                        for label, limit in thresholds.items():
+                            if limit is not None:
+                                is_test |= (labels == label) & (hashes <= np.uint64(limit))
+                    train_writer.write(chunk[~is_test])
+                    test_writer.write(chunk[is_test])
+
+            logging.info(f"Split feature store into {train_writer.n_rows} train rows and {test_writer.n_rows} test rows")
+            return train_writer.n_rows, test_writer.n_rows
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
     def split_data_as_train_test(self, dataframe: DataFrame) -> None:
         """
         Method Name :   split_data_as_train_test
@@ -56,7 +343,8 @@ class DataIngestion:
             if dataframe.empty:
                 raise ValueError("The dataframe is empty. Please check the data loading process.")
             
-            train_set, test_set = train_test_split(dataframe, test_size=self.data_ingestion_config.train_test_split_ratio)
+            train_set, test_set = train_test_split(dataframe, test_size=self.data_ingestion_config.train_test_split_ratio,
+                                                 random_state=self.data_ingestion_config.split_random_state)
             logging.info("Performed train test split on the dataframe")
             logging.info("Exited split_data_as_train_test method of Data_Ingestion class")
             
@@ -64,8 +352,13 @@ class DataIngestion:
             os.makedirs(dir_path, exist_ok=True)
             
             logging.info(f"Exporting train and test file path.")
-            train_set.to_csv(self.data_ingestion_config.training_file_path, index=False, header=True)
-            test_set.to_csv(self.data_ingestion_config.testing_file_path, index=False, header=True)
+            for file_path, dataframe in ((self.data_ingestion_config.training_file_path, train_set),
+                                         (self.data_ingestion_config.testing_file_path, test_set)):
+                if self.artifact_store is not None:
+                    # kept as the next stages would read the file back
+                    self.artifact_store.put(file_path, dataframe.reset_index(drop=True), writer=write_dataframe)
+                else:
+                    write_dataframe(file_path, dataframe)
 
             logging.info(f"Exported train and test file path.")
         except Exception as e:
@@ -82,20 +375,31 @@ class DataIngestion:
         logging.info("Entered initiate_data_ingestion method of Data_Ingestion class")
 
         try:
-            dataframe = self.export_data_into_feature_store()
-            logging.info("Got the data from mongodb")
-            
-            if dataframe.empty:
-                raise ValueError("The dataframe fetched from MongoDB is empty. Please check the data loading process.")
-            
-            self.split_data_as_train_test(dataframe)
+            if self.data_ingestion_config.split_mode == "hash":
+                if self.export_feature_store() == 0:
+                    raise ValueError("The data fetched from MongoDB is empty. Please check the data loading process.")
+                logging.info("Got the data from mongodb")
+
+                self.split_feature_store_by_hash()
+            else:
+                dataframe = self.export_data_into_feature_store()
+                logging.info("Got the data from mongodb")
+
+                if dataframe.empty:
+                    raise ValueError("The dataframe fetched from MongoDB is empty. Please check the data loading process.")
+
+                self.split_data_as_train_test(dataframe)
             logging.info("Performed train test split on the dataset")
 
             logging.info("Exited initiate_data_ingestion method of Data_Ingestion class")
 
+            if self.non_numeric_values:
+                logging.warning(f"Values that are not numbers were exported as missing: {dict(self.non_numeric_values)}")
+
             data_ingestion_artifact = DataIngestionArtifact(
                 trained_file_path=self.data_ingestion_config.training_file_path,
-                test_file_path=self.data_ingestion_config.testing_file_path
+                test_file_path=self.data_ingestion_config.testing_file_path,
+                non_numeric_values=dict(self.non_numeric_values)
             )
             
             logging.info(f"Data ingestion artifact: {data_ingestion_artifact}")
@@ -1,8 +1,8 @@
 import sys
+from typing import Dict, List, Optional
 
 import numpy as np
 import pandas as pd
-from imblearn.combine import SMOTEENN
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler, OneHotEncoder, OrdinalEncoder, PowerTransformer
 from sklearn.compose import ColumnTransformer
@@ -12,32 +12,55 @@ from Primary_Folder.entity.config_entity import DataTransformationConfig
 from Primary_Folder.entity.artifact_entity import DataTransformationArtifact, DataIngestionArtifact, DataValidationArtifact
 from Primary_Folder.exceptions import final_except
 from Primary_Folder.logger import logging
-from Primary_Folder.utils.main import save_object, save_numpy_array_data, read_yaml_file, drop_columns
+from Primary_Folder.utils.main import save_object, save_numpy_array_data, read_yaml_file, drop_columns, \
+    get_schema_column_types, read_dataframe
 from Primary_Folder.entity.estimator import TargetValueMapping
+from Primary_Folder.entity.compiled_preprocessor import CompiledPreprocessor
+from Primary_Folder.pipline.artifact_store import ArtifactStore
 
 class DataTransformation:
     def __init__(self, data_ingestion_artifact: DataIngestionArtifact,
                  data_transformation_config: DataTransformationConfig,
-                 data_validation_artifact: DataValidationArtifact):
+                 data_validation_artifact: DataValidationArtifact, artifact_store: Optional[ArtifactStore] = None):
         """
         :param data_ingestion_artifact: Output reference of data ingestion artifact stage
         :param data_transformation_config: configuration for data transformation
+        :param artifact_store: Optional store handing the input frames and the outputs between stages in memory
         """
         try:
             self.data_ingestion_artifact = data_ingestion_artifact
             self.data_transformation_config = data_transformation_config
             self.data_validation_artifact = data_validation_artifact
+            self.artifact_store = artifact_store
             self._schema_config = read_yaml_file(file_path=SCHEMA_FILE_PATH)
         except Exception as e:
             raise final_except(e, sys)
 
     @staticmethod
-    def read_data(file_path) -> pd.DataFrame:
+    def read_data(file_path, columns: Optional[List[str]] = None,
+                  column_types: Optional[Dict[str, str]] = None) -> pd.DataFrame:
         try:
-            return pd.read_csv(file_path)
+            return read_dataframe(file_path, columns=columns, column_types=column_types)
         except Exception as e:
             raise final_except(e, sys)
 
+    def read_stage_input(self, file_path, columns: List[str], column_types: Dict[str, str]) -> pd.DataFrame:
+        """
+        Method Name :   read_stage_input
+        Description :   This method reads columns of a dataframe, from the artifact store when there is one, where
+                        the whole typed frame is shared with the other stages
+
+        Output      :   Dataframe of columns
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            if self.artifact_store is not None:
+                return self.artifact_store.get(file_path, loader=lambda file_path: DataTransformation.read_data(
+                    file_path, column_types=column_types))[columns]
+            return DataTransformation.read_data(file_path, columns=columns, column_types=column_types)
+        except Exception as e:
+            raise final_except(e, sys) from e
+
     
     def get_data_transformer_object(self) -> Pipeline:
         """
@@ -103,8 +126,14 @@ class DataTransformation:
                 preprocessor = self.get_data_transformer_object()
                 logging.info("Got the preprocessor object")
 
-                train_df = DataTransformation.read_data(file_path=self.data_ingestion_artifact.trained_file_path)
-                test_df = DataTransformation.read_data(file_path=self.data_ingestion_artifact.test_file_path)
+                # drop columns are not read at all, except yr_of_estab which company_age is derived from
+                column_types = get_schema_column_types(self._schema_config)
+                columns = [column for column in column_types
+                           if column not in self._schema_config['drop_columns'] or column == 'yr_of_estab']
+                train_df = self.read_stage_input(self.data_ingestion_artifact.trained_file_path,
+                                                 columns=columns, column_types=column_types)
+                test_df = self.read_stage_input(self.data_ingestion_artifact.test_file_path,
+                                                columns=columns, column_types=column_types)
 
                 input_feature_train_df = train_df.drop(columns=[TARGET_COLUMN], axis=1)
                 target_feature_train_df = train_df[TARGET_COLUMN]
@@ -115,15 +144,16 @@ class DataTransformation:
 
                 logging.info("Added company_age column to the Training dataset")
 
-                drop_cols = self._schema_config['drop_columns']
+                drop_cols = [column for column in self._schema_config['drop_columns'] if column in columns]
 
                 logging.info("drop the columns in drop_cols of Training dataset")
 
                 input_feature_train_df = drop_columns(df=input_feature_train_df, cols = drop_cols)
                 
-                target_feature_train_df = target_feature_train_df.replace(
+                # case_status is categorical, replace would keep that dtype: map its labels to int explicitly
+                target_feature_train_df = target_feature_train_df.astype(str).map(
                     TargetValueMapping()._asdict()
-                )
+                ).astype(int)
 
 
                 input_feature_test_df = test_df.drop(columns=[TARGET_COLUMN], axis=1)
@@ -139,9 +169,9 @@ class DataTransformation:
 
                 logging.info("drop the columns in drop_cols of Test dataset")
 
-                target_feature_test_df = target_feature_test_df.replace(
+                target_feature_test_df = target_feature_test_df.astype(str).map(
                 TargetValueMapping()._asdict()
-                )
+                ).astype(int)
 
                 logging.info("Got train features and test features of Testing dataset")
 
@@ -159,6 +189,12 @@ class DataTransformation:
 
                 logging.info("Used the preprocessor object to transform the test features")
 
+                CompiledPreprocessor.compile(preprocessor).verify(preprocessor, input_feature_test_df)
+
+                logging.info("Checked the compiled preprocessor against the test features")
+
+                from imblearn.combine import SMOTEENN
+
                 logging.info("Applying SMOTEENN on Training dataset")
 
                 smt = SMOTEENN(sampling_strategy="minority")
@@ -187,9 +223,18 @@ class DataTransformation:
                     input_feature_test_final, np.array(target_feature_test_final)
                 ]
 
-                save_object(self.data_transformation_config.transformed_object_file_path, preprocessor)
-                save_numpy_array_data(self.data_transformation_config.transformed_train_file_path, array=train_arr)
-                save_numpy_array_data(self.data_transformation_config.transformed_test_file_path, array=test_arr)
+                if self.artifact_store is not None:
+                    # the trainer takes them from memory, the files are written in the background
+                    self.artifact_store.put(self.data_transformation_config.transformed_object_file_path,
+                                            preprocessor, writer=save_object)
+                    self.artifact_store.put(self.data_transformation_config.transformed_train_file_path,
+                                            train_arr, writer=save_numpy_array_data)
+                    self.artifact_store.put(self.data_transformation_config.transformed_test_file_path,
+                                            test_arr, writer=save_numpy_array_data)
+                else:
+                    save_object(self.data_transformation_config.transformed_object_file_path, preprocessor)
+                    save_numpy_array_data(self.data_transformation_config.transformed_train_file_path, array=train_arr)
+                    save_numpy_array_data(self.data_transformation_config.transformed_test_file_path, array=test_arr)
 
                 logging.info("Saved the preprocessor object")
 
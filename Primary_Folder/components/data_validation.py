@@ -1,29 +1,36 @@
 import json
+import os
 import sys
+from typing import Dict, List, Optional
 
 import pandas as pd
-from evidently.model_profile import Profile
-from evidently.model_profile.sections import DataDriftProfileSection
 
 from pandas import DataFrame
 
 from Primary_Folder.exceptions import final_except
 from Primary_Folder.logger import logging
-from Primary_Folder.utils.main import read_yaml_file, write_yaml_file
+from Primary_Folder.utils.main import (get_schema_column_types, read_dataframe, read_dataframe_sample,
+                                       read_file_schema, read_yaml_file)
 from Primary_Folder.entity.artifact_entity import DataIngestionArtifact, DataValidationArtifact
 from Primary_Folder.entity.config_entity import DataValidationConfig
+from Primary_Folder.entity.drift_engine import DriftEngine
+from Primary_Folder.entity.drift_sketch import DatasetSketch
+from Primary_Folder.pipline.artifact_store import ArtifactStore
 from Primary_Folder.constants import SCHEMA_FILE_PATH
 
 
 class DataValidation:
-    def __init__(self, data_ingestion_artifact: DataIngestionArtifact, data_validation_config: DataValidationConfig):
+    def __init__(self, data_ingestion_artifact: DataIngestionArtifact, data_validation_config: DataValidationConfig,
+                 artifact_store: Optional[ArtifactStore] = None):
         """
         :param data_ingestion_artifact: Output reference of data ingestion artifact stage
         :param data_validation_config: configuration for data validation
+        :param artifact_store: Optional store sharing the train and test sets with the other stages in memory
         """
         try:
             self.data_ingestion_artifact = data_ingestion_artifact
             self.data_validation_config = data_validation_config
+            self.artifact_store = artifact_store
             self._schema_config =read_yaml_file(file_path=SCHEMA_FILE_PATH)
         except Exception as e:
             raise final_except(e,sys)
@@ -75,21 +82,141 @@ class DataValidation:
             raise final_except(e, sys) from e
 
     @staticmethod
-    def read_data(file_path) -> DataFrame:
+    def read_data(file_path, column_types: Optional[Dict[str, str]] = None) -> DataFrame:
         try:
-            return pd.read_csv(file_path)
+            return read_dataframe(file_path, column_types=column_types)
         except Exception as e:
             raise final_except(e, sys)
 
+    def read_stage_input(self, file_path, column_types: Dict[str, str]) -> DataFrame:
+        """
+        Method Name :   read_stage_input
+        Description :   This method reads a whole typed dataframe, shared through the artifact store when there is one
+
+        Output      :   Dataframe with the columns of column_types cast
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            if self.artifact_store is not None:
+                return self.artifact_store.get(file_path, loader=lambda file_path: DataValidation.read_data(
+                    file_path, column_types=column_types))
+            return DataValidation.read_data(file_path, column_types=column_types)
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    @staticmethod
+    def read_sample(file_path, n_rows: int, n_parts: int) -> DataFrame:
+        """
+        Method Name :   read_sample
+        Description :   This method reads the header and about n_rows rows of a file, as stored, spread over
+                        n_parts row groups from its start to its end. CSV files give their first n_rows rows only
+
+        Output      :   Dataframe of about n_rows rows with the columns of the file
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            return read_dataframe_sample(file_path, n_rows=n_rows, n_parts=n_parts)
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def validate_sample_values(self, dataframe: DataFrame) -> List[str]:
+        """
+        Method Name :   validate_sample_values
+        Description :   This method validates the values of a sample against the declared types of the schema
+                        columns and the categorical_domains, missing values aside
+
+        Output      :   One message per invalid column, empty when the sample is valid
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            errors = []
+            domains = self._schema_config.get("categorical_domains", {})
+            for column, column_type in get_schema_column_types(self._schema_config).items():
+                if column not in dataframe.columns:
+                    continue
+                values = dataframe[column].dropna()
+                if column_type in ("int", "float"):
+                    invalid = values[pd.to_numeric(values, errors="coerce").isna()]
+                    expected = "numbers"
+                elif column in domains:
+                    invalid = values[~values.isin(domains[column])]
+                    expected = f"one of {domains[column]}"
+                else:
+                    continue
+                if len(invalid):
+                    errors.append(f"{column}: {len(invalid)}/{len(values)} sampled values are not {expected}, "
+                                  f"e.g. {invalid.iloc[0]!r}")
+            return errors
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def validate_file_types(self, file_path: str) -> List[str]:
+        """
+        Method Name :   validate_file_types
+        Description :   This method checks the types stored in a Parquet or Arrow IPC file: the int and float
+                        columns of the schema must be stored as numbers. CSV files store no types
+
+        Output      :   One message per column stored with another type, empty when the types are valid
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            import pyarrow as pa
+
+            file_schema = read_file_schema(file_path)
+            if file_schema is None:
+                return []
+            errors = []
+            for column, column_type in get_schema_column_types(self._schema_config).items():
+                if column_type not in ("int", "float") or column not in file_schema.names:
+                    continue
+                stored_type = file_schema.field(column).type
+                if not (pa.types.is_integer(stored_type) or pa.types.is_floating(stored_type)
+                        or pa.types.is_null(stored_type)):
+                    errors.append(f"{column}: stored as {stored_type}, not as numbers")
+            return errors
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def get_drift_engine(self) -> DriftEngine:
+        return DriftEngine(column_types=get_schema_column_types(self._schema_config),
+                           numeric_test=self.data_validation_config.drift_numeric_test,
+                           categorical_test=self.data_validation_config.drift_categorical_test,
+                           max_workers=self.data_validation_config.drift_max_workers)
+
+    def write_drift_report(self, report: dict) -> None:
+        """
+        Method Name :   write_drift_report
+        Description :   This method writes the drift report as compact JSON, much faster than YAML on large reports
+
+        Output      :   None
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        drift_report_file_path = self.data_validation_config.drift_report_file_path
+        os.makedirs(os.path.dirname(drift_report_file_path), exist_ok=True)
+        with open(drift_report_file_path, "w") as report_file:
+            json.dump(report, report_file, separators=(",", ":"), default=str)
+
     def detect_dataset_drift(self, reference_df: DataFrame, current_df: DataFrame, ) -> bool:
         """
         Method Name :   detect_dataset_drift
-        Description :   This method validates if drift is detected
+        Description :   This method validates if drift is detected, with the numpy DriftEngine or the evidently
+                        data drift profile depending on drift_engine, and writes the drift report as JSON
         
         Output      :   Returns bool value based on validation results
         On Failure  :   Write an exception log and then raise an exception
         """
         try:
+            if self.data_validation_config.drift_engine == "numpy":
+                report = self.get_drift_engine().run(reference_df, current_df)
+                self.write_drift_report(report)
+                n_features, n_drifted_features = report["n_features"], report["n_drifted_features"]
+                logging.info(f"{n_drifted_features}/{n_features} drift detected.")
+                return report["dataset_drift"]
+
+            # the drift stack is heavy and only needed here, so it is imported on first use
+            from evidently.model_profile import Profile
+            from evidently.model_profile.sections import DataDriftProfileSection
+
             data_drift_profile = Profile(sections=[DataDriftProfileSection()])
 
             data_drift_profile.calculate(reference_df, current_df)
@@ -97,7 +224,7 @@ class DataValidation:
             report = data_drift_profile.json()
             json_report = json.loads(report)
 
-            write_yaml_file(file_path=self.data_validation_config.drift_report_file_path, content=json_report)
+            self.write_drift_report(json_report)
 
             n_features = json_report["data_drift"]["data"]["metrics"]["n_features"]
             n_drifted_features = json_report["data_drift"]["data"]["metrics"]["n_drifted_features"]
@@ -108,6 +235,36 @@ class DataValidation:
         except Exception as e:
             raise final_except(e, sys) from e
 
+    def detect_dataset_drift_from_sketches(self, reference_file_path: str, current_file_path: str) -> bool:
+        """
+        Method Name :   detect_dataset_drift_from_sketches
+        Description :   This method validates if drift is detected from DatasetSketch summaries of the two files,
+                        built in one streaming pass each with chunks sketched in parallel, so memory does not grow
+                        with the row count. The drift report is written as JSON
+
+        Output      :   Returns bool value based on validation results
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            config = self.data_validation_config
+            column_types = get_schema_column_types(self._schema_config)
+            reference_sketch, current_sketch = (
+                DatasetSketch.from_file(file_path, column_types, chunk_size=config.sketch_chunk_size,
+                                        max_workers=config.drift_max_workers,
+                                        relative_accuracy=config.sketch_relative_accuracy,
+                                        max_categories=config.sketch_max_categories,
+                                        n_hash_buckets=config.sketch_hash_buckets)
+                for file_path in (reference_file_path, current_file_path))
+
+            report = self.get_drift_engine().run_sketches(reference_sketch, current_sketch)
+            report.update({"mode": "sketch", "n_reference_rows": reference_sketch.n_rows,
+                           "n_current_rows": current_sketch.n_rows})
+            self.write_drift_report(report)
+            logging.info(f"{report['n_drifted_features']}/{report['n_features']} drift detected.")
+            return report["dataset_drift"]
+        except Exception as e:
+            raise final_except(e, sys) from e
+
     def initiate_data_validation(self) -> DataValidationArtifact:
         """
         Method Name :   initiate_data_validation
@@ -120,8 +277,19 @@ class DataValidation:
         try:
             validation_error_msg = ""
             logging.info("Starting data validation")
-            train_df, test_df = (DataValidation.read_data(file_path=self.data_ingestion_artifact.trained_file_path),
-                                 DataValidation.read_data(file_path=self.data_ingestion_artifact.test_file_path))
+            column_types = get_schema_column_types(self._schema_config)
+            file_paths = [self.data_ingestion_artifact.trained_file_path, self.data_ingestion_artifact.test_file_path]
+            if self.artifact_store is not None:
+                # the sample and the sketches are read from the files as stored
+                self.artifact_store.wait(file_paths)
+            # structural checks on the header and a sample, so a malformed export fails before any full load
+            train_df, test_df = (
+                DataValidation.read_sample(self.data_ingestion_artifact.trained_file_path,
+                                           n_rows=self.data_validation_config.sample_rows,
+                                           n_parts=self.data_validation_config.sample_parts),
+                DataValidation.read_sample(self.data_ingestion_artifact.test_file_path,
+                                           n_rows=self.data_validation_config.sample_rows,
+                                           n_parts=self.data_validation_config.sample_parts))
 
             status = self.validate_number_of_columns(dataframe=train_df)
             logging.info(f"All required columns present in training dataframe: {status}")
@@ -142,10 +310,26 @@ class DataValidation:
             if not status:
                 validation_error_msg += f"columns are missing in test dataframe."
 
+            for name, file_path, dataframe in (("training", file_paths[0], train_df), ("test", file_paths[1], test_df)):
+                value_errors = self.validate_file_types(file_path) + self.validate_sample_values(dataframe)
+                if value_errors:
+                    validation_error_msg += f"Invalid values in {name} dataframe: {'; '.join(value_errors)}."
+
+            # the export turns values that are not numbers into missing ones, so no sample of the files shows them
+            non_numeric_values = self.data_ingestion_artifact.non_numeric_values
+            if non_numeric_values:
+                validation_error_msg += ("Values exported from mongodb are not numbers: " +
+                                         "; ".join(f"{column}: {n_values}" for column, n_values in non_numeric_values.items()) + ".")
+
             validation_status = len(validation_error_msg) == 0
 
             if validation_status:
-                drift_status = self.detect_dataset_drift(train_df, test_df)
+                if self.data_validation_config.drift_mode == "sketch":
+                    drift_status = self.detect_dataset_drift_from_sketches(
+                        self.data_ingestion_artifact.trained_file_path, self.data_ingestion_artifact.test_file_path)
+                else:
+                    train_df, test_df = (self.read_stage_input(file_path, column_types) for file_path in file_paths)
+                    drift_status = self.detect_dataset_drift(train_df, test_df)
                 if drift_status:
                     logging.info(f"Drift detected.")
                     validation_error_msg = "Drift detected"
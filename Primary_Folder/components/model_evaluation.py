@@ -2,7 +2,7 @@ from Primary_Folder.entity.config_entity import ModelEvaluationConfig
 from Primary_Folder.entity.artifact_entity import ModelTrainerArtifact, DataIngestionArtifact, ModelEvaluationArtifact
 from sklearn.metrics import f1_score
 from Primary_Folder.exceptions import final_except
-from Primary_Folder.constants import TARGET_COLUMN, CURRENT_YEAR
+from Primary_Folder.constants import TARGET_COLUMN, CURRENT_YEAR, SCHEMA_FILE_PATH
 from Primary_Folder.logger import logging
 import sys
 import pandas as pd
@@ -11,6 +11,8 @@ from Primary_Folder.entity.s3_estimator import USvisaEstimator
 from dataclasses import dataclass
 from Primary_Folder.entity.estimator import USvisaModel
 from Primary_Folder.entity.estimator import TargetValueMapping
+from Primary_Folder.pipline.artifact_store import ArtifactStore
+from Primary_Folder.utils.main import get_schema_column_types, read_dataframe, read_yaml_file
 
 @dataclass
 class EvaluateModelResponse:
@@ -23,11 +25,12 @@ class EvaluateModelResponse:
 class ModelEvaluation:
 
     def __init__(self, model_eval_config: ModelEvaluationConfig, data_ingestion_artifact: DataIngestionArtifact,
-                 model_trainer_artifact: ModelTrainerArtifact):
+                 model_trainer_artifact: ModelTrainerArtifact, artifact_store: Optional[ArtifactStore] = None):
         try:
             self.model_eval_config = model_eval_config
             self.data_ingestion_artifact = data_ingestion_artifact
             self.model_trainer_artifact = model_trainer_artifact
+            self.artifact_store = artifact_store
         except Exception as e:
             raise final_except(e, sys) from e
 
@@ -61,13 +64,19 @@ class ModelEvaluation:
         On Failure  :   Write an exception log and then raise an exception
         """
         try:
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
-            test_df['company_age'] = CURRENT_YEAR-test_df['yr_of_estab']
+            column_types = get_schema_column_types(read_yaml_file(file_path=SCHEMA_FILE_PATH))
+            loader = lambda file_path: read_dataframe(file_path, column_types=column_types)
+            test_file_path = self.data_ingestion_artifact.test_file_path
+            test_df = (self.artifact_store.get(test_file_path, loader=loader) if self.artifact_store is not None
+                       else loader(test_file_path))
+            # assign returns a new frame, the one of the artifact store is shared
+            test_df = test_df.assign(company_age=CURRENT_YEAR-test_df['yr_of_estab'])
 
             x, y = test_df.drop(TARGET_COLUMN, axis=1), test_df[TARGET_COLUMN]
-            y = y.replace(
+            # case_status is categorical, map its labels to int explicitly
+            y = y.astype(str).map(
                 TargetValueMapping()._asdict()
-            )
+            ).astype(int)
 
             # trained_model = load_object(file_path=self.model_trainer_artifact.trained_model_file_path)
             trained_model_f1_score = self.model_trainer_artifact.metric_artifact.f1_score
@@ -1,29 +1,44 @@
 import sys
-from typing import Tuple
+from typing import Optional, Tuple
 
 import numpy as np
 import pandas as pd
 from pandas import DataFrame
 from sklearn.pipeline import Pipeline
 from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
-from neuro_mf  import ModelFactory
 
 from Primary_Folder.exceptions import final_except
 from Primary_Folder.logger import logging
-from Primary_Folder.utils.main import load_numpy_array_data, read_yaml_file, load_object, save_object
+from Primary_Folder.utils.main import load_numpy_array_data, read_yaml_file, load_object, save_object, \
+    save_mmap_object, mmap_artifact_path
 from Primary_Folder.entity.config_entity import ModelTrainerConfig
 from Primary_Folder.entity.artifact_entity import DataTransformationArtifact, ModelTrainerArtifact, ClassificationMetricArtifact
 from Primary_Folder.entity.estimator import USvisaModel
+from Primary_Folder.pipline.artifact_store import ArtifactStore
 
 class ModelTrainer:
     def __init__(self, data_transformation_artifact: DataTransformationArtifact,
-                 model_trainer_config: ModelTrainerConfig):
+                 model_trainer_config: ModelTrainerConfig, artifact_store: Optional[ArtifactStore] = None):
         """
         :param data_ingestion_artifact: Output reference of data ingestion artifact stage
         :param data_transformation_config: Configuration for data transformation
+        :param artifact_store: Optional store holding the transformed arrays and preprocessor in memory
         """
         self.data_transformation_artifact = data_transformation_artifact
         self.model_trainer_config = model_trainer_config
+        self.artifact_store = artifact_store
+
+    def load_stage_input(self, file_path: str, loader) -> object:
+        """
+        Method Name :   load_stage_input
+        Description :   This method loads an output of data transformation, from the artifact store when there is one
+
+        Output      :   Loaded object
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        if self.artifact_store is not None:
+            return self.artifact_store.get(file_path, loader=loader)
+        return loader(file_path)
 
     def get_model_object_and_report(self, train: np.array, test: np.array) -> Tuple[object, object]:
         """
@@ -34,6 +49,8 @@ class ModelTrainer:
         On Failure  :   Write an exception log and then raise an exception
         """
         try:
+            from neuro_mf import ModelFactory
+
             logging.info("Using neuro_mf to get best model object and report")
             model_factory = ModelFactory(model_config_path=self.model_trainer_config.model_config_file_path)
             
@@ -68,12 +85,15 @@ class ModelTrainer:
         On Failure  :   Write an exception log and then raise an exception
         """
         try:
-            train_arr = load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_train_file_path)
-            test_arr = load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_test_file_path)
+            train_arr = self.load_stage_input(self.data_transformation_artifact.transformed_train_file_path,
+                                              loader=load_numpy_array_data)
+            test_arr = self.load_stage_input(self.data_transformation_artifact.transformed_test_file_path,
+                                             loader=load_numpy_array_data)
             
             best_model_detail ,metric_artifact = self.get_model_object_and_report(train=train_arr, test=test_arr)
             
-            preprocessing_obj = load_object(file_path=self.data_transformation_artifact.transformed_object_file_path)
+            preprocessing_obj = self.load_stage_input(self.data_transformation_artifact.transformed_object_file_path,
+                                                      loader=load_object)
 
 
             if best_model_detail.best_score < self.model_trainer_config.expected_accuracy:
@@ -83,8 +103,12 @@ class ModelTrainer:
             usvisa_model = USvisaModel(preprocessing_object=preprocessing_obj,
                                        trained_model_object=best_model_detail.best_model)
             logging.info("Created usvisa model object with preprocessor and model")
+            usvisa_model.compile_preprocessor()
+            logging.info("Compiled the preprocessor of usvisa model")
             logging.info("Created best model file path.")
             save_object(self.model_trainer_config.trained_model_file_path, usvisa_model)
+            save_mmap_object(mmap_artifact_path(self.model_trainer_config.trained_model_file_path), usvisa_model)
+            logging.info("Saved the memory-mappable copy of usvisa model")
 
             model_trainer_artifact = ModelTrainerArtifact(
                 trained_model_file_path=self.model_trainer_config.trained_model_file_path,
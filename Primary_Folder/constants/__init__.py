@@ -11,6 +11,11 @@ PIPELINE_NAME: str = "usvisa"
 ARTIFACT_DIR: str = "artifact"
 
 MODEL_FILE_NAME = "model.pkl"
+MODEL_MMAP_FILE_EXTENSION = ".mmap"
+MODEL_MMAP_MIN_ARRAY_BYTES: int = 64 * 1024
+MODEL_LOCAL_CACHE_DIR: str = "model_cache"
+# S3 metadata key holding the sha256 of the pushed model.pkl, on the model and on its memory-mappable artifact
+MODEL_DIGEST_METADATA_KEY: str = "model-sha256"
 
 TARGET_COLUMN = "case_status"
 CURRENT_YEAR = date.today().year
@@ -35,6 +40,23 @@ DATA_INGESTION_DIR_NAME: str = "data_ingestion"
 DATA_INGESTION_FEATURE_STORE_DIR: str = "feature_store"
 DATA_INGESTION_INGESTED_DIR: str = "ingested"
 DATA_INGESTION_TRAIN_TEST_SPLIT_RATIO: float = 0.2
+# hash: rows go to train or test by a hash of DATA_INGESTION_KEY_COLUMN, streamed chunk by chunk,
+# random: sklearn train_test_split of the whole dataframe
+DATA_INGESTION_SPLIT_MODE: str = "hash"
+DATA_INGESTION_SPLIT_STRATIFY_COLUMN: str = TARGET_COLUMN
+# fixed so unchanged data gives the same train/test files, and the stage cache can reuse later stages
+DATA_INGESTION_SPLIT_RANDOM_STATE: int = 42
+# file format of the feature store and train/test files: parquet, arrow or csv
+DATA_INGESTION_FILE_FORMAT: str = "parquet"
+DATA_INGESTION_STREAMING_EXPORT: bool = True
+DATA_INGESTION_EXPORT_BATCH_SIZE: int = 10000
+DATA_INGESTION_EXPORT_N_PARTITIONS: int = 1
+DATA_INGESTION_EXPORT_MAX_WORKERS: int = 4
+DATA_INGESTION_INCREMENTAL: bool = True
+DATA_INGESTION_SNAPSHOT_DIR: str = "data_ingestion_snapshot"
+DATA_INGESTION_WATERMARK_FILE_NAME: str = "watermark.json"
+DATA_INGESTION_WATERMARK_FIELD: str = "_id"
+DATA_INGESTION_KEY_COLUMN: str = "case_id"
 
 
 
@@ -43,7 +65,22 @@ Data Validation realted contant start with DATA_VALIDATION VAR NAME
 """
 DATA_VALIDATION_DIR_NAME: str = "data_validation"
 DATA_VALIDATION_DRIFT_REPORT_DIR: str = "drift_report"
-DATA_VALIDATION_DRIFT_REPORT_FILE_NAME: str = "report.yaml"
+DATA_VALIDATION_DRIFT_REPORT_FILE_NAME: str = "report.json"
+# numpy: in-house DriftEngine, evidently: evidently data drift profile
+DATA_VALIDATION_DRIFT_ENGINE: str = "numpy"
+DATA_VALIDATION_DRIFT_NUMERIC_TEST: str = "auto"
+DATA_VALIDATION_DRIFT_CATEGORICAL_TEST: str = "auto"
+DATA_VALIDATION_DRIFT_MAX_WORKERS: int = 4
+# rows read by the structural checks that run before any full load
+DATA_VALIDATION_SAMPLE_ROWS: int = 1000
+# row groups the sample is spread over, so the rows appended by an incremental export are checked too
+DATA_VALIDATION_SAMPLE_PARTS: int = 8
+# exact: drift tests on the full train and test frames, sketch: on DatasetSketch summaries built in one streaming pass
+DATA_VALIDATION_DRIFT_MODE: str = "exact"
+DATA_VALIDATION_SKETCH_CHUNK_SIZE: int = 100000
+DATA_VALIDATION_SKETCH_RELATIVE_ACCURACY: float = 0.005
+DATA_VALIDATION_SKETCH_MAX_CATEGORIES: int = 10000
+DATA_VALIDATION_SKETCH_HASH_BUCKETS: int = 4096
 
 
 
@@ -70,5 +107,84 @@ MODEL_BUCKET_NAME = "usvisa-model2024rsc"
 MODEL_PUSHER_S3_KEY = "model-registry"
 
 
+"""
+Prediction related constant start with PREDICTION VAR NAME
+"""
+PREDICTION_MODEL_RELOAD_INTERVAL_SECONDS: int = 60
+PREDICTION_BATCH_MAX_SIZE: int = 64
+PREDICTION_BATCH_MAX_WAIT_MS: float = 5.0
+PREDICTION_EXECUTOR_MAX_WORKERS: int = 4
+PREDICTION_EXECUTOR_MAX_QUEUE_SIZE: int = 256
+PREDICTION_EXECUTOR_USE_PROCESSES: bool = False
+PREDICTION_CACHE_ENABLED: bool = True
+PREDICTION_CACHE_MAX_SIZE: int = 10000
+PREDICTION_CACHE_TTL_SECONDS: float = 0
+PREDICTION_CSV_CHUNK_SIZE: int = 50000
+PREDICTION_COLUMN_NAME: str = "prediction"
+# validation errors of the rows bulk scoring rejected, empty for scored rows
+PREDICTION_ERROR_COLUMN_NAME: str = "prediction_error"
+PREDICTION_WARMUP_ROUNDS: int = 3
+PREDICTION_WARMUP_RETRY_INTERVAL_SECONDS: int = 30
+
+
+"""
+Collection scoring related constant start with COLLECTION_SCORING VAR NAME
+"""
+COLLECTION_SCORING_DIR_NAME: str = "collection_scoring"
+COLLECTION_SCORING_CHECKPOINT_DIR: str = "checkpoint"
+COLLECTION_SCORING_BATCH_SIZE: int = 5000
+COLLECTION_SCORING_N_PARTITIONS: int = 4
+COLLECTION_SCORING_MAX_WORKERS: int = 4
+COLLECTION_SCORING_MODEL_VERSION_FIELD: str = "model_version"
+
+
+"""
+Stage cache related constant start with STAGE_CACHE VAR NAME
+"""
+STAGE_CACHE_ENABLED: bool = True
+STAGE_CACHE_DIR_NAME: str = "stage_cache"
+STAGE_CACHE_MAX_SIZE_BYTES: int = 2 * 1024 ** 3
+
+
+
+"""
+Artifact store related constant start with ARTIFACT_STORE VAR NAME
+"""
+ARTIFACT_STORE_ENABLED: bool = True
+ARTIFACT_STORE_WRITE_WORKERS: int = 2
+
+
+"""
+Training job related constant start with TRAINING_JOB VAR NAME
+"""
+TRAINING_JOB_HISTORY_SIZE: int = 20
+TRAINING_JOB_DIR_NAME: str = "training_jobs"
+TRAINING_JOB_STORE_FILE_NAME: str = "jobs.json"
+TRAINING_JOB_RUN_LOCK_FILE_NAME: str = "training.lock"
+
+
+"""
+Logging related constant start with LOG VAR NAME
+"""
+LOG_MODE_ENV_KEY = "USVISA_LOG_MODE"
+LOG_LEVEL_ENV_KEY = "USVISA_LOG_LEVEL"
+LOG_LOGGER_LEVELS_ENV_KEY = "USVISA_LOG_LEVELS"
+LOG_SAMPLE_RATE_ENV_KEY = "USVISA_LOG_SAMPLE_RATE"
+LOG_RATE_LIMIT_ENV_KEY = "USVISA_LOG_RATE_LIMIT"
+LOG_SAMPLED_LOGGERS_ENV_KEY = "USVISA_LOG_SAMPLED_LOGGERS"
+LOG_QUEUE_MAX_SIZE_ENV_KEY = "USVISA_LOG_QUEUE_MAX_SIZE"
+LOG_DEFAULT_MODE: str = "sync"
+LOG_DEFAULT_LEVEL: str = "DEBUG"
+LOG_DEFAULT_QUEUE_MAX_SIZE: int = 10000
+# loggers of the per-request code, the only ones sampled and rate limited
+LOG_DEFAULT_SAMPLED_LOGGERS: str = ",".join([
+    "Primary_Folder.entity.estimator",
+    "Primary_Folder.entity.s3_estimator",
+    "Primary_Folder.pipline.prediction_pipeline",
+    "Primary_Folder.utils.main",
+    "Primary_Folder.cloud_storage.aws_storage",
+])
+
+
 APP_HOST = "0.0.0.0"
 APP_PORT = 8080
\ No newline at end of file
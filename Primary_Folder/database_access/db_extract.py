@@ -1,9 +1,12 @@
 from Primary_Folder.configuration.mongo_db_connection import MongoDBClient
 from Primary_Folder.constants import DATABASE_NAME
 from Primary_Folder.exceptions import final_except
+from Primary_Folder.utils.main import NON_NUMERIC_VALUES_ATTR, count_non_numeric_values
 import pandas as pd
+import queue
 import sys
-from typing import Optional
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
 import numpy as np
 import logging
 
@@ -23,6 +26,206 @@ class USvisaData:
             raise final_except(e, sys)
         
 
+    def get_collection(self, collection_name: str, database_name: Optional[str] = None):
+        """
+        Returns the pymongo collection collection_name of database_name (default database when None).
+        """
+        if database_name is None:
+            return self.mongo_client.database[collection_name]
+        return self.mongo_client.client[database_name][collection_name]
+
+    def get_id_partitions(self, collection_name: str, n_partitions: int,
+                          database_name: Optional[str] = None) -> List[Tuple[Optional[object], Optional[object]]]:
+        """
+        Splits the collection into n_partitions contiguous _id ranges of about the same size.
+        :param collection_name: Name of the collection to split.
+        :param n_partitions: Number of ranges wanted.
+        :param database_name: Name of the database (optional).
+        :return: list of (lower, upper) bounds, lower inclusive and upper exclusive, None meaning unbounded.
+        """
+        try:
+            collection = self.get_collection(collection_name, database_name)
+            if n_partitions <= 1:
+                return [(None, None)]
+
+            buckets = list(collection.aggregate([
+                {"$bucketAuto": {"groupBy": "$_id", "buckets": n_partitions}},
+            ], allowDiskUse=True))
+            if len(buckets) <= 1:
+                return [(None, None)]
+
+            boundaries = [bucket["_id"]["min"] for bucket in buckets[1:]]
+            partitions = list(zip([None] + boundaries, boundaries + [None]))
+            logging.info(f"Split collection {collection_name} into {len(partitions)} _id ranges")
+            return partitions
+        except Exception as e:
+            raise final_except(e, sys)
+
+    @staticmethod
+    def get_id_range_filter(lower: Optional[object] = None, upper: Optional[object] = None) -> dict:
+        """
+        Returns the query filter selecting lower <= _id < upper.
+        """
+        id_filter = {}
+        if lower is not None:
+            id_filter["$gte"] = lower
+        if upper is not None:
+            id_filter["$lt"] = upper
+        return {"_id": id_filter} if id_filter else {}
+
+    def get_max_value(self, collection_name: str, field: str, query: Optional[dict] = None,
+                      database_name: Optional[str] = None) -> Optional[object]:
+        """
+        Returns the largest value of field among the documents matching query, None when there are none.
+        :param collection_name: Name of the collection.
+        :param field: Field to look at, e.g. "_id" or an update timestamp.
+        :param query: Query filter (optional).
+        :param database_name: Name of the database (optional).
+        """
+        try:
+            collection = self.get_collection(collection_name, database_name)
+            filters = {field: {"$exists": True}}
+            if query:
+                filters = {"$and": [query, filters]}
+            for document in collection.find(filters, projection={field: 1}).sort(field, -1).limit(1):
+                return document[field]
+            return None
+        except Exception as e:
+            raise final_except(e, sys)
+
+    @staticmethod
+    def records_to_dataframe(records: List[dict], columns: List[str],
+                             column_types: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+        """
+        Converts one batch of documents into a dataframe with the given columns, "na" as NaN and
+        the int/float columns of column_types as numbers (nullable Int64 when every value is whole).
+        Values that are not numbers become NaN, their count per column is kept in df.attrs[NON_NUMERIC_VALUES_ATTR].
+        """
+        df = pd.DataFrame.from_records(records, columns=columns)
+        df.replace({"na": np.nan}, inplace=True)
+        non_numeric_values = count_non_numeric_values(df, column_types or {})
+        for column, column_type in (column_types or {}).items():
+            if column not in df.columns or column_type not in ("int", "float"):
+                continue
+            values = pd.to_numeric(df[column], errors="coerce")
+            if column_type == "int":
+                whole = values.dropna()
+                if (whole == np.floor(whole)).all():
+                    values = values.astype("Int64")
+            df[column] = values
+        df.attrs[NON_NUMERIC_VALUES_ATTR] = non_numeric_values
+        return df
+
+    def iter_collection_chunks(self, collection_name: str, batch_size: int, database_name: Optional[str] = None,
+                               query: Optional[dict] = None,
+                               column_types: Optional[Dict[str, str]] = None) -> Iterator[pd.DataFrame]:
+        """
+        Streams the collection as dataframes of at most batch_size rows, so only one batch of documents
+        is held in memory at a time. _id is excluded by the server, the columns of every chunk are
+        those of column_types followed by the other fields of the first document, in that order.
+        :param collection_name: Name of the collection to export.
+        :param batch_size: Documents per cursor batch and rows per chunk.
+        :param database_name: Name of the database (optional).
+        :param query: Query filter of the documents to export (optional).
+        :param column_types: Column name to schema type ("int", "float", "category") (optional).
+        :return: iterator of pd.DataFrame chunks.
+        """
+        try:
+            collection = self.get_collection(collection_name, database_name)
+            cursor = collection.find(query or {}, projection={"_id": 0}).batch_size(batch_size)
+
+            columns, records, n_records = None, [], 0
+            for document in cursor:
+                if columns is None:
+                    columns = list(column_types or {}) + [field for field in document if field not in (column_types or {})]
+                records.append(document)
+                if len(records) >= batch_size:
+                    n_records += len(records)
+                    yield self.records_to_dataframe(records, columns, column_types)
+                    records = []
+            if records:
+                n_records += len(records)
+                yield self.records_to_dataframe(records, columns, column_types)
+            logging.info(f"Streamed {n_records} records from collection: {collection_name}")
+        except Exception as e:
+            raise final_except(e, sys)
+
+    def iter_collection_chunks_parallel(self, collection_name: str, batch_size: int, n_partitions: int,
+                                        max_workers: int, database_name: Optional[str] = None,
+                                        column_types: Optional[Dict[str, str]] = None) -> Iterator[pd.DataFrame]:
+        """
+        Streams the collection like iter_collection_chunks, but reads n_partitions _id ranges concurrently
+        with max_workers threads sharing the MongoDBClient connection pool. Chunks are yielded in arrival
+        order with the columns of the first chunk, at most 2 * max_workers chunks wait in memory.
+        :param collection_name: Name of the collection to export.
+        :param batch_size: Documents per cursor batch and rows per chunk.
+        :param n_partitions: Number of _id ranges read concurrently.
+        :param max_workers: Number of reader threads.
+        :param database_name: Name of the database (optional).
+        :param column_types: Column name to schema type ("int", "float", "category") (optional).
+        :return: iterator of pd.DataFrame chunks.
+        """
+        try:
+            partitions = queue.Queue()
+            for lower, upper in self.get_id_partitions(collection_name, n_partitions, database_name):
+                partitions.put(self.get_id_range_filter(lower, upper))
+            n_workers = max(1, min(max_workers, partitions.qsize()))
+            chunks = queue.Queue(maxsize=2 * n_workers)
+            stop = threading.Event()
+            done = object()
+
+            def put(item) -> bool:
+                # gives up when the consumer stopped, so no reader stays blocked on a full queue
+                while not stop.is_set():
+                    try:
+                        chunks.put(item, timeout=0.1)
+                        return True
+                    except queue.Full:
+                        continue
+                return False
+
+            def read_partitions() -> None:
+                try:
+                    while not stop.is_set():
+                        try:
+                            query = partitions.get_nowait()
+                        except queue.Empty:
+                            break
+                        for chunk in self.iter_collection_chunks(collection_name, batch_size, database_name,
+                                                                 query=query, column_types=column_types):
+                            if not put(chunk):
+                                return
+                except Exception as e:
+                    put(e)
+                finally:
+                    put(done)
+
+            workers = [threading.Thread(target=read_partitions, name=f"usvisa-export-{i}", daemon=True)
+                       for i in range(n_workers)]
+            for worker in workers:
+                worker.start()
+            logging.info(f"Reading {collection_name} with {n_workers} threads")
+
+            columns, n_done = None, 0
+            try:
+                while n_done < n_workers:
+                    item = chunks.get()
+                    if item is done:
+                        n_done += 1
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        # partitions can disagree on fields outside column_types, the first chunk decides
+                        if columns is None:
+                            columns = list(item.columns)
+                        yield item if list(item.columns) == columns else item.reindex(columns=columns)
+            finally:
+                stop.set()
+                for worker in workers:
+                    worker.join()
+        except Exception as e:
+            raise final_except(e, sys)
+
     def export_collection_as_dataframe(self, collection_name: str, database_name: Optional[str] = None) -> pd.DataFrame:
         """
         Exports the entire collection as a dataframe.
@@ -33,10 +236,7 @@ class USvisaData:
         try:
             logging.info(f"Exporting data from collection: {collection_name}")
 
-            if database_name is None:
-                collection = self.mongo_client.database[collection_name]
-            else:
-                collection = self.mongo_client[database_name][collection_name]
+            collection = self.get_collection(collection_name, database_name)
 
             # Fetch data from MongoDB
             data = list(collection.find())
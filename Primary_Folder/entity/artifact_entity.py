@@ -1,9 +1,12 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Dict
 
 @dataclass
 class DataIngestionArtifact:
     trained_file_path: str
     test_file_path: str
+    # per numeric column, the number of exported values that were not numbers and became missing
+    non_numeric_values: Dict[str, int] = field(default_factory=dict)
 
 @dataclass
 class DataValidationArtifact:
@@ -39,3 +42,12 @@ class ModelEvaluationArtifact:
 class ModelPusherArtifact:
     bucket_name: str
     s3_model_path: str
+
+@dataclass
+class CollectionScoringArtifact:
+    collection_name: str
+    model_version: str
+    n_scored_documents: int
+    # their _ids are listed in the partition checkpoints under checkpoint_dir
+    n_rejected_documents: int
+    checkpoint_dir: str
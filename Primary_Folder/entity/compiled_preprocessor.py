@@ -0,0 +1,220 @@
+import sys
+from typing import TYPE_CHECKING, Callable, Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+from pandas import DataFrame
+
+from Primary_Folder.exceptions import final_except
+from Primary_Folder.logger import logging
+
+if TYPE_CHECKING:
+    from sklearn.compose import ColumnTransformer
+
+
+class CompiledPreprocessor:
+    """
+    Class Name :   CompiledPreprocessor
+    Description :  This class flattens the fitted ColumnTransformer built by
+                   DataTransformation.get_data_transformer_object into lookup tables and coefficient arrays.
+                   Raw fields are encoded straight into the feature vector without building a DataFrame
+                   or going through sklearn's column dispatch. Output matches preprocessor.transform exactly,
+                   which verify() checks.
+
+    Output      :  Feature matrix with the same columns as the fitted preprocessor
+    On Failure  :  Write an exception log and then raise an exception
+    """
+
+    def __init__(self, one_hot_blocks: List[Tuple[str, int, Dict[object, int], bool]],
+                 ordinal_blocks: List[Tuple[str, int, Dict[object, float]]],
+                 numeric_blocks: List[Tuple[List[str], int, List[tuple]]],
+                 input_columns: List[str], n_features: int):
+        """
+        :param one_hot_blocks: (column, first output index, category -> output index, ignore unknown)
+        :param ordinal_blocks: (column, output index, category -> code)
+        :param numeric_blocks: (columns, first output index, list of numeric stages)
+        :param input_columns: Raw input columns, also the field order expected for tuple records
+        :param n_features: Width of the transformed feature matrix
+        """
+        self.one_hot_blocks = one_hot_blocks
+        self.ordinal_blocks = ordinal_blocks
+        self.numeric_blocks = numeric_blocks
+        self.input_columns = input_columns
+        self.n_features = n_features
+
+    @classmethod
+    def compile(cls, preprocessor: "ColumnTransformer") -> "CompiledPreprocessor":
+        """
+        Method Name :   compile
+        Description :   This method builds the lookup tables and coefficient arrays from a fitted preprocessor
+
+        Output      :   CompiledPreprocessor
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        # sklearn is only needed to compile, a compiled model predicts without importing it
+        from sklearn.pipeline import Pipeline
+        from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder
+
+        try:
+            one_hot_blocks, ordinal_blocks, numeric_blocks, input_columns = [], [], [], []
+            offset = 0
+
+            for name, transformer, columns in preprocessor.transformers_:
+                if (isinstance(transformer, str) and transformer == "drop") or len(columns) == 0:
+                    continue
+                if isinstance(transformer, str):
+                    raise ValueError(f"Transformer {name}: passthrough columns are not supported")
+                columns = list(columns)
+                input_columns.extend(column for column in columns if column not in input_columns)
+
+                if isinstance(transformer, OneHotEncoder):
+                    if transformer.drop_idx_ is not None:
+                        raise ValueError(f"Transformer {name}: OneHotEncoder with drop is not supported")
+                    if getattr(transformer, "_infrequent_enabled", False):
+                        raise ValueError(f"Transformer {name}: infrequent categories are not supported")
+                    ignore_unknown = transformer.handle_unknown != "error"
+                    for column, categories in zip(columns, transformer.categories_):
+                        lookup = {category: offset + position for position, category in enumerate(categories)}
+                        one_hot_blocks.append((column, offset, lookup, ignore_unknown))
+                        offset += len(categories)
+
+                elif isinstance(transformer, OrdinalEncoder):
+                    if transformer.handle_unknown != "error":
+                        raise ValueError(f"Transformer {name}: OrdinalEncoder must use handle_unknown='error'")
+                    for column, categories in zip(columns, transformer.categories_):
+                        lookup = {category: float(position) for position, category in enumerate(categories)}
+                        ordinal_blocks.append((column, offset, lookup))
+                        offset += 1
+
+                else:
+                    steps = transformer.steps if isinstance(transformer, Pipeline) else [(name, transformer)]
+                    stages = []
+                    for step_name, step in steps:
+                        stages.extend(cls._compile_numeric_step(step_name, step))
+                    numeric_blocks.append((columns, offset, stages))
+                    offset += len(columns)
+
+            logging.info(f"Compiled preprocessor into {offset} features")
+            return cls(one_hot_blocks=one_hot_blocks, ordinal_blocks=ordinal_blocks,
+                       numeric_blocks=numeric_blocks, input_columns=input_columns, n_features=offset)
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    @staticmethod
+    def _compile_numeric_step(step_name: str, step: object) -> List[tuple]:
+        from scipy import stats
+        from sklearn.preprocessing import PowerTransformer, StandardScaler
+
+        if isinstance(step, PowerTransformer):
+            if step.method != "yeo-johnson":
+                raise ValueError(f"Step {step_name}: only yeo-johnson PowerTransformer is supported")
+            # reuse the exact kernel the fitted transformer calls: sklearn's own method in older
+            # releases, scipy.stats.yeojohnson in newer ones, so results match bit for bit
+            kernel = getattr(step, "_yeo_johnson_transform", None) or stats.yeojohnson
+            stages = [("yeo-johnson", np.asarray(step.lambdas_, dtype=np.float64), kernel)]
+            if step.standardize:
+                stages.append(("scale", step._scaler.mean_, step._scaler.scale_))
+            return stages
+        if isinstance(step, StandardScaler):
+            return [("scale", step.mean_ if step.with_mean else None, step.scale_ if step.with_std else None)]
+        raise ValueError(f"Step {step_name}: {type(step).__name__} is not supported")
+
+    @staticmethod
+    def _yeo_johnson(x: np.ndarray, lambdas: np.ndarray, kernel: Callable) -> np.ndarray:
+        out = np.empty_like(x)
+        for i, lmbda in enumerate(lambdas):
+            with np.errstate(invalid="ignore"):
+                out[:, i] = kernel(x[:, i], lmbda)
+        return out
+
+    def _transform_columns(self, columns: Dict[str, Sequence], n_rows: int) -> np.ndarray:
+        features = np.zeros((n_rows, self.n_features), dtype=np.float64)
+
+        for column, offset, lookup, ignore_unknown in self.one_hot_blocks:
+            for row, value in enumerate(columns[column]):
+                position = lookup.get(value)
+                if position is not None:
+                    features[row, position] = 1.0
+                elif not ignore_unknown:
+                    raise ValueError(f"Found unknown categories [{value!r}] in column {column} during transform")
+
+        for column, offset, lookup in self.ordinal_blocks:
+            for row, value in enumerate(columns[column]):
+                code = lookup.get(value)
+                if code is None:
+                    raise ValueError(f"Found unknown categories [{value!r}] in column {column} during transform")
+                features[row, offset] = code
+
+        for block_columns, offset, stages in self.numeric_blocks:
+            x = np.column_stack([np.asarray(columns[column], dtype=np.float64) for column in block_columns])
+            for stage in stages:
+                if stage[0] == "yeo-johnson":
+                    x = self._yeo_johnson(x, stage[1], stage[2])
+                else:
+                    _, mean, scale = stage
+                    if mean is not None:
+                        x = x - mean
+                    if scale is not None:
+                        x = x / scale
+            features[:, offset:offset + len(block_columns)] = x
+
+        return features
+
+    def transform_record(self, record: Union[dict, tuple]) -> np.ndarray:
+        """
+        Method Name :   transform_record
+        Description :   This method encodes one raw record, a dict keyed by column or a tuple in input_columns order
+
+        Output      :   Feature matrix of shape (1, n_features)
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            if not isinstance(record, dict):
+                record = dict(zip(self.input_columns, record))
+            columns = {column: [value[0] if isinstance(value, list) else value]
+                       for column, value in record.items()}
+            return self._transform_columns(columns, n_rows=1)
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def transform(self, dataframe: DataFrame) -> np.ndarray:
+        """
+        Method Name :   transform
+        Description :   This method encodes every row of dataframe, like preprocessor.transform
+
+        Output      :   Feature matrix of shape (len(dataframe), n_features)
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            columns = {column: dataframe[column].to_numpy() for column in self.input_columns}
+            return self._transform_columns(columns, n_rows=len(dataframe))
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def verify(self, preprocessor: "ColumnTransformer", dataframe: DataFrame) -> None:
+        """
+        Method Name :   verify
+        Description :   This method checks that the compiled output equals preprocessor.transform on dataframe,
+                        both for the whole frame and for single records
+
+        Output      :   None, an exception is raised on any difference
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            expected = preprocessor.transform(dataframe)
+            if hasattr(expected, "toarray"):
+                expected = expected.toarray()
+            expected = np.asarray(expected, dtype=np.float64)
+
+            actual = self.transform(dataframe)
+            if actual.shape != expected.shape or not np.array_equal(actual, expected, equal_nan=True):
+                raise ValueError(f"Compiled preprocessor differs from sklearn output, max abs difference "
+                                 f"{np.nanmax(np.abs(actual - expected)) if actual.shape == expected.shape else actual.shape}")
+
+            for row, record in enumerate(dataframe[self.input_columns].head(100).to_dict(orient="records")):
+                if not np.array_equal(self.transform_record(record)[0], expected[row], equal_nan=True):
+                    raise ValueError(f"Compiled preprocessor differs from sklearn output on record {row}")
+
+            logging.info(f"Compiled preprocessor matches sklearn output on {len(dataframe)} rows")
+        except Exception as e:
+            raise final_except(e, sys) from e
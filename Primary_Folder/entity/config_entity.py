@@ -17,11 +17,30 @@ training_pipeline_config: TrainingPipelineConfig = TrainingPipelineConfig()
 @dataclass
 class DataIngestionConfig:
     data_ingestion_dir: str = os.path.join(training_pipeline_config.artifact_dir, DATA_INGESTION_DIR_NAME)
-    feature_store_file_path: str = os.path.join(data_ingestion_dir, DATA_INGESTION_FEATURE_STORE_DIR, FILE_NAME)
-    training_file_path: str = os.path.join(data_ingestion_dir, DATA_INGESTION_INGESTED_DIR, TRAIN_FILE_NAME)
-    testing_file_path: str = os.path.join(data_ingestion_dir, DATA_INGESTION_INGESTED_DIR, TEST_FILE_NAME)
+    feature_store_file_path: str = os.path.join(data_ingestion_dir, DATA_INGESTION_FEATURE_STORE_DIR,
+                                                FILE_NAME.replace("csv", DATA_INGESTION_FILE_FORMAT))
+    training_file_path: str = os.path.join(data_ingestion_dir, DATA_INGESTION_INGESTED_DIR,
+                                           TRAIN_FILE_NAME.replace("csv", DATA_INGESTION_FILE_FORMAT))
+    testing_file_path: str = os.path.join(data_ingestion_dir, DATA_INGESTION_INGESTED_DIR,
+                                          TEST_FILE_NAME.replace("csv", DATA_INGESTION_FILE_FORMAT))
     train_test_split_ratio: float = DATA_INGESTION_TRAIN_TEST_SPLIT_RATIO
+    split_mode: str = DATA_INGESTION_SPLIT_MODE
+    # empty for an unstratified hash split
+    split_stratify_column: str = DATA_INGESTION_SPLIT_STRATIFY_COLUMN
+    split_random_state: int = DATA_INGESTION_SPLIT_RANDOM_STATE
     collection_name:str = DATA_INGESTION_COLLECTION_NAME
+    streaming_export: bool = DATA_INGESTION_STREAMING_EXPORT
+    export_batch_size: int = DATA_INGESTION_EXPORT_BATCH_SIZE
+    export_n_partitions: int = DATA_INGESTION_EXPORT_N_PARTITIONS
+    export_max_workers: int = DATA_INGESTION_EXPORT_MAX_WORKERS
+    incremental: bool = DATA_INGESTION_INCREMENTAL
+    full_refresh: bool = False
+    # kept outside the timestamped artifact dir, so every run starts from the previous snapshot
+    snapshot_dir: str = os.path.join(ARTIFACT_DIR, DATA_INGESTION_SNAPSHOT_DIR)
+    snapshot_file_path: str = os.path.join(snapshot_dir, FILE_NAME)
+    watermark_file_path: str = os.path.join(snapshot_dir, DATA_INGESTION_WATERMARK_FILE_NAME)
+    watermark_field: str = DATA_INGESTION_WATERMARK_FIELD
+    key_column: str = DATA_INGESTION_KEY_COLUMN
 
 
 
@@ -30,6 +49,17 @@ class DataValidationConfig:
     data_validation_dir: str = os.path.join(training_pipeline_config.artifact_dir, DATA_VALIDATION_DIR_NAME)
     drift_report_file_path: str = os.path.join(data_validation_dir, DATA_VALIDATION_DRIFT_REPORT_DIR,
                                                DATA_VALIDATION_DRIFT_REPORT_FILE_NAME)
+    drift_engine: str = DATA_VALIDATION_DRIFT_ENGINE
+    drift_numeric_test: str = DATA_VALIDATION_DRIFT_NUMERIC_TEST
+    drift_categorical_test: str = DATA_VALIDATION_DRIFT_CATEGORICAL_TEST
+    drift_max_workers: int = DATA_VALIDATION_DRIFT_MAX_WORKERS
+    sample_rows: int = DATA_VALIDATION_SAMPLE_ROWS
+    sample_parts: int = DATA_VALIDATION_SAMPLE_PARTS
+    drift_mode: str = DATA_VALIDATION_DRIFT_MODE
+    sketch_chunk_size: int = DATA_VALIDATION_SKETCH_CHUNK_SIZE
+    sketch_relative_accuracy: float = DATA_VALIDATION_SKETCH_RELATIVE_ACCURACY
+    sketch_max_categories: int = DATA_VALIDATION_SKETCH_MAX_CATEGORIES
+    sketch_hash_buckets: int = DATA_VALIDATION_SKETCH_HASH_BUCKETS
     
 
 
@@ -57,6 +87,22 @@ class ModelTrainerConfig:
 
 
 
+@dataclass
+class StageCacheConfig:
+    enabled: bool = STAGE_CACHE_ENABLED
+    # kept outside the timestamped artifact dir, so later runs reuse the stages of earlier ones
+    cache_dir: str = os.path.join(ARTIFACT_DIR, STAGE_CACHE_DIR_NAME)
+    max_size_bytes: int = STAGE_CACHE_MAX_SIZE_BYTES
+
+
+
+@dataclass
+class ArtifactStoreConfig:
+    enabled: bool = ARTIFACT_STORE_ENABLED
+    max_write_workers: int = ARTIFACT_STORE_WRITE_WORKERS
+
+
+
 @dataclass
 class ModelEvaluationConfig:
     changed_threshold_score: float = MODEL_EVALUATION_CHANGED_THRESHOLD_SCORE
@@ -76,3 +122,29 @@ class ModelPusherConfig:
 class USvisaPredictorConfig:
     model_file_path: str = MODEL_FILE_NAME
     model_bucket_name: str = MODEL_BUCKET_NAME
+    model_reload_interval_seconds: int = PREDICTION_MODEL_RELOAD_INTERVAL_SECONDS
+    batch_max_size: int = PREDICTION_BATCH_MAX_SIZE
+    batch_max_wait_ms: float = PREDICTION_BATCH_MAX_WAIT_MS
+    executor_max_workers: int = PREDICTION_EXECUTOR_MAX_WORKERS
+    executor_max_queue_size: int = PREDICTION_EXECUTOR_MAX_QUEUE_SIZE
+    executor_use_processes: bool = PREDICTION_EXECUTOR_USE_PROCESSES
+    cache_enabled: bool = PREDICTION_CACHE_ENABLED
+    cache_max_size: int = PREDICTION_CACHE_MAX_SIZE
+    cache_ttl_seconds: float = PREDICTION_CACHE_TTL_SECONDS
+    csv_chunk_size: int = PREDICTION_CSV_CHUNK_SIZE
+    warmup_rounds: int = PREDICTION_WARMUP_ROUNDS
+    warmup_retry_interval_seconds: int = PREDICTION_WARMUP_RETRY_INTERVAL_SECONDS
+
+
+
+@dataclass
+class CollectionScoringConfig:
+    collection_name: str = COLLECTION_NAME
+    # kept outside the timestamped artifact dir so an interrupted run can be resumed
+    checkpoint_dir: str = os.path.join(ARTIFACT_DIR, COLLECTION_SCORING_DIR_NAME, COLLECTION_SCORING_CHECKPOINT_DIR)
+    batch_size: int = COLLECTION_SCORING_BATCH_SIZE
+    n_partitions: int = COLLECTION_SCORING_N_PARTITIONS
+    max_workers: int = COLLECTION_SCORING_MAX_WORKERS
+    model_version_field: str = COLLECTION_SCORING_MODEL_VERSION_FIELD
+    model_bucket_name: str = MODEL_BUCKET_NAME
+    model_file_path: str = MODEL_FILE_NAME
@@ -0,0 +1,319 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from Primary_Folder.entity.drift_sketch import (MAX_EXACT_VALUES, CategoryCounts, DatasetSketch, QuantileSketch,
+                                                 column_values)
+from Primary_Folder.exceptions import final_except
+from Primary_Folder.logger import logging
+
+NUMERIC_TESTS = ("auto", "ks", "wasserstein", "psi", "jensenshannon")
+CATEGORICAL_TESTS = ("auto", "chisquare", "z", "psi", "jensenshannon")
+# tests whose statistic is a p-value, drift when below the threshold; the others are distances, drift when above
+P_VALUE_TESTS = ("ks", "chisquare", "z")
+# numeric columns with more reference values than this are binned in a histogram, the others by value
+MAX_UNBINNED_VALUES = 20
+# share given to empty bins by psi, smaller when a bin share already is below it, as evidently does
+EMPTY_BIN_SHARE = 0.0001
+
+
+def _value_counts(reference: np.ndarray, current: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # sorted distinct values of both samples, with their counts in each
+    values, codes = np.unique(np.concatenate([reference, current]), return_inverse=True)
+    reference_counts = np.bincount(codes[:reference.size], minlength=values.size).astype(np.float64)
+    current_counts = np.bincount(codes[reference.size:], minlength=values.size).astype(np.float64)
+    return values, reference_counts, current_counts
+
+
+def _sketch_value_counts(reference: QuantileSketch,
+                         current: QuantileSketch) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # the support values of both sketches, with their counts in each
+    reference_values, reference_support_counts = reference.support()
+    current_values, current_support_counts = current.support()
+    values = np.union1d(reference_values, current_values)
+    reference_counts, current_counts = np.zeros(values.size), np.zeros(values.size)
+    np.add.at(reference_counts, np.searchsorted(values, reference_values), reference_support_counts)
+    np.add.at(current_counts, np.searchsorted(values, current_values), current_support_counts)
+    return values, reference_counts, current_counts
+
+
+def _sturges_edges(minimum: float, maximum: float, n_rows: int) -> np.ndarray:
+    # np.histogram_bin_edges(..., bins="sturges") from the range and size of the data
+    if minimum == maximum:
+        minimum, maximum = minimum - 0.5, maximum + 0.5
+    return np.linspace(minimum, maximum, int(np.ceil(np.log2(n_rows) + 1)) + 1)
+
+
+def _ks(reference: np.ndarray, current: np.ndarray) -> float:
+    from scipy.stats import ks_2samp
+
+    return float(ks_2samp(reference, current)[1])
+
+
+def _ks_counts(reference_counts: np.ndarray, current_counts: np.ndarray) -> float:
+    # asymptotic two sample Kolmogorov-Smirnov p-value, from counts on shared sorted values
+    from scipy.stats import kstwo
+
+    n_reference, n_current = reference_counts.sum(), current_counts.sum()
+    statistic = np.max(np.abs(np.cumsum(reference_counts) / n_reference - np.cumsum(current_counts) / n_current))
+    return float(kstwo.sf(statistic, np.round(n_reference * n_current / (n_reference + n_current))))
+
+
+def _wasserstein(values: np.ndarray, reference_counts: np.ndarray, current_counts: np.ndarray,
+                 reference_std: float) -> float:
+    # first Wasserstein distance between the distributions on sorted values, divided by the reference std
+    reference_cdf = np.cumsum(reference_counts)[:-1] / reference_counts.sum()
+    current_cdf = np.cumsum(current_counts)[:-1] / current_counts.sum()
+    return float(np.sum(np.abs(reference_cdf - current_cdf) * np.diff(values)) / max(reference_std, 0.001))
+
+
+def _fill_empty(shares: np.ndarray) -> np.ndarray:
+    smallest = shares[shares != 0].min()
+    shares[shares == 0] = smallest / 10 ** 6 if smallest <= EMPTY_BIN_SHARE else EMPTY_BIN_SHARE
+    return shares
+
+
+def _shares(reference_counts: np.ndarray, current_counts: np.ndarray,
+            fill_empty: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    reference_shares = reference_counts / reference_counts.sum()
+    current_shares = current_counts / current_counts.sum()
+    if fill_empty:
+        reference_shares, current_shares = _fill_empty(reference_shares), _fill_empty(current_shares)
+    return reference_shares, current_shares
+
+
+def _psi(reference_counts: np.ndarray, current_counts: np.ndarray) -> float:
+    reference_shares, current_shares = _shares(reference_counts, current_counts)
+    return float(np.sum((reference_shares - current_shares) * np.log(reference_shares / current_shares)))
+
+
+def _jensenshannon(reference_counts: np.ndarray, current_counts: np.ndarray) -> float:
+    from scipy.special import rel_entr
+
+    reference_shares, current_shares = _shares(reference_counts, current_counts, fill_empty=False)
+    middle = (reference_shares + current_shares) / 2
+    divergence = (np.sum(rel_entr(reference_shares, middle)) + np.sum(rel_entr(current_shares, middle))) / 2
+    return float(np.sqrt(max(divergence, 0.0)))
+
+
+def _chisquare(reference_counts: np.ndarray, current_counts: np.ndarray) -> float:
+    from scipy.special import chdtrc
+
+    expected = reference_counts * current_counts.sum() / reference_counts.sum()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(expected > 0, (current_counts - expected) ** 2 / expected,
+                         np.where(current_counts > 0, np.inf, 0.0))
+    return float(chdtrc(max(reference_counts.size - 1, 1), terms.sum()))
+
+
+def _z(reference_counts: np.ndarray, current_counts: np.ndarray) -> float:
+    from scipy.special import ndtr
+
+    if reference_counts.size < 2:
+        return 1.0
+    # two proportions z-test on the share of the first value
+    n_reference, n_current = reference_counts.sum(), current_counts.sum()
+    p_reference, p_current = reference_counts[0] / n_reference, current_counts[0] / n_current
+    pooled = (reference_counts[0] + current_counts[0]) / (n_reference + n_current)
+    scale = np.sqrt(pooled * (1 - pooled) * (1 / n_reference + 1 / n_current))
+    if scale == 0:
+        return 1.0
+    return float(2 * (1 - ndtr(abs((p_reference - p_current) / scale))))
+
+
+COUNT_TESTS = {"psi": _psi, "jensenshannon": _jensenshannon, "chisquare": _chisquare, "z": _z}
+
+
+class DriftEngine:
+    """
+    Class Name :   DriftEngine
+    Description :  This class computes data drift column by column with numpy, following the evidently 0.2 data
+                   drift profile: with "auto" tests, up to small_sample_size reference rows use ks for numeric
+                   columns with more than 5 values, chisquare for more than 2 values and z otherwise; larger samples
+                   use wasserstein for numeric columns with more than 5 values and jensenshannon otherwise.
+                   p-value tests drift below p_value_threshold, distances at or above distance_threshold, and the
+                   dataset drifts when the share of drifted columns reaches drift_share. Missing values are dropped.
+                   run tests dataframes, run_sketches the DatasetSketch summaries of datasets too large for memory.
+
+    Output      :  Drift report dict, JSON serializable
+    On Failure  :  Write an exception log and then raise an exception
+    """
+
+    def __init__(self, column_types: Dict[str, str], numeric_test: str = "auto", categorical_test: str = "auto",
+                 p_value_threshold: float = 0.05, distance_threshold: float = 0.1, drift_share: float = 0.5,
+                 small_sample_size: int = 1000, max_workers: int = 1):
+        """
+        :param column_types: Column name to schema type ("category", "int", "float"), the columns checked
+        :param numeric_test: Test of the numeric columns, one of NUMERIC_TESTS
+        :param categorical_test: Test of the category columns, one of CATEGORICAL_TESTS
+        :param p_value_threshold: Columns drift when the p-value of their test is below it
+        :param distance_threshold: Columns drift when their distance is at or above it
+        :param drift_share: Dataset drifts when at least this share of the columns drift
+        :param small_sample_size: Largest reference size handled with the p-value tests by "auto"
+        :param max_workers: Columns tested in parallel threads
+        """
+        if numeric_test not in NUMERIC_TESTS or categorical_test not in CATEGORICAL_TESTS:
+            raise ValueError(f"Unknown drift test {numeric_test}/{categorical_test}, "
+                             f"expected one of {NUMERIC_TESTS}/{CATEGORICAL_TESTS}")
+        self.column_types = column_types
+        self.numeric_test = numeric_test
+        self.categorical_test = categorical_test
+        self.p_value_threshold = p_value_threshold
+        self.distance_threshold = distance_threshold
+        self.drift_share = drift_share
+        self.small_sample_size = small_sample_size
+        self.max_workers = max_workers
+
+    def select_test(self, numeric: bool, n_reference: int, n_values: int) -> str:
+        test = self.numeric_test if numeric else self.categorical_test
+        if test != "auto":
+            return test
+        if n_reference <= self.small_sample_size:
+            if numeric and n_values > 5:
+                return "ks"
+            return "chisquare" if n_values > 2 else "z"
+        return "wasserstein" if numeric and n_values > 5 else "jensenshannon"
+
+    def _result(self, numeric: bool, test: str, statistic: float) -> dict:
+        if test in P_VALUE_TESTS:
+            threshold, drift_detected = self.p_value_threshold, statistic < self.p_value_threshold
+        else:
+            threshold, drift_detected = self.distance_threshold, statistic >= self.distance_threshold
+        return {"type": "num" if numeric else "cat", "test": test, "statistic": statistic,
+                "threshold": threshold, "drift_detected": bool(drift_detected)}
+
+    def column_drift(self, column: str, reference: pd.Series, current: pd.Series) -> dict:
+        """
+        Method Name :   column_drift
+        Description :   This method tests one column of the reference and current data
+
+        Output      :   dict with the column type, test, statistic, threshold and drift_detected
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            numeric = self.column_types.get(column) in ("int", "float")
+            reference_values, current_values = column_values(reference, numeric), column_values(current, numeric)
+            values, reference_counts, current_counts = _value_counts(reference_values, current_values)
+            test = self.select_test(numeric, reference_values.size, values.size)
+
+            if reference_values.size == 0 or current_values.size == 0:
+                statistic = 1.0 if test in P_VALUE_TESTS else 0.0
+            elif test == "ks":
+                statistic = _ks(reference_values, current_values)
+            elif test == "wasserstein":
+                statistic = _wasserstein(values, reference_counts, current_counts, np.std(reference_values))
+            else:
+                if test in ("psi", "jensenshannon") and numeric and \
+                        np.count_nonzero(reference_counts) > MAX_UNBINNED_VALUES:
+                    edges = np.histogram_bin_edges(np.concatenate([reference_values, current_values]), bins="sturges")
+                    reference_counts = np.histogram(reference_values, edges)[0].astype(np.float64)
+                    current_counts = np.histogram(current_values, edges)[0].astype(np.float64)
+                statistic = COUNT_TESTS[test](reference_counts, current_counts)
+            return self._result(numeric, test, statistic)
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def sketch_column_drift(self, column: str, reference: Union[QuantileSketch, CategoryCounts],
+                            current: Union[QuantileSketch, CategoryCounts]) -> dict:
+        """
+        Method Name :   sketch_column_drift
+        Description :   This method tests one column from its reference and current sketches. The tests are the
+                        ones of column_drift on the sketched distributions: exact for category tables and numeric
+                        columns of few values, within the relative accuracy of the sketch otherwise, ks using
+                        the asymptotic p-value
+
+        Output      :   dict with the column type, test, statistic, threshold and drift_detected
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            numeric = isinstance(reference, QuantileSketch)
+            if numeric:
+                values, reference_counts, current_counts = _sketch_value_counts(reference, current)
+                n_values = values.size if reference.exact is not None and current.exact is not None \
+                    else MAX_EXACT_VALUES + 1
+            else:
+                reference_counts, current_counts = CategoryCounts.aligned_counts(reference, current)
+                n_values = int(np.count_nonzero(reference_counts + current_counts))
+            test = self.select_test(numeric, reference.count, n_values)
+
+            if reference.count == 0 or current.count == 0:
+                statistic = 1.0 if test in P_VALUE_TESTS else 0.0
+            elif test == "ks":
+                statistic = _ks_counts(reference_counts, current_counts)
+            elif test == "wasserstein":
+                statistic = _wasserstein(values, reference_counts, current_counts, reference.std)
+            else:
+                if test in ("psi", "jensenshannon") and numeric and reference.n_values > MAX_UNBINNED_VALUES:
+                    edges = _sturges_edges(min(reference.min, current.min), max(reference.max, current.max),
+                                           reference.count + current.count)
+                    reference_counts = np.histogram(values, edges, weights=reference_counts)[0]
+                    current_counts = np.histogram(values, edges, weights=current_counts)[0]
+                statistic = COUNT_TESTS[test](reference_counts, current_counts)
+            return self._result(numeric, test, statistic)
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def _map_columns(self, column_drift: Callable[[str], dict], columns: List[str]) -> List[dict]:
+        if self.max_workers > 1 and len(columns) > 1:
+            # the sorts and counts run in numpy without the GIL, threads keep the data shared
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(columns))) as executor:
+                return list(executor.map(column_drift, columns))
+        return [column_drift(column) for column in columns]
+
+    def _report(self, columns: List[str], results: List[dict]) -> dict:
+        n_drifted_features = sum(result["drift_detected"] for result in results)
+        share_drifted_features = n_drifted_features / len(columns) if columns else 0.0
+        logging.info(f"Drift engine: {n_drifted_features}/{len(columns)} columns drifted")
+        return {
+            "n_features": len(columns),
+            "n_drifted_features": n_drifted_features,
+            "share_drifted_features": share_drifted_features,
+            "dataset_drift": bool(columns) and share_drifted_features >= self.drift_share,
+            "drift_share": self.drift_share,
+            "columns": dict(zip(columns, results)),
+        }
+
+    def run(self, reference_df: DataFrame, current_df: DataFrame) -> dict:
+        """
+        Method Name :   run
+        Description :   This method tests every column of column_types present in both frames, in max_workers threads
+
+        Output      :   dict with n_features, n_drifted_features, share_drifted_features, dataset_drift and the
+                        result of every column
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            columns = [column for column in self.column_types
+                       if column in reference_df.columns and column in current_df.columns]
+            results = self._map_columns(
+                lambda column: self.column_drift(column, reference_df[column], current_df[column]), columns)
+            return self._report(columns, results)
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def run_sketches(self, reference: DatasetSketch, current: DatasetSketch) -> dict:
+        """
+        Method Name :   run_sketches
+        Description :   This method tests every column of column_types sketched in both datasets, in max_workers
+                        threads, without going back to the data
+
+        Output      :   dict with n_features, n_drifted_features, share_drifted_features, dataset_drift and the
+                        result of every column
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            columns = [column for column in self.column_types
+                       if column in reference.columns and column in current.columns]
+            results = self._map_columns(lambda column: self.sketch_column_drift(
+                column, reference.columns[column], current.columns[column]), columns)
+            return self._report(columns, results)
+
+        except Exception as e:
+            raise final_except(e, sys) from e
@@ -0,0 +1,344 @@
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from Primary_Folder.exceptions import final_except
+from Primary_Folder.logger import logging
+from Primary_Folder.utils.main import iter_dataframe_chunks
+
+# numeric columns keep exact value counts up to this many distinct values, so codes, years and other low cardinality
+# columns test exactly: relative accuracy buckets are coarse far from zero (about 40 years wide around 2000 at 1%)
+MAX_EXACT_VALUES = 1000
+
+
+def column_values(series: pd.Series, numeric: bool) -> np.ndarray:
+    """
+    Returns the non missing values of series, as finite float64 for numeric columns and as str otherwise
+    """
+    if numeric:
+        values = pd.to_numeric(series, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        return values[np.isfinite(values)]
+    return series.dropna().astype(str).to_numpy()
+
+
+def _add_counts(store: dict, keys: np.ndarray, counts: np.ndarray) -> None:
+    for key, count in zip(keys.tolist(), counts.tolist()):
+        store[key] = store.get(key, 0) + count
+
+
+class QuantileSketch:
+    """
+    Class Name :   QuantileSketch
+    Description :  This class summarizes a numeric column in bounded memory, DDSketch style: values fall in
+                   logarithmic buckets whose representative is within relative_accuracy of every value it holds,
+                   the smallest magnitudes are collapsed above max_buckets. Mean, variance, min and max are kept
+                   exactly, and so are the value counts while there are at most MAX_EXACT_VALUES distinct values.
+                   Sketches with the same relative_accuracy merge into the sketch of the concatenated data.
+
+    Output      :  Sorted support values with their counts
+    On Failure  :  Write an exception log and then raise an exception
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_buckets: int = 2048):
+        """
+        :param relative_accuracy: Largest relative error of the bucket representatives
+        :param max_buckets: Buckets kept per sign, the smallest magnitudes are merged above it
+        """
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self.zero_count = 0
+        self.exact: Optional[Dict[float, int]] = {}
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def _merge_moments(self, count: int, mean: float, m2: float, minimum: float, maximum: float) -> None:
+        # parallel variance update of Chan et al., exact whatever the order of the merges
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+        self.min, self.max = min(self.min, minimum), max(self.max, maximum)
+
+    def _add_buckets(self, store: Dict[int, int], magnitudes: np.ndarray) -> None:
+        if magnitudes.size:
+            keys = np.ceil(np.log(magnitudes) / np.log(self.gamma)).astype(np.int64)
+            _add_counts(store, *np.unique(keys, return_counts=True))
+            self._collapse(store)
+
+    def _collapse(self, store: Dict[int, int]) -> None:
+        if len(store) > self.max_buckets:
+            keys = sorted(store)[:len(store) - self.max_buckets + 1]
+            store[keys[-1]] = sum(store.pop(key) for key in keys)
+
+    def _set_exact(self, exact: Optional[Dict[float, int]]) -> None:
+        self.exact = exact if exact is not None and len(exact) <= MAX_EXACT_VALUES else None
+
+    def update(self, values: np.ndarray) -> "QuantileSketch":
+        if values.size:
+            mean = float(values.mean())
+            self._merge_moments(values.size, mean, float(np.sum((values - mean) ** 2)),
+                                float(values.min()), float(values.max()))
+            if self.exact is not None:
+                _add_counts(self.exact, *np.unique(values, return_counts=True))
+                self._set_exact(self.exact)
+            self._add_buckets(self.positive, values[values > 0])
+            self._add_buckets(self.negative, -values[values < 0])
+            self.zero_count += int(np.count_nonzero(values == 0))
+        return self
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        if other.gamma != self.gamma:
+            raise ValueError("Only sketches of the same relative accuracy merge")
+        if other.count:
+            self._merge_moments(other.count, other.mean, other.m2, other.min, other.max)
+            if self.exact is not None and other.exact is not None:
+                _add_counts(self.exact, np.array(list(other.exact)), np.array(list(other.exact.values())))
+                self._set_exact(self.exact)
+            else:
+                self.exact = None
+            for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+                _add_counts(store, np.array(list(other_store), dtype=np.int64),
+                            np.array(list(other_store.values()), dtype=np.int64))
+                self._collapse(store)
+            self.zero_count += other.zero_count
+        return self
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.m2 / self.count)) if self.count else 0.0
+
+    @property
+    def n_values(self) -> int:
+        # distinct values, MAX_EXACT_VALUES + 1 standing for "more than MAX_EXACT_VALUES"
+        return len(self.exact) if self.exact is not None else MAX_EXACT_VALUES + 1
+
+    def _representatives(self, store: Dict[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+        keys = np.array(sorted(store), dtype=np.int64)
+        counts = np.array([store[key] for key in keys.tolist()], dtype=np.float64)
+        return 2 * self.gamma ** keys.astype(np.float64) / (self.gamma + 1), counts
+
+    def support(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Method Name :   support
+        Description :   This method returns the distribution held by the sketch, exact while available
+
+        Output      :   (sorted values, their counts as float64)
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            if self.exact is not None:
+                values = np.array(sorted(self.exact), dtype=np.float64)
+                return values, np.array([self.exact[value] for value in values.tolist()], dtype=np.float64)
+
+            negative_values, negative_counts = self._representatives(self.negative)
+            positive_values, positive_counts = self._representatives(self.positive)
+            values = np.concatenate([-negative_values[::-1], [0.0], positive_values])
+            counts = np.concatenate([negative_counts[::-1], [float(self.zero_count)], positive_counts])
+            # representatives may overshoot the data range by relative_accuracy
+            values = np.clip(values, self.min, self.max)
+            keep = counts > 0
+            return values[keep], counts[keep]
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+
+class CategoryCounts:
+    """
+    Class Name :   CategoryCounts
+    Description :  This class counts the values of a categorical column. Above max_categories distinct values
+                   (ids, free text) the table is folded into n_hash_buckets hashed counters, a one row count-min
+                   sketch, so memory stays bounded and the tests compare the distributions of the hash buckets:
+                   a shift in the frequency profile shows, identifiers disjoint between two datasets do not.
+                   Tables merge whether or not they are folded.
+
+    Output      :  Counts aligned on the categories, or hash buckets, of two tables
+    On Failure  :  Write an exception log and then raise an exception
+    """
+
+    def __init__(self, max_categories: int = 10000, n_hash_buckets: int = 4096):
+        """
+        :param max_categories: Distinct values counted exactly before folding into hash buckets
+        :param n_hash_buckets: Counters of the folded table
+        """
+        self.max_categories = max_categories
+        self.n_hash_buckets = n_hash_buckets
+        self.counts: Dict[str, int] = {}
+        self.hashed: Optional[np.ndarray] = None
+        self.count = 0
+
+    def _hash(self, keys: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        buckets = pd.util.hash_array(np.asarray(keys, dtype=object)) % np.uint64(self.n_hash_buckets)
+        return np.bincount(buckets.astype(np.int64), weights=counts, minlength=self.n_hash_buckets)
+
+    def _folded(self) -> np.ndarray:
+        if self.hashed is not None:
+            return self.hashed
+        return self._hash(np.array(list(self.counts), dtype=object),
+                          np.array(list(self.counts.values()), dtype=np.float64))
+
+    def _add(self, keys: np.ndarray, counts: np.ndarray) -> None:
+        if self.hashed is not None:
+            self.hashed = self.hashed + self._hash(keys, counts.astype(np.float64))
+            return
+        _add_counts(self.counts, keys, counts)
+        if len(self.counts) > self.max_categories:
+            self.hashed, self.counts = self._folded(), {}
+
+    def update(self, series: pd.Series) -> "CategoryCounts":
+        value_counts = series.value_counts()
+        # category columns also list the categories absent from this chunk
+        value_counts = value_counts[value_counts > 0]
+        if len(value_counts):
+            self.count += int(value_counts.sum())
+            self._add(value_counts.index.astype(str).to_numpy(dtype=object), value_counts.to_numpy(dtype=np.int64))
+        return self
+
+    def merge(self, other: "CategoryCounts") -> "CategoryCounts":
+        self.count += other.count
+        if other.hashed is not None:
+            self.hashed, self.counts = self._folded() + other.hashed, {}
+        else:
+            self._add(np.array(list(other.counts), dtype=object), np.array(list(other.counts.values()), dtype=np.int64))
+        return self
+
+    @property
+    def n_values(self) -> int:
+        return len(self.counts) if self.hashed is None else int(np.count_nonzero(self.hashed))
+
+    @staticmethod
+    def aligned_counts(reference: "CategoryCounts", current: "CategoryCounts") -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Method Name :   aligned_counts
+        Description :   This method lines up the counts of two tables on their sorted categories, or on the hash
+                        buckets when either one is folded
+
+        Output      :   (reference counts, current counts) as float64
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            if reference.hashed is not None or current.hashed is not None:
+                return reference._folded(), current._folded()
+            categories = sorted(set(reference.counts) | set(current.counts))
+            return (np.array([reference.counts.get(category, 0) for category in categories], dtype=np.float64),
+                    np.array([current.counts.get(category, 0) for category in categories], dtype=np.float64))
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+
+class DatasetSketch:
+    """
+    Class Name :   DatasetSketch
+    Description :  This class holds a QuantileSketch per numeric column and a CategoryCounts per category column
+                   of column_types. It is built in one pass over chunks of any size, and sketches of chunks or
+                   partitions merge, so a dataset is summarized in parallel in memory bounded by the sketch
+                   parameters instead of the row count.
+
+    Output      :  Column sketches
+    On Failure  :  Write an exception log and then raise an exception
+    """
+
+    def __init__(self, column_types: Dict[str, str], relative_accuracy: float = 0.01, max_buckets: int = 2048,
+                 max_categories: int = 10000, n_hash_buckets: int = 4096):
+        """
+        :param column_types: Column name to schema type ("category", "int", "float"), the columns sketched
+        :param relative_accuracy: Relative accuracy of the numeric sketches
+        :param max_buckets: Buckets per sign of the numeric sketches
+        :param max_categories: Distinct values counted exactly per category column
+        :param n_hash_buckets: Counters of the category columns above max_categories
+        """
+        self.column_types = column_types
+        self.params = {"relative_accuracy": relative_accuracy, "max_buckets": max_buckets,
+                       "max_categories": max_categories, "n_hash_buckets": n_hash_buckets}
+        self.n_rows = 0
+        self.columns = {
+            column: QuantileSketch(relative_accuracy, max_buckets) if column_type in ("int", "float")
+            else CategoryCounts(max_categories, n_hash_buckets)
+            for column, column_type in column_types.items()
+        }
+
+    def empty(self) -> "DatasetSketch":
+        return DatasetSketch(self.column_types, **self.params)
+
+    def update(self, df: pd.DataFrame) -> "DatasetSketch":
+        """
+        Method Name :   update
+        Description :   This method adds the rows of df, columns missing from df are left unchanged
+
+        Output      :   The sketch itself
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            self.n_rows += len(df)
+            for column, sketch in self.columns.items():
+                if column in df.columns:
+                    if isinstance(sketch, QuantileSketch):
+                        sketch.update(column_values(df[column], numeric=True))
+                    else:
+                        sketch.update(df[column])
+            return self
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def merge(self, other: "DatasetSketch") -> "DatasetSketch":
+        """
+        Method Name :   merge
+        Description :   This method adds the rows summarized by other, built with the same column types and parameters
+
+        Output      :   The sketch itself
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            self.n_rows += other.n_rows
+            for column, sketch in self.columns.items():
+                sketch.merge(other.columns[column])
+            return self
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    @classmethod
+    def from_file(cls, file_path: str, column_types: Dict[str, str], chunk_size: int, max_workers: int = 1,
+                  **params) -> "DatasetSketch":
+        """
+        Method Name :   from_file
+        Description :   This method sketches the columns of column_types of a CSV, Parquet or Arrow file in one
+                        streaming pass, chunks being sketched in max_workers threads and merged in order. At most
+                        2 * max_workers chunks are in memory at once
+
+        Output      :   DatasetSketch of the file
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            sketch = cls(column_types, **params)
+            chunks = iter_dataframe_chunks(file_path, chunk_size, columns=list(column_types), column_types=column_types)
+            if max_workers <= 1:
+                for chunk in chunks:
+                    sketch.update(chunk)
+            else:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    pending = deque()
+                    for chunk in chunks:
+                        pending.append(executor.submit(lambda chunk: sketch.empty().update(chunk), chunk))
+                        if len(pending) >= 2 * max_workers:
+                            sketch.merge(pending.popleft().result())
+                    while pending:
+                        sketch.merge(pending.popleft().result())
+            logging.info(f"Sketched {sketch.n_rows} rows of {file_path}")
+            return sketch
+
+        except Exception as e:
+            raise final_except(e, sys) from e
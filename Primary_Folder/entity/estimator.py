@@ -1,10 +1,21 @@
 import sys
+from typing import TYPE_CHECKING, Optional, Tuple, Union
 
+import numpy as np
 from pandas import DataFrame
-from sklearn.pipeline import Pipeline
 
+from Primary_Folder.entity.compiled_preprocessor import CompiledPreprocessor
 from Primary_Folder.exceptions import final_except
 from Primary_Folder.logger import logging
+from Primary_Folder.metrics import stage_histogram
+
+if TYPE_CHECKING:
+    from sklearn.pipeline import Pipeline
+
+logger = logging.getLogger(__name__)
+
+TRANSFORM_LATENCY = stage_histogram("transform")
+PREDICT_LATENCY = stage_histogram("predict")
 
 class TargetValueMapping:
     def __init__(self):
@@ -21,13 +32,63 @@ class TargetValueMapping:
 
 
 class USvisaModel:
-    def __init__(self, preprocessing_object: Pipeline, trained_model_object: object):
+    def __init__(self, preprocessing_object: "Pipeline", trained_model_object: object):
         """
         :param preprocessing_object: Input Object of preprocesser
         :param trained_model_object: Input Object of trained model 
         """
         self.preprocessing_object = preprocessing_object
         self.trained_model_object = trained_model_object
+        self.compiled_preprocessor: Optional[CompiledPreprocessor] = None
+
+    def compile_preprocessor(self, verify_dataframe: Optional[DataFrame] = None) -> Optional[CompiledPreprocessor]:
+        """
+        Compiles preprocessing_object into lookup tables so predictions skip sklearn's column dispatch.
+        When verify_dataframe is given the compiled output is checked against preprocessing_object first
+        and the model keeps the sklearn path if they differ, None is then returned.
+        """
+        try:
+            compiled_preprocessor = CompiledPreprocessor.compile(self.preprocessing_object)
+            if verify_dataframe is not None:
+                try:
+                    compiled_preprocessor.verify(self.preprocessing_object, verify_dataframe)
+                except Exception as e:
+                    logger.error(f"Compiled preprocessor does not match preprocessing_object, using sklearn transform: {e}")
+                    self.compiled_preprocessor = None
+                    return None
+            self.compiled_preprocessor = compiled_preprocessor
+            return compiled_preprocessor
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def transform(self, dataframe: DataFrame) -> np.ndarray:
+        """
+        Transforms raw inputs with the compiled preprocessor when available, else with preprocessing_object
+        """
+        # models pickled before the compiled path existed have no compiled_preprocessor attribute
+        compiled_preprocessor = getattr(self, "compiled_preprocessor", None)
+        if compiled_preprocessor is not None:
+            return compiled_preprocessor.transform(dataframe)
+        return self.preprocessing_object.transform(dataframe)
+
+    def predict_record(self, record: Union[dict, tuple]) -> np.ndarray:
+        """
+        Function accepts one raw record (dict of fields or tuple in compiled input_columns order)
+        and predicts it through the compiled preprocessor without building a DataFrame,
+        or through preprocessing_object when the model has no compiled preprocessor
+        """
+        try:
+            compiled_preprocessor = getattr(self, "compiled_preprocessor", None)
+            if compiled_preprocessor is None:
+                if not isinstance(record, dict):
+                    record = dict(zip(self.preprocessing_object.feature_names_in_, record))
+                return self.predict(DataFrame({column: value if isinstance(value, list) else [value]
+                                               for column, value in record.items()}))
+            return self.trained_model_object.predict(compiled_preprocessor.transform_record(record))
+
+        except Exception as e:
+            raise final_except(e, sys) from e
 
     def predict(self, dataframe: DataFrame) -> DataFrame:
         """
@@ -35,15 +96,36 @@ class USvisaModel:
         which guarantees that the inputs are in the same format as the training data
         At last it performs prediction on transformed features
         """
-        logging.info("Entered predict method of UTruckModel class")
+        logger.info("Entered predict method of UTruckModel class")
 
         try:
-            logging.info("Using the trained model to get predictions")
+            logger.info("Using the trained model to get predictions")
+
+            with TRANSFORM_LATENCY.time():
+                transformed_feature = self.transform(dataframe)
+
+            logger.info("Used the trained model to get predictions")
+            with PREDICT_LATENCY.time():
+                return self.trained_model_object.predict(transformed_feature)
 
-            transformed_feature = self.preprocessing_object.transform(dataframe)
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def predict_with_proba(self, dataframe: DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Function accepts raw inputs, transforms them once with preprocessing_object
+        and returns both the predictions and the class probabilities of the trained model
+        """
+        logger.info("Entered predict_with_proba method of USvisaModel class")
+
+        try:
+            with TRANSFORM_LATENCY.time():
+                transformed_feature = self.transform(dataframe)
 
-            logging.info("Used the trained model to get predictions")
-            return self.trained_model_object.predict(transformed_feature)
+            logger.info("Used the trained model to get predictions and probabilities")
+            with PREDICT_LATENCY.time():
+                return (self.trained_model_object.predict(transformed_feature),
+                        self.trained_model_object.predict_proba(transformed_feature))
 
         except Exception as e:
             raise final_except(e, sys) from e
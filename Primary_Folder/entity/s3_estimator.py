@@ -1,23 +1,37 @@
 from Primary_Folder.cloud_storage.aws_storage import SimpleStorageService
+from Primary_Folder.constants import MODEL_DIGEST_METADATA_KEY, MODEL_LOCAL_CACHE_DIR
 from Primary_Folder.exceptions import final_except
 from Primary_Folder.entity.estimator import USvisaModel
+from Primary_Folder.logger import logging
+from Primary_Folder.metrics import stage_histogram
+from Primary_Folder.utils.main import hash_file, load_mmap_object, mmap_artifact_path
+import glob
+import os
 import sys
+import uuid
 from pandas import DataFrame
 
+logger = logging.getLogger(__name__)
+
+MODEL_LOAD_LATENCY = stage_histogram("model_load")
+
 
 class USvisaEstimator:
     """
     This class is used to save and retrieve us_visas model in s3 bucket and to do prediction
     """
 
-    def __init__(self,bucket_name,model_path,):
+    def __init__(self,bucket_name,model_path,local_cache_dir:str=MODEL_LOCAL_CACHE_DIR,):
         """
         :param bucket_name: Name of your model bucket
         :param model_path: Location of your model in bucket
+        :param local_cache_dir: Local folder keeping downloaded memory-mappable models, shared by the workers of a host
         """
         self.bucket_name = bucket_name
         self.s3 = SimpleStorageService()
         self.model_path = model_path
+        self.mmap_model_path = mmap_artifact_path(model_path)
+        self.local_cache_dir = local_cache_dir
         self.loaded_model:USvisaModel=None
 
 
@@ -30,11 +44,68 @@ class USvisaEstimator:
 
     def load_model(self,)->USvisaModel:
         """
-        Load the model from the model_path
+        Load the model from the model_path, through its memory-mappable artifact when one was pushed
         :return:
         """
 
-        return self.s3.load_model(self.model_path,bucket_name=self.bucket_name)
+        with MODEL_LOAD_LATENCY.time():
+            try:
+                return self.load_mmap_model()
+            except Exception as e:
+                logger.warning(f"No memory-mappable model loaded from {self.mmap_model_path}, using {self.model_path}: {e}")
+            return self.s3.load_model(self.model_path,bucket_name=self.bucket_name)
+
+    def load_mmap_model(self,)->USvisaModel:
+        """
+        Download the memory-mappable model once per host into local_cache_dir, keyed by its ETag,
+        and map it: every worker loading the same version shares the same physical pages.
+        The artifact is only used when it was pushed with the model at model_path, carrying the same digest
+        :return: USvisaModel whose arrays are memory maps of the cached file
+        """
+        try:
+            model_digest = self.s3.get_object_metadata(self.model_path,bucket_name=self.bucket_name).get(MODEL_DIGEST_METADATA_KEY)
+            mmap_digest = self.s3.get_object_metadata(self.mmap_model_path,bucket_name=self.bucket_name).get(MODEL_DIGEST_METADATA_KEY)
+            if model_digest is None or mmap_digest != model_digest:
+                raise Exception(f"{self.mmap_model_path} was not pushed with the model at {self.model_path}")
+
+            etag = self.s3.get_object_etag(self.mmap_model_path,bucket_name=self.bucket_name)
+            file_prefix = f"{self.bucket_name}_{self.mmap_model_path}".replace("/", "_")
+            local_path = os.path.join(self.local_cache_dir, file_prefix + "_" + etag.strip('"'))
+
+            if not os.path.exists(local_path):
+                os.makedirs(self.local_cache_dir, exist_ok=True)
+                download_path = f"{local_path}.{uuid.uuid4().hex}.tmp"
+                self.s3.download_file(self.mmap_model_path,bucket_name=self.bucket_name,
+                                      to_filename=download_path,etag=etag)
+                try:
+                    # link fails if another worker published first: everyone then maps that one file
+                    os.link(download_path, local_path)
+                except FileExistsError:
+                    pass
+                finally:
+                    os.remove(download_path)
+                # older versions may still be mapped by running workers, unlinking them is safe
+                for stale_path in glob.glob(os.path.join(self.local_cache_dir, f"{glob.escape(file_prefix)}_*")):
+                    if stale_path != local_path and not stale_path.endswith(".tmp"):
+                        try:
+                            os.remove(stale_path)
+                        except FileNotFoundError:
+                            # another worker removed it first
+                            pass
+
+            return load_mmap_object(local_path)
+        except Exception as e:
+            raise final_except(e, sys)
+
+    def get_model_version(self,)->str:
+        """
+        Get the version (S3 ETag) of the model stored at model_path
+        :return: ETag of the model object
+        """
+        try:
+            return self.s3.get_object_etag(self.model_path,bucket_name=self.bucket_name)
+        except Exception as e:
+            raise final_except(e, sys)
 
     def save_model(self,from_file,remove:bool=False)->None:
         """
@@ -44,10 +115,25 @@ class USvisaEstimator:
         :return:
         """
         try:
+            # both objects carry the digest of the model, load_mmap_model ignores an artifact of another push
+            metadata = {MODEL_DIGEST_METADATA_KEY: hash_file(from_file)}
+
+            # the memory-mappable artifact goes first, so it is in place once the model_path ETag changes
+            if os.path.exists(mmap_artifact_path(from_file)):
+                self.s3.upload_file(mmap_artifact_path(from_file),
+                                    to_filename=self.mmap_model_path,
+                                    bucket_name=self.bucket_name,
+                                    remove=remove,
+                                    metadata=metadata
+                                    )
+            else:
+                # never leave the artifact of a previous model next to this one
+                self.s3.delete_object(self.mmap_model_path,bucket_name=self.bucket_name)
             self.s3.upload_file(from_file,
                                 to_filename=self.model_path,
                                 bucket_name=self.bucket_name,
-                                remove=remove
+                                remove=remove,
+                                metadata=metadata
                                 )
         except Exception as e:
             raise final_except(e, sys)
@@ -34,3 +34,17 @@ class final_except(Exception):
     
     def __str__(self):
         return self.error_message
+
+
+class InvalidInputError(ValueError):
+    def __init__(self, errors: list):
+        """
+        Raised when prediction input fails validation, before any model work.
+
+        Args:
+            errors: one dict per problem with the row, column, value and error message.
+        """
+        self.errors = errors
+        super().__init__("; ".join(
+            (f"row {error['row']}: " if error.get("row") is not None else "") + f"{error['column']}: {error['error']}"
+            for error in errors))
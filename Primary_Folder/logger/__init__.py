@@ -1,18 +1,171 @@
+"""
+Logging setup, configured by environment:
+
+USVISA_LOG_MODE             sync (default) writes from the calling thread, queue hands records to a
+                            background writer thread so request threads never wait on file I/O
+USVISA_LOG_LEVEL            root level, DEBUG by default
+USVISA_LOG_LEVELS           per-logger levels, e.g. "Primary_Folder.entity.estimator=WARNING,Primary_Folder.utils=INFO"
+USVISA_LOG_SAMPLE_RATE      share of the INFO/DEBUG records of the sampled loggers that is kept, 1.0 by default
+USVISA_LOG_RATE_LIMIT       INFO/DEBUG records per second kept per call site of the sampled loggers, 0 = unlimited
+USVISA_LOG_SAMPLED_LOGGERS  comma separated logger prefixes of the per-request code
+USVISA_LOG_QUEUE_MAX_SIZE   records buffered in queue mode, records are dropped when it is full
+"""
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
+import random
+import threading
+import time
 from datetime import datetime
 
 from from_root import from_root
 
+from Primary_Folder.constants import (LOG_DEFAULT_LEVEL, LOG_DEFAULT_MODE, LOG_DEFAULT_QUEUE_MAX_SIZE,
+                                      LOG_DEFAULT_SAMPLED_LOGGERS, LOG_LEVEL_ENV_KEY, LOG_LOGGER_LEVELS_ENV_KEY,
+                                      LOG_MODE_ENV_KEY, LOG_QUEUE_MAX_SIZE_ENV_KEY, LOG_RATE_LIMIT_ENV_KEY,
+                                      LOG_SAMPLE_RATE_ENV_KEY, LOG_SAMPLED_LOGGERS_ENV_KEY)
+
 LOG_FILE = f"{datetime.now().strftime('%Y_%m_%d__%H_%M_%S')}.log"
 log_dir = 'logs'
 full_log_path = os.path.join(from_root(), log_dir)
 logs_path = os.path.join(full_log_path, LOG_FILE)
 
-os.makedirs(full_log_path, exist_ok=True)
+LOG_FORMAT = '[%(asctime)s] %(name)s %(levelname)s %(message)s'
+
+
+class LazyFileHandler(logging.FileHandler):
+    """
+    File handler that creates the log directory and opens the log file with the first record,
+    so importing the package has no filesystem side effect
+    """
+
+    def __init__(self, filename: str, mode: str = "a", encoding=None):
+        super().__init__(filename, mode=mode, encoding=encoding, delay=True)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that drops records once max_size records are waiting, instead of blocking the caller
+    """
+
+    def __init__(self, log_queue: queue.SimpleQueue, max_size: int):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # records reach this handler only, so they are finalised in place instead of copied:
+        # arguments are merged and tracebacks rendered before the caller can change them
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = self.formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+
+class HotPathFilter(logging.Filter):
+    """
+    Samples and rate limits the INFO/DEBUG records of the per-request loggers, warnings and errors always pass
+    """
+
+    def __init__(self, logger_prefixes: tuple, sample_rate: float = 1.0, max_per_second: int = 0):
+        super().__init__()
+        self.logger_prefixes = logger_prefixes
+        self.sample_rate = sample_rate
+        self.max_per_second = max_per_second
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not record.name.startswith(self.logger_prefixes):
+            return True
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        if self.max_per_second > 0:
+            call_site = (record.name, record.lineno)
+            second = int(time.monotonic())
+            with self._lock:
+                window, count = self._windows.get(call_site, (second, 0))
+                if window != second:
+                    window, count = second, 0
+                if count >= self.max_per_second:
+                    return False
+                self._windows[call_site] = (window, count + 1)
+        return True
+
+
+def _parse_logger_levels(spec: str) -> dict:
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, level = item.partition("=")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging() -> logging.Handler:
+    """
+    Configures the root logger from the environment and returns the handler attached to it
+    """
+    file_handler = LazyFileHandler(logs_path)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    handler = file_handler
+    if os.getenv(LOG_MODE_ENV_KEY, LOG_DEFAULT_MODE).lower() == "queue":
+        log_queue = queue.SimpleQueue()
+        handler = DroppingQueueHandler(
+            log_queue, max_size=int(os.getenv(LOG_QUEUE_MAX_SIZE_ENV_KEY, LOG_DEFAULT_QUEUE_MAX_SIZE)))
+        # only exceptions are rendered in the calling thread, the writer thread applies LOG_FORMAT
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+
+        def restart_listener_in_child() -> None:
+            # a forked child (inference or scoring pool worker) inherits the queue handler but not the writer
+            # thread: it gets its own queue, the records the parent had not written yet stay with the parent
+            import multiprocessing.util
+
+            handler.queue = queue.SimpleQueue()
+            child_listener = logging.handlers.QueueListener(handler.queue, file_handler, respect_handler_level=True)
+            child_listener.start()
+            atexit.register(child_listener.stop)
+            # pool workers leave through os._exit, which skips atexit but runs the multiprocessing finalizers;
+            # those registered now are cleared when the worker starts, so register it from an after-fork hook
+            multiprocessing.util.register_after_fork(
+                child_listener, lambda listener: multiprocessing.util.Finalize(listener, listener.stop, exitpriority=0))
+
+        os.register_at_fork(after_in_child=restart_listener_in_child)
+
+    handler.addFilter(HotPathFilter(
+        logger_prefixes=tuple(prefix.strip() for prefix in
+                              os.getenv(LOG_SAMPLED_LOGGERS_ENV_KEY, LOG_DEFAULT_SAMPLED_LOGGERS).split(",")
+                              if prefix.strip()),
+        sample_rate=float(os.getenv(LOG_SAMPLE_RATE_ENV_KEY, 1.0)),
+        max_per_second=int(os.getenv(LOG_RATE_LIMIT_ENV_KEY, 0)),
+    ))
+
+    logging.basicConfig(
+        handlers=[handler],
+        level=os.getenv(LOG_LEVEL_ENV_KEY, LOG_DEFAULT_LEVEL).upper(),
+        format=LOG_FORMAT,
+    )
+    for logger_name, level in _parse_logger_levels(os.getenv(LOG_LOGGER_LEVELS_ENV_KEY, "")).items():
+        logging.getLogger(logger_name).setLevel(level)
+    return handler
+
 
-logging.basicConfig(
-    filename=logs_path,
-    level=logging.DEBUG,
-    format='[%(asctime)s] %(name)s %(levelname)s %(message)s',
-)
+configure_logging()
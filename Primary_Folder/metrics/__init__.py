@@ -0,0 +1,179 @@
+import threading
+from bisect import bisect_left
+from time import perf_counter
+from typing import Dict, Optional, Tuple
+
+# seconds, from half a millisecond up to ten seconds
+DEFAULT_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: LabelSet) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label_value(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonic counter
+    """
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def render(self, name: str, labels: LabelSet) -> list:
+        return [f"{name}{_format_labels(labels)} {_format_value(self.value)}"]
+
+
+class Gauge:
+    """
+    Value that can go up and down
+    """
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def render(self, name: str, labels: LabelSet) -> list:
+        return [f"{name}{_format_labels(labels)} {_format_value(self.value)}"]
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram: observe() is one bisect and three additions under an uncontended lock
+    """
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self) -> "Timer":
+        return Timer(self)
+
+    def render(self, name: str, labels: LabelSet) -> list:
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.bounds, counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+        cumulative += counts[-1]
+        lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {repr(total)}")
+        lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Timer:
+    """
+    Context manager observing the elapsed wall time of its block into a histogram
+    """
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self) -> "Timer":
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.histogram.observe(perf_counter() - self.start)
+
+
+class MetricsRegistry:
+    """
+    Class Name :   MetricsRegistry
+    Description :  This class holds every metric of the process and renders them in the Prometheus text format.
+                   Metrics are created once (usually at import time) and then updated without any lookup.
+
+    Output      :  Prometheus exposition text
+    On Failure  :  Raises an exception when a metric name is reused with another type
+    """
+    _types = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}
+
+    def __init__(self):
+        self._families: Dict[str, Tuple[type, str, Dict[LabelSet, object]]] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, metric_type: type, name: str, help_text: str, labels: Optional[dict], **kwargs):
+        label_set: LabelSet = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            family = self._families.setdefault(name, (metric_type, help_text, {}))
+            if family[0] is not metric_type:
+                raise ValueError(f"Metric {name} is already registered as a {self._types[family[0]]}")
+            metric = family[2].get(label_set)
+            if metric is None:
+                metric = family[2][label_set] = metric_type(**kwargs)
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Optional[dict] = None) -> Counter:
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str, labels: Optional[dict] = None) -> Gauge:
+        return self._get(Gauge, name, help_text, labels)
+
+    def histogram(self, name: str, help_text: str, labels: Optional[dict] = None,
+                  buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help_text, labels, bounds=buckets)
+
+    def set_info(self, name: str, help_text: str, labels: dict) -> None:
+        """
+        Replaces the label set of an info-style gauge, e.g. the version of the loaded model
+        """
+        gauge = Gauge()
+        gauge.set(1)
+        with self._lock:
+            self._families[name] = (Gauge, help_text, {tuple(sorted(labels.items())): gauge})
+
+    def render(self) -> str:
+        with self._lock:
+            families = [(name, family[0], family[1], list(family[2].items()))
+                        for name, family in sorted(self._families.items())]
+        lines = []
+        for name, metric_type, help_text, metrics in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {self._types[metric_type]}")
+            for labels, metric in metrics:
+                lines.extend(metric.render(name, labels))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_LATENCY_METRIC = "usvisa_stage_duration_seconds"
+
+
+def stage_histogram(stage: str) -> Histogram:
+    """
+    Returns the latency histogram of one serving stage, resolve it once and reuse it on the hot path
+    """
+    return REGISTRY.histogram(STAGE_LATENCY_METRIC, "Duration of serving stages in seconds", {"stage": stage})
@@ -0,0 +1,132 @@
+import os
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+
+from Primary_Folder.exceptions import final_except
+from Primary_Folder.logger import logging
+
+
+class ArtifactStore:
+    """
+    Class Name :   ArtifactStore
+    Description :  This class hands stage outputs (typed dataframes, arrays, fitted objects) from one stage of a
+                   training run to the next in memory, keyed by their artifact file path. Objects put in the store
+                   are written to that path by background threads, so the artifact directory stays complete for
+                   auditing and resumption, while later stages take them from memory instead of parsing the files
+                   again. Paths are retained once per stage that will read them and released after it ran, the
+                   object is dropped when the count is back to zero.
+                   Stages must not modify the objects they get, other stages share them.
+
+    Output      :  Objects of the run, from memory or loaded from disk
+    On Failure  :  Write an exception log and then raise an exception
+    """
+
+    def __init__(self, max_write_workers: int = 2):
+        """
+        :param max_write_workers: Threads persisting the objects put in the store
+        """
+        self._objects: Dict[str, object] = {}
+        self._ref_counts: Dict[str, int] = {}
+        self._writes: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_write_workers, thread_name_prefix="artifact-store")
+
+    @staticmethod
+    def _key(file_path: str) -> str:
+        return os.path.abspath(file_path)
+
+    def put(self, file_path: str, obj: object, writer: Optional[Callable[[str, object], None]] = None) -> object:
+        """
+        Method Name :   put
+        Description :   This method keeps obj in memory under file_path and, with writer, writes it there
+                        asynchronously with writer(file_path, obj)
+
+        Output      :   obj
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            key = self._key(file_path)
+            with self._lock:
+                self._objects[key] = obj
+                if writer is not None:
+                    self._writes[key] = self._executor.submit(writer, file_path, obj)
+            return obj
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def get(self, file_path: str, loader: Callable[[str], object]) -> object:
+        """
+        Method Name :   get
+        Description :   This method returns the object of file_path from memory, or loader(file_path) once its
+                        pending write is done. Loaded objects are kept while file_path is retained
+
+        Output      :   Object of file_path, shared with the other stages
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            key = self._key(file_path)
+            with self._lock:
+                if key in self._objects:
+                    return self._objects[key]
+            self.wait([file_path])
+            obj = loader(file_path)
+            with self._lock:
+                if self._ref_counts.get(key, 0) > 0:
+                    obj = self._objects.setdefault(key, obj)
+            return obj
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def retain(self, file_paths: Iterable[str], count: int = 1) -> None:
+        with self._lock:
+            for file_path in file_paths:
+                key = self._key(file_path)
+                self._ref_counts[key] = self._ref_counts.get(key, 0) + count
+
+    def release(self, file_paths: Iterable[str]) -> None:
+        with self._lock:
+            for file_path in file_paths:
+                key = self._key(file_path)
+                self._ref_counts[key] = self._ref_counts.get(key, 0) - 1
+                if self._ref_counts[key] <= 0:
+                    del self._ref_counts[key]
+                    # a pending write keeps its own reference until the file is on disk
+                    if self._objects.pop(key, None) is not None:
+                        logging.info(f"Released {file_path} from the artifact store")
+
+    def wait(self, file_paths: Optional[Iterable[str]] = None) -> None:
+        """
+        Method Name :   wait
+        Description :   This method blocks until the pending writes of file_paths, or all of them, are on disk
+
+        Output      :   None
+        On Failure  :   Raises the exception of a failed write
+        """
+        with self._lock:
+            keys = list(self._writes) if file_paths is None else [self._key(file_path) for file_path in file_paths]
+            writes = [(key, self._writes[key]) for key in keys if key in self._writes]
+        for key, write in writes:
+            write.result()
+            with self._lock:
+                if self._writes.get(key) is write:
+                    del self._writes[key]
+
+    def close(self) -> None:
+        """
+        Method Name :   close
+        Description :   This method waits for every pending write and empties the store
+
+        Output      :   None
+        On Failure  :   Raises the exception of a failed write
+        """
+        try:
+            self.wait()
+        finally:
+            self._executor.shutdown(wait=True)
+            with self._lock:
+                self._objects.clear()
+                self._ref_counts.clear()
@@ -0,0 +1,155 @@
+import asyncio
+from typing import Callable, List, Optional, Set, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from Primary_Folder.logger import logging
+from Primary_Folder.pipline.executor import InferenceExecutor
+
+
+class PredictionBatcher:
+    """
+    Class Name :   PredictionBatcher
+    Description :  This class coalesces concurrent prediction requests into one vectorized batch.
+                   Rows are queued until max_batch_size rows are waiting or max_wait_ms has passed
+                   since the first queued row, then predicted together and handed back to each caller.
+                   A single record flushed on its own skips the DataFrame and goes through predict_record_fn.
+
+    Output      :  Predictions for the rows of every request
+    On Failure  :  The exception is raised to the request(s) whose rows failed
+    """
+
+    def __init__(self, predict_fn: Callable[[DataFrame], Tuple[np.ndarray, str]], max_batch_size: int,
+                 max_wait_ms: float, executor: Optional[InferenceExecutor] = None,
+                 predict_record_fn: Optional[Callable[[dict], Tuple[np.ndarray, str]]] = None):
+        """
+        :param predict_fn: Function scoring a DataFrame and returning the version of the model that scored it,
+                           e.g. USvisaClassifier().predict_with_version
+        :param max_batch_size: Number of queued rows that triggers an immediate flush
+        :param max_wait_ms: Longest time a row waits for others before the batch is flushed
+        :param executor: Worker pool running predict_fn, when None predict_fn runs on the event loop
+        :param predict_record_fn: Function scoring one raw record without a DataFrame, like predict_fn,
+                                  e.g. USvisaClassifier().predict_record_with_version
+        """
+        self.predict_fn = predict_fn
+        self.predict_record_fn = predict_record_fn
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._pending: List[Tuple[Union[DataFrame, dict], asyncio.Future]] = []
+        self._pending_rows = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # the event loop only keeps weak references to tasks, a running batch must not be garbage collected
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def predict(self, dataframe: DataFrame) -> Tuple[np.ndarray, str]:
+        """
+        Method Name :   predict
+        Description :   This method queues the rows of dataframe and waits for their predictions
+
+        Output      :   Predictions of the dataframe rows, in order, and the version of the model that made them
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        return await self._enqueue(dataframe, n_rows=len(dataframe))
+
+    async def predict_record(self, record: dict) -> Tuple[np.ndarray, str]:
+        """
+        Method Name :   predict_record
+        Description :   This method queues one raw record, e.g. USvisaData.get_usvisa_data_as_dict(), and waits
+                        for its prediction. Alone in its batch it is scored by predict_record_fn
+
+        Output      :   Prediction of the record and the version of the model that made it
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        return await self._enqueue(record, n_rows=1)
+
+    async def _enqueue(self, item: Union[DataFrame, dict], n_rows: int) -> Tuple[np.ndarray, str]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        self._pending_rows += n_rows
+
+        if self._pending_rows >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait_ms / 1000, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        batch, self._pending, self._pending_rows = self._pending, [], 0
+        task = asyncio.ensure_future(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def shutdown(self) -> None:
+        """
+        Method Name :   shutdown
+        Description :   This method flushes the queued rows and waits for every running batch,
+                        so no request is left waiting on a prediction when the app stops
+
+        Output      :   None
+        On Failure  :   The exception is raised to the request(s) whose rows failed
+        """
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+
+    async def _run_batch(self, batch: List[Tuple[Union[DataFrame, dict], asyncio.Future]]) -> None:
+        try:
+            if len(batch) == 1:
+                predictions, model_version = await self._predict(batch[0][0])
+            else:
+                predictions, model_version = await self._predict(
+                    pd.concat([self._to_frame(item) for item, _ in batch], ignore_index=True))
+            logging.info(f"Predicted a batch of {len(predictions)} rows from {len(batch)} requests")
+        except Exception as e:
+            if len(batch) == 1:
+                self._set_exception(batch[0][1], e)
+                return
+            # one bad request must not fail its neighbours: score them one by one
+            logging.error(f"Batch prediction failed, retrying {len(batch)} requests individually: {e}")
+            for item, future in batch:
+                try:
+                    self._set_result(future, await self._predict(item))
+                except Exception as error:
+                    self._set_exception(future, error)
+            return
+
+        start = 0
+        for item, future in batch:
+            end = start + (len(item) if isinstance(item, DataFrame) else 1)
+            self._set_result(future, (predictions[start:end], model_version))
+            start = end
+
+    @staticmethod
+    def _to_frame(item: Union[DataFrame, dict]) -> DataFrame:
+        return item if isinstance(item, DataFrame) else DataFrame(item)
+
+    async def _predict(self, item: Union[DataFrame, dict]) -> Tuple[np.ndarray, str]:
+        predict_fn = self.predict_fn
+        if isinstance(item, dict):
+            if self.predict_record_fn is not None:
+                predict_fn = self.predict_record_fn
+            else:
+                item = self._to_frame(item)
+        if self.executor is None:
+            return predict_fn(item)
+        return await self.executor.run(predict_fn, item)
+
+    @staticmethod
+    def _set_result(future: asyncio.Future, result: Tuple[np.ndarray, str]) -> None:
+        if not future.done():
+            future.set_result(result)
+
+    @staticmethod
+    def _set_exception(future: asyncio.Future, error: Exception) -> None:
+        if not future.done():
+            future.set_exception(error)
@@ -0,0 +1,164 @@
+import io
+import os
+import sys
+from typing import IO, Iterator, Union
+
+import pandas as pd
+from pandas import DataFrame
+
+from Primary_Folder.constants import (CURRENT_YEAR, PREDICTION_COLUMN_NAME, PREDICTION_ERROR_COLUMN_NAME,
+                                      SCHEMA_FILE_PATH, TARGET_COLUMN)
+from Primary_Folder.entity.estimator import TargetValueMapping, USvisaModel
+from Primary_Folder.exceptions import final_except
+from Primary_Folder.logger import logging
+from Primary_Folder.pipline.input_validator import USvisaInputValidator
+from Primary_Folder.pipline.prediction_pipeline import USVISA_INPUT_COLUMNS
+from Primary_Folder.utils.main import drop_columns, read_yaml_file
+
+
+class BulkScorer:
+    """
+    Class Name :   BulkScorer
+    Description :  This class turns raw exported application rows into model inputs, with the same
+                   company_age derivation and drop_columns step as training, and scores them with a USvisaModel.
+                   Rows are checked with the same USvisaInputValidator as the prediction routes first: a row
+                   with a missing value or a category the model has never seen is reported, not scored.
+
+    Output      :  Predictions of the raw rows
+    On Failure  :  Write an exception log and then raise an exception
+    """
+
+    def __init__(self, model: USvisaModel, schema_file_path: str = SCHEMA_FILE_PATH):
+        """
+        :param model: Loaded USvisaModel used for every batch
+        :param schema_file_path: Schema holding the drop_columns list and the categorical domains
+        """
+        try:
+            self.model = model
+            self._schema_config = read_yaml_file(file_path=schema_file_path)
+            self._target_mapping = TargetValueMapping().reverse_mapping()
+            self.input_validator = USvisaInputValidator.from_schema(
+                input_columns=USVISA_INPUT_COLUMNS, schema_file_path=schema_file_path,
+                compiled_preprocessor=getattr(model, "compiled_preprocessor", None))
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def get_input_features(self, dataframe: DataFrame) -> DataFrame:
+        """
+        Method Name :   get_input_features
+        Description :   This method turns raw exported rows into the model input columns
+
+        Output      :   DataFrame ready for USvisaModel.predict
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            input_features = dataframe.drop(columns=[TARGET_COLUMN, "_id"], errors="ignore")
+            if "company_age" not in input_features.columns:
+                input_features["company_age"] = CURRENT_YEAR - input_features["yr_of_estab"]
+            drop_cols = [column for column in self._schema_config["drop_columns"] if column in input_features.columns]
+            return drop_columns(df=input_features, cols=drop_cols)
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def score_dataframe(self, dataframe: DataFrame) -> DataFrame:
+        """
+        Method Name :   score_dataframe
+        Description :   This method validates raw rows and scores the valid ones in one vectorized call
+
+        Output      :   DataFrame indexed like dataframe with the prediction, the predicted case_status label and
+                        the validation errors; rejected rows have no prediction, scored rows no error
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            input_features, errors = self.input_validator.validate_dataframe(self.get_input_features(dataframe))
+            predictions = pd.Series(pd.NA, index=dataframe.index, dtype="Int64")
+            if len(input_features):
+                predictions.loc[input_features.index] = self.model.predict(input_features).astype(int)
+
+            row_errors = {}
+            for error in errors:
+                row_errors.setdefault(error["row"], []).append(f"{error['column']}: {error['error']}")
+            return DataFrame({PREDICTION_COLUMN_NAME: predictions,
+                              f"predicted_{TARGET_COLUMN}": predictions.map(self._target_mapping).astype(object),
+                              PREDICTION_ERROR_COLUMN_NAME: pd.Series({row: "; ".join(messages) for row, messages
+                                                                       in row_errors.items()}, dtype=object)},
+                             index=dataframe.index)
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+
+class StreamingCSVScorer(BulkScorer):
+    """
+    Class Name :   StreamingCSVScorer
+    Description :  This class scores a CSV export of applications chunk by chunk,
+                   so memory stays at one chunk whatever the size of the file.
+
+    Output      :  Input rows with the predicted value and case_status appended
+    On Failure  :  Write an exception log and then raise an exception
+    """
+
+    def __init__(self, model: USvisaModel, chunk_size: int, schema_file_path: str = SCHEMA_FILE_PATH):
+        """
+        :param model: Loaded USvisaModel used for every chunk
+        :param chunk_size: Number of rows read, scored and written at a time
+        :param schema_file_path: Schema holding the drop_columns list
+        """
+        super().__init__(model=model, schema_file_path=schema_file_path)
+        self.chunk_size = chunk_size
+
+    def score_chunks(self, source: Union[str, IO]) -> Iterator[DataFrame]:
+        """
+        Method Name :   score_chunks
+        Description :   This method reads source in chunks and yields every chunk with its predictions
+
+        Output      :   Iterator of scored DataFrame chunks, rejected rows carry their errors in prediction_error
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            n_rows, n_rejected = 0, 0
+            # "na" marks missing values in the exports, as in data ingestion
+            for chunk in pd.read_csv(source, chunksize=self.chunk_size, na_values="na"):
+                chunk = pd.concat([chunk, self.score_dataframe(chunk)], axis=1)
+                n_rows += len(chunk)
+                n_rejected += int(chunk[PREDICTION_COLUMN_NAME].isna().sum())
+                logging.info(f"Scored {n_rows} rows, {n_rejected} rejected by input validation")
+                yield chunk
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def iter_csv(self, source: Union[str, IO]) -> Iterator[str]:
+        """
+        Method Name :   iter_csv
+        Description :   This method yields the scored rows as CSV text, one chunk at a time
+
+        Output      :   Iterator of CSV text, the header comes with the first chunk only
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        header = True
+        for chunk in self.score_chunks(source):
+            buffer = io.StringIO()
+            chunk.to_csv(buffer, index=False, header=header)
+            header = False
+            yield buffer.getvalue()
+
+    def score_to_file(self, source: Union[str, IO], output_file_path: str) -> int:
+        """
+        Method Name :   score_to_file
+        Description :   This method scores source and appends every scored chunk to output_file_path
+
+        Output      :   Number of rows scored
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            dir_path = os.path.dirname(output_file_path)
+            if dir_path:
+                os.makedirs(dir_path, exist_ok=True)
+            n_rows = 0
+            with open(output_file_path, "w", newline="") as output_file:
+                for chunk_number, chunk in enumerate(self.score_chunks(source)):
+                    chunk.to_csv(output_file, index=False, header=chunk_number == 0)
+                    n_rows += len(chunk)
+            logging.info(f"Saved {n_rows} scored rows into {output_file_path}")
+            return n_rows
+        except Exception as e:
+            raise final_except(e, sys) from e
@@ -0,0 +1,215 @@
+import multiprocessing
+import os
+import sys
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from bson import json_util
+from pymongo import UpdateOne
+
+from Primary_Folder.constants import PREDICTION_COLUMN_NAME, PREDICTION_ERROR_COLUMN_NAME, TARGET_COLUMN
+from Primary_Folder.database_access.db_extract import USvisaData
+from Primary_Folder.entity.artifact_entity import CollectionScoringArtifact
+from Primary_Folder.entity.config_entity import CollectionScoringConfig
+from Primary_Folder.entity.s3_estimator import USvisaEstimator
+from Primary_Folder.exceptions import final_except
+from Primary_Folder.logger import logging
+from Primary_Folder.pipline.bulk_scoring import BulkScorer
+
+PARTITION_PLAN_FILE_NAME = "partitions.json"
+
+
+def _score_partition(config: CollectionScoringConfig, model_version: str, partition_index: int) -> int:
+    """
+    Entry point of a scoring worker process
+    """
+    try:
+        return CollectionScoringPipeline(config).score_partition(partition_index, model_version)
+    except Exception as e:
+        # final_except cannot be unpickled in the parent process, send its message instead
+        raise Exception(str(e)) from None
+
+
+class CollectionScoringPipeline:
+    """
+    Class Name :   CollectionScoringPipeline
+    Description :  This class re-scores the whole visa collection with the production model.
+                   The collection is split into _id ranges scored by parallel worker processes; each worker
+                   reads its range with a cursor, scores batch_size documents at a time and writes predictions
+                   and the model version back with one unordered bulk_write per batch. Documents failing input
+                   validation are left untouched and their _id is recorded in the partition checkpoint.
+                   The last written _id of every range is checkpointed, so a rerun with the same model resumes
+                   where it stopped.
+
+    Output      :  CollectionScoringArtifact
+    On Failure  :  Write an exception log and then raise an exception
+    """
+
+    def __init__(self, collection_scoring_config: CollectionScoringConfig = CollectionScoringConfig()):
+        """
+        :param collection_scoring_config: configuration for collection scoring
+        """
+        self.config = collection_scoring_config
+        self.output_fields = [PREDICTION_COLUMN_NAME, f"predicted_{TARGET_COLUMN}", self.config.model_version_field]
+
+    def _checkpoint_path(self, name: str) -> str:
+        return os.path.join(self.config.checkpoint_dir, name)
+
+    def _read_checkpoint(self, name: str) -> Optional[dict]:
+        path = self._checkpoint_path(name)
+        if not os.path.exists(path):
+            return None
+        with open(path) as checkpoint_file:
+            return json_util.loads(checkpoint_file.read())
+
+    def _write_checkpoint(self, name: str, content: dict) -> None:
+        # write then rename so a crash never leaves a half-written checkpoint
+        os.makedirs(self.config.checkpoint_dir, exist_ok=True)
+        path = self._checkpoint_path(name)
+        with open(path + ".tmp", "w") as checkpoint_file:
+            checkpoint_file.write(json_util.dumps(content))
+        os.replace(path + ".tmp", path)
+
+    def plan_partitions(self, model_version: str, restart: bool = False) -> List[dict]:
+        """
+        Method Name :   plan_partitions
+        Description :   This method splits the collection into _id ranges, or reuses the ranges of an
+                        unfinished run with the same model version
+
+        Output      :   list of partition checkpoints
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            plan = None if restart else self._read_checkpoint(PARTITION_PLAN_FILE_NAME)
+            if plan is not None and plan["model_version"] == model_version:
+                logging.info(f"Resuming scoring with model {model_version} over {len(plan['partitions'])} partitions")
+                return plan["partitions"]
+
+            bounds = USvisaData().get_id_partitions(collection_name=self.config.collection_name,
+                                                    n_partitions=self.config.n_partitions)
+            partitions = [{"partition_index": index, "lower": lower, "upper": upper,
+                           "last_id": None, "n_scored": 0, "rejected_ids": [], "done": False}
+                          for index, (lower, upper) in enumerate(bounds)]
+            for partition in partitions:
+                self._write_checkpoint(f"partition_{partition['partition_index']}.json", partition)
+            self._write_checkpoint(PARTITION_PLAN_FILE_NAME, {"model_version": model_version, "partitions": partitions})
+            logging.info(f"Planned scoring with model {model_version} over {len(partitions)} partitions")
+            return partitions
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def score_partition(self, partition_index: int, model_version: str) -> int:
+        """
+        Method Name :   score_partition
+        Description :   This method scores one _id range from its last checkpoint on
+
+        Output      :   Number of documents scored by this call, rejected documents not included
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            checkpoint_name = f"partition_{partition_index}.json"
+            partition = self._read_checkpoint(checkpoint_name)
+            if partition["done"]:
+                return 0
+
+            estimator = USvisaEstimator(bucket_name=self.config.model_bucket_name, model_path=self.config.model_file_path)
+            if estimator.get_model_version() != model_version:
+                raise Exception(f"Production model changed during the run, expected {model_version}; rerun with restart")
+            scorer = BulkScorer(model=estimator.load_model())
+
+            usvisa_data = USvisaData()
+            collection = usvisa_data.get_collection(self.config.collection_name)
+            query = usvisa_data.get_id_range_filter(lower=partition["lower"], upper=partition["upper"])
+            if partition["last_id"] is not None:
+                query.setdefault("_id", {})["$gt"] = partition["last_id"]
+            cursor = (collection.find(query, projection={field: 0 for field in self.output_fields})
+                      .sort("_id", 1).batch_size(self.config.batch_size))
+
+            n_scored = 0
+            batch = []
+            for document in cursor:
+                batch.append(document)
+                if len(batch) == self.config.batch_size:
+                    n_scored += self._score_batch(collection, scorer, batch, model_version, partition, checkpoint_name)
+                    batch = []
+            if batch:
+                n_scored += self._score_batch(collection, scorer, batch, model_version, partition, checkpoint_name)
+
+            partition["done"] = True
+            self._write_checkpoint(checkpoint_name, partition)
+            logging.info(f"Partition {partition_index} done, {partition['n_scored']} documents scored, "
+                         f"{len(partition['rejected_ids'])} rejected by input validation")
+            return n_scored
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def _score_batch(self, collection, scorer: BulkScorer, batch: List[dict], model_version: str,
+                     partition: dict, checkpoint_name: str) -> int:
+        dataframe = pd.DataFrame.from_records(batch).replace({"na": np.nan})
+        scored = scorer.score_dataframe(dataframe)
+        prediction_label_column = f"predicted_{TARGET_COLUMN}"
+        accepted = scored[PREDICTION_COLUMN_NAME].notna().to_numpy()
+
+        operations = [
+            UpdateOne({"_id": document_id}, {"$set": {
+                PREDICTION_COLUMN_NAME: int(prediction),
+                prediction_label_column: label,
+                self.config.model_version_field: model_version,
+            }})
+            for document_id, prediction, label in zip(dataframe["_id"][accepted],
+                                                      scored[PREDICTION_COLUMN_NAME][accepted],
+                                                      scored[prediction_label_column][accepted])
+        ]
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+
+        rejected_ids = dataframe["_id"][~accepted].tolist()
+        if rejected_ids:
+            logging.warning(f"Rejected {len(rejected_ids)} documents by input validation, first: {rejected_ids[0]} "
+                            f"({scored[PREDICTION_ERROR_COLUMN_NAME][~accepted].iloc[0]})")
+        # checkpoints written before rejected documents were tracked have no rejected_ids
+        partition.setdefault("rejected_ids", []).extend(rejected_ids)
+        partition["last_id"] = batch[-1]["_id"]
+        partition["n_scored"] += len(operations)
+        self._write_checkpoint(checkpoint_name, partition)
+        return len(operations)
+
+    def run(self, restart: bool = False) -> CollectionScoringArtifact:
+        """
+        Method Name :   run
+        Description :   This method scores every partition, in parallel worker processes when max_workers > 1
+
+        Output      :   CollectionScoringArtifact
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            model_version = USvisaEstimator(bucket_name=self.config.model_bucket_name,
+                                            model_path=self.config.model_file_path).get_model_version()
+            partitions = self.plan_partitions(model_version=model_version, restart=restart)
+            pending = [partition["partition_index"] for partition in partitions
+                       if not self._read_checkpoint(f"partition_{partition['partition_index']}.json")["done"]]
+            logging.info(f"Scoring {len(pending)} of {len(partitions)} partitions with model {model_version}")
+
+            if self.config.max_workers > 1 and len(pending) > 1:
+                # spawn: pymongo clients must not be shared with forked children
+                context = multiprocessing.get_context("spawn")
+                with context.Pool(processes=min(self.config.max_workers, len(pending))) as pool:
+                    pool.starmap(_score_partition, [(self.config, model_version, index) for index in pending])
+            else:
+                for index in pending:
+                    self.score_partition(index, model_version)
+
+            checkpoints = [self._read_checkpoint(f"partition_{partition['partition_index']}.json")
+                           for partition in partitions]
+            collection_scoring_artifact = CollectionScoringArtifact(
+                collection_name=self.config.collection_name,
+                model_version=model_version,
+                n_scored_documents=sum(checkpoint["n_scored"] for checkpoint in checkpoints),
+                n_rejected_documents=sum(len(checkpoint.get("rejected_ids", [])) for checkpoint in checkpoints),
+                checkpoint_dir=self.config.checkpoint_dir,
+            )
+            logging.info(f"Collection scoring artifact: {collection_scoring_artifact}")
+            return collection_scoring_artifact
+        except Exception as e:
+            raise final_except(e, sys) from e
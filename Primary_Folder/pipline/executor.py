@@ -0,0 +1,80 @@
+import asyncio
+import functools
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+
+from Primary_Folder.logger import logging
+
+
+class InferenceExecutor:
+    """
+    Class Name :   InferenceExecutor
+    Description :  This class runs blocking model loading and inference on a bounded worker pool
+                   so the asyncio event loop only parses requests and renders responses.
+                   At most max_workers calls run at once and at most max_queue_size more may wait;
+                   calls beyond that are rejected straight away instead of piling up.
+
+    Output      :  Result of the submitted function
+    On Failure  :  Raises an exception when the queue is full or the function fails
+    """
+
+    def __init__(self, max_workers: int, max_queue_size: int, use_processes: bool = False,
+                 initializer: Optional[Callable] = None, initargs: Tuple = ()):
+        """
+        :param max_workers: Number of worker threads or processes
+        :param max_queue_size: Number of calls allowed to wait for a free worker
+        :param use_processes: Use a process pool instead of a thread pool, functions must then be picklable
+        :param initializer: Called as initializer(*initargs) in every worker before its first call
+        :param initargs: Arguments of initializer
+        """
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.use_processes = use_processes
+        self.initializer = initializer
+        self.initargs = initargs
+        self._executor: Executor = None
+        self._in_flight = 0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.use_processes:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=self.initializer,
+                                                     initargs=self.initargs)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="usvisa-inference",
+                                                    initializer=self.initializer, initargs=self.initargs)
+            logging.info(f"Started inference {'process' if self.use_processes else 'thread'} pool "
+                         f"with {self.max_workers} workers")
+        return self._executor
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Method Name :   run
+        Description :   This method runs fn(*args, **kwargs) on the worker pool and awaits its result
+
+        Output      :   Result of fn
+        On Failure  :   Raises an exception when the queue is full or fn fails
+        """
+        if self._in_flight >= self.max_workers + self.max_queue_size:
+            raise Exception(f"Inference queue is full ({self._in_flight} calls in flight), try again later.")
+
+        loop = asyncio.get_running_loop()
+        self._in_flight += 1
+        try:
+            return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self._in_flight -= 1
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stops the worker pool
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
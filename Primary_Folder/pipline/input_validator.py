@@ -0,0 +1,155 @@
+import math
+import sys
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from Primary_Folder.constants import SCHEMA_FILE_PATH
+from Primary_Folder.entity.compiled_preprocessor import CompiledPreprocessor
+from Primary_Folder.exceptions import InvalidInputError, final_except
+from Primary_Folder.utils.main import read_yaml_file
+
+# reported per column in error messages, longer domains are cut
+MAX_LISTED_CATEGORIES = 10
+
+
+class USvisaInputValidator:
+    """
+    Class Name :   USvisaInputValidator
+    Description :  This class checks prediction input before any model work: numeric fields are coerced to float
+                   once, and categories the fitted encoders have never seen are rejected with the allowed values.
+                   Allowed categories come from the fitted encoders when a compiled preprocessor is given,
+                   otherwise from the categorical_domains of config/schema.yaml.
+
+    Output      :  Coerced input, or InvalidInputError listing every problem
+    On Failure  :  Raises InvalidInputError for bad input, otherwise write an exception log and raise an exception
+    """
+
+    def __init__(self, input_columns: Sequence[str], numeric_columns: Sequence[str],
+                 categorical_domains: Dict[str, Sequence], model_version: Optional[str] = None):
+        """
+        :param input_columns: Columns every input must have, in model input order
+        :param numeric_columns: Columns coerced to finite floats
+        :param categorical_domains: Allowed values of the categorical columns
+        :param model_version: Version of the model whose encoders gave the domains
+        """
+        self.input_columns = list(input_columns)
+        self.numeric_columns = [column for column in self.input_columns if column in set(numeric_columns)]
+        self.categorical_domains = {column: list(values) for column, values in categorical_domains.items()
+                                    if column in self.input_columns}
+        self._category_sets = {column: set(values) for column, values in self.categorical_domains.items()}
+        self.model_version = model_version
+
+    @classmethod
+    def from_schema(cls, input_columns: Sequence[str], schema_file_path: str = SCHEMA_FILE_PATH,
+                    compiled_preprocessor: Optional[CompiledPreprocessor] = None,
+                    model_version: Optional[str] = None) -> "USvisaInputValidator":
+        """
+        Method Name :   from_schema
+        Description :   This method builds the validator from the schema, taking the categories of the
+                        fitted encoders of compiled_preprocessor over the schema domains when available
+
+        Output      :   USvisaInputValidator
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            schema_config = read_yaml_file(file_path=schema_file_path)
+            domains = dict(schema_config.get("categorical_domains", {}))
+            if compiled_preprocessor is not None:
+                for column, _, lookup, ignore_unknown in compiled_preprocessor.one_hot_blocks:
+                    if ignore_unknown:
+                        # the encoder accepts unseen categories, so must the validator
+                        domains.pop(column, None)
+                    else:
+                        domains[column] = list(lookup)
+                for column, _, lookup in compiled_preprocessor.ordinal_blocks:
+                    domains[column] = list(lookup)
+            return cls(input_columns=input_columns, numeric_columns=schema_config["num_features"],
+                       categorical_domains=domains, model_version=model_version)
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    @staticmethod
+    def _error(column: str, value, message: str) -> dict:
+        # values are reported as text so errors stay JSON serializable (NaN, inf, numpy scalars)
+        value = None if value is None or (not isinstance(value, str) and pd.isna(value)) else str(value)
+        return {"column": column, "value": value, "error": message}
+
+    def _category_error(self, column: str, value) -> dict:
+        allowed = self.categorical_domains[column]
+        listed = ", ".join(map(str, allowed[:MAX_LISTED_CATEGORIES])) + (", ..." if len(allowed) > MAX_LISTED_CATEGORIES else "")
+        return self._error(column, value, f"unknown category {value!r}, expected one of: {listed}")
+
+    def _number_error(self, column: str, value) -> dict:
+        return self._error(column, value, f"{value!r} is not a finite number")
+
+    def validate_record(self, record: dict) -> dict:
+        """
+        Method Name :   validate_record
+        Description :   This method validates one raw record, e.g. the fields of the prediction form
+
+        Output      :   Record with numeric fields as float
+        On Failure  :   Raises InvalidInputError listing every invalid field
+        """
+        coerced, errors = {}, []
+        for column in self.input_columns:
+            value = record.get(column)
+            if isinstance(value, list):
+                value = value[0] if value else None
+            if value is None or value == "":
+                errors.append(self._error(column, value, "missing value"))
+            elif column in self._category_sets:
+                if value not in self._category_sets[column]:
+                    errors.append(self._category_error(column, value))
+                coerced[column] = value
+            elif column in self.numeric_columns:
+                try:
+                    coerced[column] = float(value)
+                    if not math.isfinite(coerced[column]):
+                        raise ValueError(value)
+                except (TypeError, ValueError):
+                    errors.append(self._number_error(column, value))
+            else:
+                coerced[column] = value
+        if errors:
+            raise InvalidInputError(errors)
+        return coerced
+
+    def validate_dataframe(self, dataframe: DataFrame) -> Tuple[DataFrame, List[dict]]:
+        """
+        Method Name :   validate_dataframe
+        Description :   This method validates a batch column by column with vectorized checks
+
+        Output      :   (valid rows with numeric columns as float64 and the input index, errors of the rejected rows
+                        where row is the index label)
+        On Failure  :   Raises InvalidInputError when a column is missing
+        """
+        missing_columns = [column for column in self.input_columns if column not in dataframe.columns]
+        if missing_columns:
+            raise InvalidInputError([{"column": column, "value": None, "error": "missing column"}
+                                     for column in missing_columns])
+
+        coerced = dataframe[self.input_columns].copy()
+        invalid = np.zeros(len(coerced), dtype=bool)
+        errors = []
+
+        for column in self.numeric_columns:
+            values = pd.to_numeric(coerced[column], errors="coerce").astype(np.float64)
+            bad = ~np.isfinite(values.to_numpy())
+            if bad.any():
+                errors.extend({"row": row, **self._number_error(column, value)}
+                              for row, value in coerced[column][bad].items())
+                invalid |= bad
+            coerced[column] = values
+
+        for column, categories in self.categorical_domains.items():
+            bad = ~coerced[column].isin(categories).to_numpy()
+            if bad.any():
+                errors.extend({"row": row, **self._category_error(column, value)}
+                              for row, value in coerced[column][bad].items())
+                invalid |= bad
+
+        return coerced[~invalid], errors
@@ -0,0 +1,154 @@
+import sys
+import threading
+from typing import Dict, Optional, Tuple
+
+from Primary_Folder.entity.estimator import USvisaModel
+from Primary_Folder.entity.s3_estimator import USvisaEstimator
+from Primary_Folder.exceptions import final_except
+from Primary_Folder.logger import logging
+from Primary_Folder.metrics import REGISTRY
+
+
+class USvisaModelCache:
+    """
+    Class Name :   USvisaModelCache
+    Description :  This class keeps one loaded USvisaModel per process and serves every prediction from memory.
+                   A daemon thread polls the S3 ETag of the model and swaps in the new model once it has
+                   been fully loaded, so requests never wait on a reload.
+
+    Output      :  Loaded USvisaModel and its version
+    On Failure  :  Write an exception log and then raise an exception
+    """
+    _instances: Dict[Tuple[str, str], "USvisaModelCache"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, bucket_name: str, model_path: str, reload_interval_seconds: int):
+        """
+        :param bucket_name: Name of your model bucket
+        :param model_path: Location of your model in bucket
+        :param reload_interval_seconds: Seconds between two ETag checks, 0 disables the watcher
+        """
+        self.estimator = USvisaEstimator(bucket_name=bucket_name, model_path=model_path)
+        self.reload_interval_seconds = reload_interval_seconds
+        # (model, etag) is replaced as a whole so readers always see a consistent pair
+        self._current: Optional[Tuple[USvisaModel, str]] = None
+        self._load_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+
+    @classmethod
+    def get_instance(cls, bucket_name: str, model_path: str, reload_interval_seconds: int) -> "USvisaModelCache":
+        """
+        Returns the process-wide cache for the bucket_name/model_path model
+        """
+        key = (bucket_name, model_path)
+        instance = cls._instances.get(key)
+        if instance is None:
+            with cls._instances_lock:
+                instance = cls._instances.get(key)
+                if instance is None:
+                    instance = cls(bucket_name=bucket_name, model_path=model_path,
+                                   reload_interval_seconds=reload_interval_seconds)
+                    cls._instances[key] = instance
+        return instance
+
+    @property
+    def model_version(self) -> Optional[str]:
+        current = self._current
+        return None if current is None else current[1]
+
+    def get_loaded_model(self) -> Tuple[Optional[USvisaModel], Optional[str]]:
+        """
+        Returns the loaded model and its version without ever loading it, (None, None) before the first load
+        """
+        current = self._current
+        return (None, None) if current is None else current
+
+    def get_model(self) -> USvisaModel:
+        """
+        Method Name :   get_model
+        Description :   This method returns the loaded model, loading it on the first call only
+
+        Output      :   Loaded USvisaModel
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        return self.get_model_with_version()[0]
+
+    def get_model_with_version(self) -> Tuple[USvisaModel, str]:
+        """
+        Method Name :   get_model_with_version
+        Description :   This method returns the loaded model together with its version, loading it on the first call only
+
+        Output      :   Loaded USvisaModel and its ETag, always a consistent pair
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        current = self._current
+        if current is not None:
+            return current
+
+        try:
+            with self._load_lock:
+                if self._current is None:
+                    self._load()
+                    self._start_watcher()
+            return self._current
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def refresh(self) -> bool:
+        """
+        Method Name :   refresh
+        Description :   This method reloads the model when its ETag in s3 differs from the loaded one
+
+        Output      :   Returns True when a new model was swapped in
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            etag = self.estimator.get_model_version()
+            if etag == self.model_version:
+                return False
+            with self._load_lock:
+                if etag == self.model_version:
+                    return False
+                self._load(etag=etag)
+            return True
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def stop(self) -> None:
+        """
+        Stops the background ETag watcher
+        """
+        self._stop_event.set()
+
+    def _load(self, etag: Optional[str] = None) -> None:
+        # The ETag is read before the download: if the object changes in between,
+        # the next check sees a different ETag and loads it again.
+        if etag is None:
+            etag = self.estimator.get_model_version()
+        logging.info(f"Loading model {self.estimator.model_path} with ETag {etag}")
+        model = self.estimator.load_model()
+        if getattr(model, "compiled_preprocessor", None) is None:
+            try:
+                model.compile_preprocessor()
+            except Exception as e:
+                logging.error(f"Could not compile the preprocessor, using sklearn transform: {e}")
+        self._current = (model, etag)
+        REGISTRY.set_info("usvisa_model_info", "Version (S3 ETag) of the served model", {"model_version": etag})
+        REGISTRY.counter("usvisa_model_loads_total", "Number of model loads and reloads").inc()
+        logging.info(f"Loaded model {model} with ETag {etag}")
+
+    def _start_watcher(self) -> None:
+        if self.reload_interval_seconds <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, name="usvisa-model-watcher", daemon=True)
+        self._watcher.start()
+
+    def _watch(self) -> None:
+        while not self._stop_event.wait(self.reload_interval_seconds):
+            try:
+                if self.refresh():
+                    logging.info(f"Swapped in model with ETag {self.model_version}")
+            except Exception as e:
+                # keep serving the model already in memory
+                logging.error(f"Model reload check failed: {e}")
@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from Primary_Folder.logger import logging
+
+NUMERIC_INPUT_COLUMNS = ("no_of_employees", "prevailing_wage", "company_age")
+
+_MISSING = object()
+
+
+class PredictionCache:
+    """
+    Class Name :   PredictionCache
+    Description :  This class is a bounded LRU cache of predictions keyed on the canonicalized applicant features.
+                   Entries optionally expire after ttl_seconds, and the whole cache is dropped as soon as
+                   it is used with a different model version.
+
+    Output      :  Cached prediction or None
+    On Failure  :  Never raises, a failed lookup is a miss
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float = 0):
+        """
+        :param max_size: Number of entries kept before the least recently used one is evicted
+        :param ttl_seconds: Seconds an entry stays valid, 0 keeps entries until evicted
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._model_version: Optional[str] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(usvisa_input_dict: Dict[str, list]) -> tuple:
+        """
+        Builds the cache key from USvisaData.get_usvisa_data_as_dict(): numeric fields are
+        converted to float, so "100" and 100 share an entry, and categories are kept as given
+        """
+        key = []
+        for column in sorted(usvisa_input_dict):
+            value = usvisa_input_dict[column]
+            value = value[0] if isinstance(value, list) else value
+            if column in NUMERIC_INPUT_COLUMNS and value is not None:
+                value = float(value)
+            key.append((column, value))
+        return tuple(key)
+
+    def get(self, key: Hashable, model_version: Optional[str]) -> Any:
+        """
+        Returns the cached prediction of key for model_version, or None on a miss
+        """
+        with self._lock:
+            self._check_model_version(model_version)
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at and expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, model_version: Optional[str]) -> None:
+        """
+        Stores the prediction of key, made with model_version
+        """
+        with self._lock:
+            self._check_model_version(model_version)
+            expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else 0
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "model_version": self._model_version,
+        }
+
+    def _check_model_version(self, model_version: Optional[str]) -> None:
+        if model_version != self._model_version:
+            if self._entries:
+                logging.info(f"Model version changed to {model_version}, dropping {len(self._entries)} cached predictions")
+                self.invalidations += 1
+            self._entries.clear()
+            self._model_version = model_version
@@ -3,12 +3,40 @@ import sys
 
 import numpy as np
 import pandas as pd
+from Primary_Folder.constants import SCHEMA_FILE_PATH
 from Primary_Folder.entity.config_entity import USvisaPredictorConfig
-from Primary_Folder.entity.s3_estimator import USvisaEstimator
+from Primary_Folder.pipline.input_validator import USvisaInputValidator
+from Primary_Folder.pipline.model_cache import USvisaModelCache
 from Primary_Folder.exceptions import final_except
 from Primary_Folder.logger import logging
+from Primary_Folder.metrics import stage_histogram
 from Primary_Folder.utils.main import read_yaml_file
 from pandas import DataFrame
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+USVISA_INPUT_COLUMNS = [
+    "continent",
+    "education_of_employee",
+    "has_job_experience",
+    "requires_job_training",
+    "no_of_employees",
+    "region_of_employment",
+    "prevailing_wage",
+    "unit_of_wage",
+    "full_time_position",
+    "company_age",
+]
+
+# numeric values cycled through the synthetic warm-up rows: small, typical and large applications
+WARMUP_NUMERIC_VALUES = {
+    "no_of_employees": [10, 2000, 100000],
+    "prevailing_wage": [15.5, 70000.0, 300000.0],
+    "company_age": [2, 20, 150],
+}
+
+INPUT_DATA_FRAME_LATENCY = stage_histogram("input_data_frame")
 
 
 class USvisaData:
@@ -49,9 +77,9 @@ class USvisaData:
         This function returns a DataFrame from USvisaData class input
         """
         try:
-            
-            usvisa_input_dict = self.get_usvisa_data_as_dict()
-            return DataFrame(usvisa_input_dict)
+            with INPUT_DATA_FRAME_LATENCY.time():
+                usvisa_input_dict = self.get_usvisa_data_as_dict()
+                return DataFrame(usvisa_input_dict)
         
         except Exception as e:
             raise final_except(e, sys) from e
@@ -61,7 +89,7 @@ class USvisaData:
         """
         This function returns a dictionary from USvisaData class input 
         """
-        logging.info("Entered get_usvisa_data_as_dict method as USvisaData class")
+        logger.info("Entered get_usvisa_data_as_dict method as USvisaData class")
 
         try:
             input_data = {
@@ -77,15 +105,44 @@ class USvisaData:
                 "company_age": [self.company_age],
             }
 
-            logging.info("Created usvisa data dict")
+            logger.info("Created usvisa data dict")
 
-            logging.info("Exited get_usvisa_data_as_dict method as USvisaData class")
+            logger.info("Exited get_usvisa_data_as_dict method as USvisaData class")
 
             return input_data
 
         except Exception as e:
             raise final_except(e, sys) from e
 
+    @staticmethod
+    def get_usvisa_batch_data_frame(records: List[dict]) -> DataFrame:
+        """
+        This function returns one columnar DataFrame for a list of usvisa input records,
+        keeping the records in their input order
+        """
+        try:
+            return DataFrame({column: [record[column] for record in records]
+                              for column in USVISA_INPUT_COLUMNS})
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    @staticmethod
+    def get_warmup_data_frame(schema_file_path: str = SCHEMA_FILE_PATH) -> DataFrame:
+        """
+        This function returns synthetic usvisa inputs covering every category of the schema
+        categorical_domains, used to warm a freshly loaded model up
+        """
+        try:
+            domains = read_yaml_file(file_path=schema_file_path)["categorical_domains"]
+            values = {column: domains.get(column, WARMUP_NUMERIC_VALUES.get(column)) for column in USVISA_INPUT_COLUMNS}
+            n_rows = max(len(column_values) for column_values in values.values())
+            return DataFrame({column: [column_values[row % len(column_values)] for row in range(n_rows)]
+                              for column, column_values in values.items()})
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
 class USvisaClassifier:
     def __init__(self,prediction_pipeline_config: USvisaPredictorConfig = USvisaPredictorConfig(),) -> None:
         """
@@ -94,6 +151,38 @@ class USvisaClassifier:
         try:
             # self.schema_config = read_yaml_file(SCHEMA_FILE_PATH)
             self.prediction_pipeline_config = prediction_pipeline_config
+            self._input_validator: Optional[USvisaInputValidator] = None
+        except Exception as e:
+            raise final_except(e, sys)
+
+    def get_model_cache(self) -> USvisaModelCache:
+        """
+        Returns the process-wide model cache shared by every USvisaClassifier
+        """
+        return USvisaModelCache.get_instance(
+            bucket_name=self.prediction_pipeline_config.model_bucket_name,
+            model_path=self.prediction_pipeline_config.model_file_path,
+            reload_interval_seconds=self.prediction_pipeline_config.model_reload_interval_seconds,
+        )
+
+    def get_input_validator(self) -> USvisaInputValidator:
+        """
+        Returns the input validator of the loaded model, rebuilt from its fitted encoders when the model changes.
+        Never loads the model, so it is safe on the event loop: before the first load the validator checks
+        against the schema categorical_domains only
+        """
+        try:
+            model, model_version = self.get_model_cache().get_loaded_model()
+            input_validator = self._input_validator
+            if input_validator is None or input_validator.model_version != model_version:
+                input_validator = USvisaInputValidator.from_schema(
+                    input_columns=USVISA_INPUT_COLUMNS,
+                    compiled_preprocessor=getattr(model, "compiled_preprocessor", None),
+                    model_version=model_version,
+                )
+                self._input_validator = input_validator
+            return input_validator
+
         except Exception as e:
             raise final_except(e, sys)
 
@@ -103,14 +192,104 @@ class USvisaClassifier:
         Returns: Prediction in string format
         """
         try:
-            logging.info("Entered predict method of USvisaClassifier class")
-            model = USvisaEstimator(
-                bucket_name=self.prediction_pipeline_config.model_bucket_name,
-                model_path=self.prediction_pipeline_config.model_file_path,
-            )
+            logger.info("Entered predict method of USvisaClassifier class")
+            model = self.get_model_cache().get_model()
             result =  model.predict(dataframe)
             
             return result
         
         except Exception as e:
-            raise final_except(e, sys)
\ No newline at end of file
+            raise final_except(e, sys)
+
+    def predict_with_version(self, dataframe) -> Tuple[np.ndarray, str]:
+        """
+        This is the method of USvisaClassifier
+        Returns: Predictions and the version of the model instance that made them
+        """
+        try:
+            model, model_version = self.get_model_cache().get_model_with_version()
+            return model.predict(dataframe), model_version
+
+        except Exception as e:
+            raise final_except(e, sys)
+
+    def predict_record(self, record) -> np.ndarray:
+        """
+        This is the method of USvisaClassifier for one raw record, e.g. USvisaData.get_usvisa_data_as_dict()
+        Returns: Prediction of the record through the compiled preprocessor
+        """
+        try:
+            model = self.get_model_cache().get_model()
+            return model.predict_record(record)
+
+        except Exception as e:
+            raise final_except(e, sys)
+
+    def predict_record_with_version(self, record) -> Tuple[np.ndarray, str]:
+        """
+        This is the method of USvisaClassifier for one raw record, e.g. USvisaData.get_usvisa_data_as_dict()
+        Returns: Prediction of the record through the compiled preprocessor and the version of the model that made it
+        """
+        try:
+            model, model_version = self.get_model_cache().get_model_with_version()
+            return model.predict_record(record), model_version
+
+        except Exception as e:
+            raise final_except(e, sys)
+
+    def predict_batch(self, dataframe: DataFrame, return_probability: bool = False) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        This is the method of USvisaClassifier for scoring many rows at once
+        Returns: predictions in input order and, if requested, the class probabilities
+        """
+        try:
+            logger.info("Entered predict_batch method of USvisaClassifier class")
+            model = self.get_model_cache().get_model()
+            if return_probability:
+                return model.predict_with_proba(dataframe)
+            return model.predict(dataframe), None
+
+        except Exception as e:
+            raise final_except(e, sys)
+
+    def warm_up(self, n_rounds: int) -> int:
+        """
+        This is the method of USvisaClassifier loading the production model and running synthetic
+        predictions through every serving path, so the first real request pays no first-call cost
+        Returns: number of warm-up predictions made
+        """
+        try:
+            logger.info("Entered warm_up method of USvisaClassifier class")
+            warmup_df = USvisaData.get_warmup_data_frame()
+            self.get_model_cache().get_model()
+
+            n_predictions = 0
+            for _ in range(n_rounds):
+                # single rows like the form route, the whole frame like the batch and csv routes
+                for row in range(len(warmup_df)):
+                    self.predict(warmup_df.iloc[[row]])
+                    self.predict_record(warmup_df.iloc[row].to_dict())
+                self.predict_batch(warmup_df, return_probability=True)
+                n_predictions += 3 * len(warmup_df)
+
+            logger.info(f"Warmed the model up with {n_predictions} predictions")
+            return n_predictions
+
+        except Exception as e:
+            raise final_except(e, sys)
+
+
+def warm_up_worker(prediction_pipeline_config: USvisaPredictorConfig, n_rounds: int, warmed_workers) -> None:
+    """
+    This is the initializer of the inference process pool: it warms the model of the worker process up
+    before the worker takes its first call and counts the warmed workers in the shared warmed_workers value.
+    A failure is raised, which breaks the pool so that it is started again
+    """
+    try:
+        USvisaClassifier(prediction_pipeline_config=prediction_pipeline_config).warm_up(n_rounds)
+        with warmed_workers.get_lock():
+            warmed_workers.value += 1
+
+    except Exception as e:
+        logger.error(f"Warm-up of inference worker {os.getpid()} failed: {e}")
+        raise final_except(e, sys)
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import uuid
+from dataclasses import fields, is_dataclass, replace
+from typing import Iterable, Optional
+
+import dill
+
+from Primary_Folder.exceptions import final_except
+from Primary_Folder.logger import logging
+from Primary_Folder.utils.main import hash_file
+
+STAGE_CACHE_ARTIFACT_FILE_NAME = "artifact.pkl"
+STAGE_CACHE_FILES_DIR = "files"
+
+_code_version: Optional[str] = None
+
+
+def get_code_version() -> str:
+    """
+    Returns a hash of the python sources of the package, any code change gives a new version
+    """
+    global _code_version
+    if _code_version is None:
+        package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(package_dir):
+            dirs[:] = sorted(directory for directory in dirs if directory != "__pycache__")
+            for file_name in sorted(files):
+                if file_name.endswith(".py"):
+                    file_path = os.path.join(root, file_name)
+                    digest.update(os.path.relpath(file_path, package_dir).encode())
+                    digest.update(hash_file(file_path).encode())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+
+def _map_paths(artifact: object, map_path) -> object:
+    # rewrites the str fields of an artifact dataclass, nested dataclasses included
+    changes = {}
+    for field in fields(artifact):
+        value = getattr(artifact, field.name)
+        if is_dataclass(value):
+            changes[field.name] = _map_paths(value, map_path)
+        elif isinstance(value, str):
+            changes[field.name] = map_path(value)
+    return replace(artifact, **changes)
+
+
+class StageCache:
+    """
+    Class Name :   StageCache
+    Description :  This class caches the output of training pipeline stages under a fingerprint of their inputs:
+                   the content of the input files (data, schema.yaml, model.yaml), stage parameters and the code
+                   version. An entry holds the artifact dataclass and a copy of the stage directory, on a hit the
+                   files are copied into the stage directory of the current run and the artifact paths are
+                   rewritten to point there. Least recently used entries are evicted above max_size_bytes.
+
+    Output      :  Cached artifact dataclass, or None on a miss
+    On Failure  :  Write an exception log and then raise an exception
+    """
+
+    def __init__(self, cache_dir: str, max_size_bytes: int):
+        """
+        :param cache_dir: Directory of the cache entries, shared by the runs
+        :param max_size_bytes: Total size of the entries kept, least recently used ones are evicted above it
+        """
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+
+    def fingerprint(self, stage_name: str, input_files: Iterable[str] = (), params: Optional[dict] = None) -> str:
+        """
+        Method Name :   fingerprint
+        Description :   This method hashes everything the output of a stage depends on
+
+        Output      :   Hex digest
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            description = {
+                "stage": stage_name,
+                "code_version": get_code_version(),
+                "input_files": [hash_file(file_path) for file_path in input_files],
+                "params": params or {},
+            }
+            return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def _entry_dir(self, stage_name: str, fingerprint: str) -> str:
+        return os.path.join(self.cache_dir, stage_name, fingerprint)
+
+    def get(self, stage_name: str, fingerprint: str, stage_dir: str) -> Optional[object]:
+        """
+        Method Name :   get
+        Description :   This method restores the cached output of a stage into stage_dir
+
+        Output      :   Artifact dataclass with paths under stage_dir, None when nothing is cached
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            entry_dir = self._entry_dir(stage_name, fingerprint)
+            artifact_file_path = os.path.join(entry_dir, STAGE_CACHE_ARTIFACT_FILE_NAME)
+            if not os.path.exists(artifact_file_path):
+                return None
+
+            with open(artifact_file_path, "rb") as file_obj:
+                artifact = dill.load(file_obj)
+            shutil.copytree(os.path.join(entry_dir, STAGE_CACHE_FILES_DIR), stage_dir, dirs_exist_ok=True)
+            # the modification time of the artifact file is the last use of the entry
+            os.utime(artifact_file_path)
+
+            prefix = STAGE_CACHE_FILES_DIR + "/"
+            artifact = _map_paths(artifact, lambda value: os.path.join(stage_dir, value[len(prefix):])
+                                  if value.startswith(prefix) else value)
+            logging.info(f"Reused cached {stage_name} output {fingerprint[:12]} in {stage_dir}")
+            return artifact
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def put(self, stage_name: str, fingerprint: str, artifact: object, stage_dir: str) -> None:
+        """
+        Method Name :   put
+        Description :   This method stores artifact and a copy of stage_dir, then evicts entries above max_size_bytes
+
+        Output      :   None
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            entry_dir = self._entry_dir(stage_name, fingerprint)
+            if os.path.exists(os.path.join(entry_dir, STAGE_CACHE_ARTIFACT_FILE_NAME)):
+                return
+
+            # built aside and renamed, so a concurrent or interrupted run never sees half an entry
+            tmp_entry_dir = f"{entry_dir}.{uuid.uuid4().hex}.tmp"
+            shutil.copytree(stage_dir, os.path.join(tmp_entry_dir, STAGE_CACHE_FILES_DIR))
+            stage_dir = os.path.abspath(stage_dir)
+            artifact = _map_paths(artifact, lambda value: os.path.join(
+                STAGE_CACHE_FILES_DIR, os.path.relpath(os.path.abspath(value), stage_dir)).replace(os.sep, "/")
+                if os.path.abspath(value).startswith(stage_dir + os.sep) else value)
+            with open(os.path.join(tmp_entry_dir, STAGE_CACHE_ARTIFACT_FILE_NAME), "wb") as file_obj:
+                dill.dump(artifact, file_obj)
+            try:
+                os.rename(tmp_entry_dir, entry_dir)
+            except OSError:
+                # another run stored the same entry first
+                shutil.rmtree(tmp_entry_dir, ignore_errors=True)
+            logging.info(f"Cached {stage_name} output {fingerprint[:12]}")
+            self.evict()
+
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    @staticmethod
+    def _dir_size(directory: str) -> int:
+        return sum(os.path.getsize(os.path.join(root, file_name))
+                   for root, _, files in os.walk(directory) for file_name in files)
+
+    def evict(self) -> None:
+        """
+        Method Name :   evict
+        Description :   This method removes the least recently used entries until the cache fits in max_size_bytes
+
+        Output      :   None
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            entries = []
+            for stage_name in os.listdir(self.cache_dir):
+                stage_cache_dir = os.path.join(self.cache_dir, stage_name)
+                for fingerprint in os.listdir(stage_cache_dir):
+                    artifact_file_path = os.path.join(stage_cache_dir, fingerprint, STAGE_CACHE_ARTIFACT_FILE_NAME)
+                    if os.path.exists(artifact_file_path):
+                        entries.append((os.path.getmtime(artifact_file_path),
+                                        self._dir_size(os.path.join(stage_cache_dir, fingerprint)),
+                                        os.path.join(stage_cache_dir, fingerprint)))
+
+            total_size = sum(size for _, size, _ in entries)
+            for last_used, size, entry_dir in sorted(entries):
+                if total_size <= self.max_size_bytes:
+                    break
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total_size -= size
+                logging.info(f"Evicted stage cache entry {entry_dir}, unused since {time.ctime(last_used)}")
+
+        except Exception as e:
+            raise final_except(e, sys) from e
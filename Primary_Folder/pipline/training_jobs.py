@@ -0,0 +1,258 @@
+import argparse
+import fcntl
+import json
+import os
+import subprocess
+import sys
+import threading
+import traceback
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, is_dataclass
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from Primary_Folder.constants import (ARTIFACT_DIR, TRAINING_JOB_DIR_NAME, TRAINING_JOB_HISTORY_SIZE,
+                                      TRAINING_JOB_RUN_LOCK_FILE_NAME, TRAINING_JOB_STORE_FILE_NAME)
+from Primary_Folder.exceptions import final_except
+from Primary_Folder.logger import logging
+
+TRAINING_STAGES = ["data_ingestion", "data_validation", "data_transformation",
+                   "model_trainer", "model_evaluation", "model_pusher"]
+
+
+@dataclass
+class TrainingJob:
+    job_id: str
+    status: str = "queued"
+    submitted_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    stages: Dict[str, dict] = field(default_factory=lambda: {stage: {"status": "pending"} for stage in TRAINING_STAGES})
+    artifacts: Dict[str, dict] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in ("queued", "running")
+
+
+def _run_training_job(job_id: str, job_dir: str, full_refresh: bool = False) -> None:
+    """
+    Entry point of the training process: runs TrainPipeline and writes its progress to the job store itself,
+    so the job record is kept up to date even after the worker that started the run exited
+    """
+    manager = TrainingJobManager(job_dir=job_dir)
+    job = manager.get_job(job_id)
+    job.status = "running"
+    job.started_at = datetime.now().isoformat()
+    manager._save(job)
+
+    def progress_callback(stage_name: str, status: str, artifact: object) -> None:
+        stage = job.stages.setdefault(stage_name, {})
+        stage["status"] = status
+        stage["started_at" if status == "running" else "finished_at"] = datetime.now().isoformat()
+        if is_dataclass(artifact):
+            job.artifacts[stage_name] = asdict(artifact)
+        manager._save(job)
+
+    try:
+        # imported here so the serving process never loads the training stack
+        from Primary_Folder.pipline.training_pipeline import TrainPipeline
+
+        TrainPipeline(progress_callback=progress_callback, full_refresh=full_refresh).run_pipeline()
+        manager._finish(job, "succeeded", datetime.now().isoformat())
+    except Exception as e:
+        logging.error(traceback.format_exc())
+        manager._finish(job, "failed", datetime.now().isoformat(), error=str(e))
+
+
+class TrainingJobManager:
+    """
+    Class Name :   TrainingJobManager
+    Description :  This class runs TrainPipeline in a separate process so training never blocks serving.
+                   The training process is started in its own session and is not a child the worker waits for,
+                   so a run outlives the worker that started it, e.g. across a restart of uvicorn.
+                   Only one training run is active at a time, across every uvicorn worker: the training process
+                   inherits an exclusive lock on the run lock file under artifact/ and holds it until it exits,
+                   and the job records live in a JSON store next to it, so every worker sees the same jobs.
+                   Submitting while a run is queued or running returns the active job instead of starting
+                   another one. A run whose process died releases the lock with it and is marked failed, on
+                   the next submit or when a worker starts.
+
+    Output      :  TrainingJob with status, per-stage progress and the artifacts of finished stages
+    On Failure  :  Write an exception log and then raise an exception
+    """
+
+    def __init__(self, history_size: int = TRAINING_JOB_HISTORY_SIZE,
+                 job_dir: str = os.path.join(ARTIFACT_DIR, TRAINING_JOB_DIR_NAME)):
+        """
+        :param history_size: Number of finished jobs kept for the status endpoints
+        :param job_dir: Directory of the job store and of the run lock, shared by every worker
+        """
+        self.history_size = history_size
+        self.job_dir = job_dir
+        self.store_file_path = os.path.join(job_dir, TRAINING_JOB_STORE_FILE_NAME)
+        self.run_lock_file_path = os.path.join(job_dir, TRAINING_JOB_RUN_LOCK_FILE_NAME)
+        os.makedirs(job_dir, exist_ok=True)
+        self.reconcile()
+
+    @contextmanager
+    def _locked_store(self, exclusive: bool = True) -> Iterator[dict]:
+        # flock locks conflict between processes and between the threads of one process alike
+        with open(f"{self.store_file_path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                store = {"active_job_id": None, "jobs": {}}
+                if os.path.exists(self.store_file_path):
+                    with open(self.store_file_path) as store_file:
+                        store = json.load(store_file)
+                yield store
+                if exclusive:
+                    tmp_file_path = f"{self.store_file_path}.{uuid.uuid4().hex}.tmp"
+                    with open(tmp_file_path, "w") as store_file:
+                        json.dump(store, store_file)
+                    os.replace(tmp_file_path, self.store_file_path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _acquire_run_lock(self):
+        """
+        Returns the open run lock file, exclusively locked, or None when another run holds it
+        """
+        lock_file = open(self.run_lock_file_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return lock_file
+        except BlockingIOError:
+            lock_file.close()
+            return None
+
+    def _fail_stale_job(self, store: dict) -> None:
+        # only called with the run lock free, so the process running the active job died with it
+        active_job_id = store["active_job_id"]
+        if active_job_id in store["jobs"] and store["jobs"][active_job_id]["status"] in ("queued", "running"):
+            logging.warning(f"Training job {active_job_id} lost its training process, marking it failed")
+            store["jobs"][active_job_id].update(status="failed", finished_at=datetime.now().isoformat(),
+                                                error="Training process exited before the run finished")
+        store["active_job_id"] = None
+
+    def reconcile(self) -> None:
+        """
+        Method Name :   reconcile
+        Description :   This method marks the active job failed when no training process holds the run lock,
+                        e.g. after the machine or the container restarted during a run
+
+        Output      :   None
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            with self._locked_store() as store:
+                if store["active_job_id"] is None:
+                    return
+                run_lock = self._acquire_run_lock()
+                if run_lock is not None:
+                    self._fail_stale_job(store)
+                    run_lock.close()
+        except Exception as e:
+            raise final_except(e, sys) from e
+
+    def submit(self, full_refresh: bool = False) -> TrainingJob:
+        """
+        Method Name :   submit
+        Description :   This method starts a training run, or returns the run already in progress.
+                        full_refresh makes the run re-export the whole collection
+
+        Output      :   Active TrainingJob
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        run_lock = None
+        try:
+            with self._locked_store() as store:
+                run_lock = self._acquire_run_lock()
+                active_job_id = store["active_job_id"]
+                if run_lock is None:
+                    if active_job_id in store["jobs"]:
+                        job = TrainingJob(**store["jobs"][active_job_id])
+                        logging.info(f"Training job {job.job_id} already {job.status}, collapsing request into it")
+                        return job
+                    raise Exception(f"Training run lock {self.run_lock_file_path} is held by an unknown run.")
+
+                self._fail_stale_job(store)
+                job = TrainingJob(job_id=uuid.uuid4().hex)
+                store["jobs"][job.job_id] = asdict(job)
+                store["active_job_id"] = job.job_id
+                self._trim_history(store)
+
+            # a fresh interpreter per run gives every run a fresh artifact TIMESTAMP, the new session keeps
+            # signals sent to the worker's process group away from it, and the inherited descriptor keeps
+            # the run lock held until the training process exits
+            process = subprocess.Popen(
+                [sys.executable, "-m", __name__, job.job_id, "--job-dir", self.job_dir]
+                + (["--full-refresh"] if full_refresh else []),
+                pass_fds=(run_lock.fileno(),), start_new_session=True)
+            run_lock.close()
+            run_lock = None
+            threading.Thread(target=self._monitor, args=(job, process),
+                             name=f"usvisa-training-monitor-{job.job_id}", daemon=True).start()
+            logging.info(f"Started training job {job.job_id} in process {process.pid}")
+            return job
+        except Exception as e:
+            if run_lock is not None:
+                with self._locked_store() as store:
+                    if store["active_job_id"] in store["jobs"]:
+                        store["jobs"][store["active_job_id"]].update(status="failed", error=str(e),
+                                                                     finished_at=datetime.now().isoformat())
+                    store["active_job_id"] = None
+                run_lock.close()
+            raise final_except(e, sys) from e
+
+    def get_job(self, job_id: str) -> Optional[TrainingJob]:
+        with self._locked_store(exclusive=False) as store:
+            record = store["jobs"].get(job_id)
+        return None if record is None else TrainingJob(**record)
+
+    def _monitor(self, job: TrainingJob, process: subprocess.Popen) -> None:
+        # reaps the training process while this worker lives, the training process records its own outcome
+        exit_code = process.wait()
+        job = self.get_job(job.job_id) or job
+        if job.is_active:
+            self._finish(job, "failed", datetime.now().isoformat(),
+                         error=f"Training process exited with code {exit_code}")
+        logging.info(f"Training job {job.job_id} finished with status {job.status}")
+
+    def _save(self, job: TrainingJob) -> None:
+        with self._locked_store() as store:
+            store["jobs"][job.job_id] = asdict(job)
+
+    def _finish(self, job: TrainingJob, status: str, finished_at: str, error: Optional[str] = None) -> None:
+        job.status = status
+        job.finished_at = finished_at
+        job.error = error
+        with self._locked_store() as store:
+            store["jobs"][job.job_id] = asdict(job)
+            if store["active_job_id"] == job.job_id:
+                store["active_job_id"] = None
+
+    def _trim_history(self, store: dict) -> None:
+        # dicts keep their insertion order through json, the oldest job comes first
+        while len(store["jobs"]) > self.history_size:
+            oldest_job_id = next(iter(store["jobs"]))
+            if oldest_job_id == store["active_job_id"]:
+                break
+            store["jobs"].pop(oldest_job_id)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Runs a training job submitted through TrainingJobManager")
+    parser.add_argument("job_id", help="Job whose record in the job store is updated")
+    parser.add_argument("--job-dir", default=os.path.join(ARTIFACT_DIR, TRAINING_JOB_DIR_NAME),
+                        help="Directory of the job store and of the run lock")
+    parser.add_argument("--full-refresh", action="store_true", help="Re-export the whole collection")
+    args = parser.parse_args(argv)
+
+    _run_training_job(args.job_id, args.job_dir, full_refresh=args.full_refresh)
+
+
+if __name__ == "__main__":
+    main()
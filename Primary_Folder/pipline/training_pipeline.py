@@ -1,6 +1,10 @@
 import sys
+from typing import Callable, Iterable, Optional
+from Primary_Folder.constants import CURRENT_YEAR, SCHEMA_FILE_PATH, TARGET_COLUMN
 from Primary_Folder.exceptions import final_except 
 from Primary_Folder.logger import logging
+from Primary_Folder.pipline.artifact_store import ArtifactStore
+from Primary_Folder.pipline.stage_cache import StageCache
 
 from Primary_Folder.components.data_ingestion import DataIngestion
 from Primary_Folder.components.data_validation import DataValidation
@@ -14,9 +18,12 @@ from Primary_Folder.entity.config_entity import (DataIngestionConfig,
                                           DataTransformationConfig,
                                           ModelTrainerConfig,
                                           ModelEvaluationConfig,
-                                          ModelPusherConfig)
+                                          ModelPusherConfig,
+                                          StageCacheConfig,
+                                          ArtifactStoreConfig)
                                           
 
+from Primary_Folder.entity.estimator import TargetValueMapping
 from Primary_Folder.entity.artifact_entity import (DataIngestionArtifact,
                                             DataValidationArtifact,
                                             DataTransformationArtifact,
@@ -27,13 +34,26 @@ from Primary_Folder.entity.artifact_entity import (DataIngestionArtifact,
 
 
 class TrainPipeline:
-    def __init__(self):
-        self.data_ingestion_config = DataIngestionConfig()
+    def __init__(self, progress_callback: Optional[Callable[[str, str, object], None]] = None,
+                 full_refresh: bool = False):
+        """
+        :param progress_callback: Optional function called with (stage_name, status, artifact) as stages run
+        :param full_refresh: Re-export the whole collection instead of the documents above the ingestion watermark
+        """
+        self.progress_callback = progress_callback
+        self.data_ingestion_config = DataIngestionConfig(full_refresh=full_refresh)
         self.data_validation_config = DataValidationConfig()
         self.data_transformation_config = DataTransformationConfig()
         self.model_trainer_config = ModelTrainerConfig()
         self.model_evaluation_config = ModelEvaluationConfig()
         self.model_pusher_config = ModelPusherConfig()
+        self.stage_cache_config = StageCacheConfig()
+        self.stage_cache = (StageCache(cache_dir=self.stage_cache_config.cache_dir,
+                                       max_size_bytes=self.stage_cache_config.max_size_bytes)
+                            if self.stage_cache_config.enabled else None)
+        self.artifact_store_config = ArtifactStoreConfig()
+        # created by run_pipeline for the duration of the run
+        self.artifact_store: Optional[ArtifactStore] = None
 
 
     
@@ -44,7 +64,8 @@ class TrainPipeline:
         try:
             logging.info("Entered the start_data_ingestion method of TrainPipeline class")
             logging.info("Getting the data from mongodb")
-            data_ingestion = DataIngestion(data_ingestion_config=self.data_ingestion_config)
+            data_ingestion = DataIngestion(data_ingestion_config=self.data_ingestion_config,
+                                           artifact_store=self.artifact_store)
             data_ingestion_artifact = data_ingestion.initiate_data_ingestion()
             logging.info("Got the train_set and test_set from mongodb")
             logging.info(
@@ -64,10 +85,23 @@ class TrainPipeline:
 
         try:
             data_validation = DataValidation(data_ingestion_artifact=data_ingestion_artifact,
-                                             data_validation_config=self.data_validation_config
+                                             data_validation_config=self.data_validation_config,
+                                             artifact_store=self.artifact_store
                                              )
 
-            data_validation_artifact = data_validation.initiate_data_validation()
+            data_validation_artifact = self.run_cached(
+                "data_validation", data_validation.initiate_data_validation,
+                stage_dir=self.data_validation_config.data_validation_dir,
+                input_files=[data_ingestion_artifact.trained_file_path, data_ingestion_artifact.test_file_path,
+                             SCHEMA_FILE_PATH],
+                params={"non_numeric_values": data_ingestion_artifact.non_numeric_values,
+                        "drift_engine": self.data_validation_config.drift_engine,
+                        "drift_numeric_test": self.data_validation_config.drift_numeric_test,
+                        "drift_categorical_test": self.data_validation_config.drift_categorical_test,
+                        "drift_mode": self.data_validation_config.drift_mode,
+                        "sketch_relative_accuracy": self.data_validation_config.sketch_relative_accuracy,
+                        "sketch_max_categories": self.data_validation_config.sketch_max_categories,
+                        "sketch_hash_buckets": self.data_validation_config.sketch_hash_buckets})
 
             logging.info("Performed the data validation operation")
 
@@ -91,8 +125,18 @@ class TrainPipeline:
         try:
             data_transformation = DataTransformation(data_ingestion_artifact=data_ingestion_artifact,
                                                      data_transformation_config=self.data_transformation_config,
-                                                     data_validation_artifact=data_validation_artifact)
-            data_transformation_artifact = data_transformation.initiate_data_transformation()
+                                                     data_validation_artifact=data_validation_artifact,
+                                                     artifact_store=self.artifact_store)
+            data_transformation_artifact = self.run_cached(
+                "data_transformation", data_transformation.initiate_data_transformation,
+                stage_dir=self.data_transformation_config.data_transformation_dir,
+                input_files=[data_ingestion_artifact.trained_file_path, data_ingestion_artifact.test_file_path,
+                             SCHEMA_FILE_PATH],
+                # CURRENT_YEAR changes without any code change, company_age of every row with it
+                params={"validation_status": data_validation_artifact.validation_status,
+                        "current_year": CURRENT_YEAR,
+                        "target_column": TARGET_COLUMN,
+                        "target_mapping": TargetValueMapping()._asdict()})
             return data_transformation_artifact
         except Exception as e:
             raise final_except(e, sys)
@@ -105,9 +149,17 @@ class TrainPipeline:
         """
         try:
             model_trainer = ModelTrainer(data_transformation_artifact=data_transformation_artifact,
-                                         model_trainer_config=self.model_trainer_config
+                                         model_trainer_config=self.model_trainer_config,
+                                         artifact_store=self.artifact_store
                                          )
-            model_trainer_artifact = model_trainer.initiate_model_trainer()
+            model_trainer_artifact = self.run_cached(
+                "model_trainer", model_trainer.initiate_model_trainer,
+                stage_dir=self.model_trainer_config.model_trainer_dir,
+                input_files=[data_transformation_artifact.transformed_train_file_path,
+                             data_transformation_artifact.transformed_test_file_path,
+                             data_transformation_artifact.transformed_object_file_path,
+                             self.model_trainer_config.model_config_file_path],
+                params={"expected_accuracy": self.model_trainer_config.expected_accuracy})
             return model_trainer_artifact
 
         except Exception as e:
@@ -123,7 +175,8 @@ class TrainPipeline:
         try:
             model_evaluation = ModelEvaluation(model_eval_config=self.model_evaluation_config,
                                                data_ingestion_artifact=data_ingestion_artifact,
-                                               model_trainer_artifact=model_trainer_artifact)
+                                               model_trainer_artifact=model_trainer_artifact,
+                                               artifact_store=self.artifact_store)
             model_evaluation_artifact = model_evaluation.initiate_model_evaluation()
             return model_evaluation_artifact
         except Exception as e:
@@ -152,25 +205,100 @@ class TrainPipeline:
         
 
     
+    def run_cached(self, stage_name: str, stage_fn: Callable, stage_dir: str, input_files: Iterable[str],
+                   params: Optional[dict] = None) -> object:
+        """
+        This method of TrainPipeline class reuses the cached output of a stage when its input files, parameters
+        and the code are unchanged, and runs stage_fn and caches its artifact otherwise
+        """
+        if self.stage_cache is None:
+            return stage_fn()
+        input_files = list(input_files)
+        if self.artifact_store is not None:
+            # inputs are hashed and outputs copied from disk, so their background writes must be done
+            self.artifact_store.wait(input_files)
+        fingerprint = self.stage_cache.fingerprint(stage_name, input_files=input_files, params=params)
+        artifact = self.stage_cache.get(stage_name, fingerprint, stage_dir)
+        if artifact is not None:
+            return artifact
+        artifact = stage_fn()
+        if self.artifact_store is not None:
+            self.artifact_store.wait()
+        self.stage_cache.put(stage_name, fingerprint, artifact, stage_dir)
+        return artifact
+
+    def run_stage(self, stage_name: str, stage_fn: Callable, **kwargs) -> object:
+        """
+        This method of TrainPipeline class runs one stage and reports its progress to progress_callback
+        """
+        self._report_progress(stage_name, "running")
+        try:
+            artifact = stage_fn(**kwargs)
+        except Exception:
+            self._report_progress(stage_name, "failed")
+            raise
+        self._report_progress(stage_name, "succeeded", artifact)
+        return artifact
+
+    def _report_progress(self, stage_name: str, status: str, artifact: object = None) -> None:
+        if self.progress_callback is not None:
+            self.progress_callback(stage_name, status, artifact)
+
     def run_pipeline(self, ) -> None:
         """
-        This method of TrainPipeline class is responsible for running complete pipeline
+        This method of TrainPipeline class is responsible for running complete pipeline, stage outputs being
+        handed over in memory through the artifact store, retained once per stage reading them
         """
         try:
-            data_ingestion_artifact = self.start_data_ingestion()
-            data_validation_artifact = self.start_data_validation(data_ingestion_artifact=data_ingestion_artifact)
-            data_transformation_artifact = self.start_data_transformation(
+            if self.artifact_store_config.enabled:
+                self.artifact_store = ArtifactStore(max_write_workers=self.artifact_store_config.max_write_workers)
+            store = self.artifact_store
+
+            data_ingestion_artifact = self.run_stage("data_ingestion", self.start_data_ingestion)
+            train_test_files = [data_ingestion_artifact.trained_file_path, data_ingestion_artifact.test_file_path]
+            if store is not None:
+                # train: validation and transformation, test: evaluation too
+                store.retain(train_test_files, count=2)
+                store.retain([data_ingestion_artifact.test_file_path])
+
+            data_validation_artifact = self.run_stage("data_validation", self.start_data_validation,
+                                                      data_ingestion_artifact=data_ingestion_artifact)
+            if store is not None:
+                store.release(train_test_files)
+
+            data_transformation_artifact = self.run_stage("data_transformation", self.start_data_transformation,
                 data_ingestion_artifact=data_ingestion_artifact, data_validation_artifact=data_validation_artifact)
-            model_trainer_artifact = self.start_model_trainer(data_transformation_artifact=data_transformation_artifact)
-            model_evaluation_artifact = self.start_model_evaluation(data_ingestion_artifact=data_ingestion_artifact,
-                                                                    model_trainer_artifact=model_trainer_artifact)
+            transformed_files = [data_transformation_artifact.transformed_train_file_path,
+                                 data_transformation_artifact.transformed_test_file_path,
+                                 data_transformation_artifact.transformed_object_file_path]
+            if store is not None:
+                store.release(train_test_files)
+                store.retain(transformed_files)
+
+            model_trainer_artifact = self.run_stage("model_trainer", self.start_model_trainer,
+                                                    data_transformation_artifact=data_transformation_artifact)
+            if store is not None:
+                store.release(transformed_files)
+
+            model_evaluation_artifact = self.run_stage("model_evaluation", self.start_model_evaluation,
+                                                       data_ingestion_artifact=data_ingestion_artifact,
+                                                       model_trainer_artifact=model_trainer_artifact)
+            if store is not None:
+                store.release([data_ingestion_artifact.test_file_path])
             
             if not model_evaluation_artifact.is_model_accepted:
                 logging.info(f"Model not accepted.")
+                self._report_progress("model_pusher", "skipped")
                 return None
-            model_pusher_artifact = self.start_model_pusher(model_evaluation_artifact=model_evaluation_artifact)
+            model_pusher_artifact = self.run_stage("model_pusher", self.start_model_pusher,
+                                                   model_evaluation_artifact=model_evaluation_artifact)
 
 
         
         except Exception as e:
-            raise final_except(e, sys)
\ No newline at end of file
+            raise final_except(e, sys)
+        finally:
+            if self.artifact_store is not None:
+                # every artifact is on disk when the run returns
+                self.artifact_store.close()
+                self.artifact_store = None
\ No newline at end of file
@@ -0,0 +1,118 @@
+import argparse
+import json
+import subprocess
+import sys
+from typing import List, Optional
+
+# serving entry point, the serving stack on its own, then the stacks that must stay out of serving workers
+DEFAULT_PROFILED_MODULES = [
+    "app",
+    "Primary_Folder.pipline.prediction_pipeline",
+    "Primary_Folder.pipline.training_pipeline",
+    "Primary_Folder.components.data_validation",
+    "Primary_Folder.cloud_storage.aws_storage",
+    "evidently",
+    "imblearn",
+    "boto3",
+    "sklearn",
+    "pandas",
+]
+
+# runs in a fresh interpreter: reports the resident memory before and after importing one module
+_PROBE = """
+import json, sys, time
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1024 ** 2
+
+rss_before = rss_mb()
+start = time.perf_counter()
+__import__(sys.argv[1])
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "rss_before_mb": rss_before, "rss_after_mb": rss_mb()}))
+"""
+
+
+def parse_importtime(stderr: str) -> List[dict]:
+    """
+    Parses the `python -X importtime` lines into one entry per imported module
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if not self_us.isdigit():
+            continue
+        modules.append({"module": name, "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+    return modules
+
+
+def profile_import(module: str, top: int = 10, python: str = sys.executable) -> dict:
+    """
+    Method Name :   profile_import
+    Description :   This method imports module in a fresh interpreter and measures its import time,
+                    the resident memory it adds and the heaviest modules it pulls in
+
+    Output      :   dict with seconds, rss_after_mb, rss_delta_mb, n_modules and the top modules by self time
+    On Failure  :   The import error is reported in the "error" field
+    """
+    completed = subprocess.run([python, "-X", "importtime", "-c", _PROBE, module],
+                               capture_output=True, text=True)
+    imported = parse_importtime(completed.stderr)
+    report = {"module": module, "n_modules": len(imported)}
+    if completed.returncode != 0:
+        report["error"] = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "import failed"
+        return report
+
+    measures = json.loads(completed.stdout.strip().splitlines()[-1])
+    report.update(seconds=measures["seconds"], rss_after_mb=measures["rss_after_mb"],
+                  rss_delta_mb=measures["rss_after_mb"] - measures["rss_before_mb"])
+    report["top"] = sorted(imported, key=lambda entry: entry["self_ms"], reverse=True)[:top]
+    return report
+
+
+def format_report(reports: List[dict]) -> str:
+    lines = [f"{'module':<48} {'time (ms)':>10} {'rss (MB)':>9} {'+rss (MB)':>10} {'modules':>8}"]
+    for report in reports:
+        if "error" in report:
+            lines.append(f"{report['module']:<48} error: {report['error']}")
+            continue
+        lines.append(f"{report['module']:<48} {report['seconds'] * 1000:>10.1f} {report['rss_after_mb']:>9.1f} "
+                     f"{report['rss_delta_mb']:>10.1f} {report['n_modules']:>8}")
+    for report in reports:
+        if report.get("top"):
+            lines.append("")
+            lines.append(f"heaviest imports of {report['module']} (self ms / cumulative ms):")
+            lines.extend(f"  {entry['self_ms']:>9.1f} {entry['cumulative_ms']:>10.1f}  {entry['module']}"
+                         for entry in report["top"])
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> List[dict]:
+    parser = argparse.ArgumentParser(description="Import time and resident memory of the package modules, "
+                                                 "each measured in a fresh interpreter")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_PROFILED_MODULES, help="Modules to profile")
+    parser.add_argument("--top", type=int, default=10, help="Heaviest imported modules listed per module")
+    parser.add_argument("--json", dest="json_file", default=None, help="Also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    reports = [profile_import(module, top=args.top) for module in args.modules]
+    print(format_report(reports))
+    if args.json_file:
+        with open(args.json_file, "w") as json_file:
+            json.dump(reports, json_file, indent=2)
+    return reports
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,51 @@
+import hashlib
+import io
 import os
+import pickle
 import sys
+import tarfile
 
 import numpy as np
 import dill
+import pandas as pd
 import yaml
 from pandas import DataFrame
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
+from Primary_Folder.constants import MODEL_MMAP_FILE_EXTENSION, MODEL_MMAP_MIN_ARRAY_BYTES
 from Primary_Folder.exceptions import final_except
 from Primary_Folder.logger import logging
 
+logger = logging.getLogger(__name__)
+
+MMAP_MANIFEST_NAME = "manifest.pkl"
+MMAP_ARRAY_DIR = "arrays"
+
+PARQUET_FILE_EXTENSIONS = (".parquet",)
+ARROW_FILE_EXTENSIONS = (".arrow", ".feather")
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# (real path, size, mtime) -> sha256, files are hashed once per process
+_file_hashes: Dict[Tuple[str, int, int], str] = {}
+
+# dataframe attrs key of the per column count of values the export could not read as numbers
+NON_NUMERIC_VALUES_ATTR = "non_numeric_values"
+
+
+def hash_file(file_path: str) -> str:
+    """
+    Returns the sha256 of the content of file_path
+    """
+    stat = os.stat(file_path)
+    key = (os.path.realpath(file_path), stat.st_size, stat.st_mtime_ns)
+    if key not in _file_hashes:
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as file_obj:
+            for block in iter(lambda: file_obj.read(HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+        _file_hashes[key] = digest.hexdigest()
+    return _file_hashes[key]
+
 
 def read_yaml_file(file_path: str) -> dict:
     try:
@@ -32,14 +69,14 @@ def write_yaml_file(file_path: str, content: object, replace: bool = False) -> N
 
 
 def load_object(file_path: str) -> object:
-    logging.info("Entered the load_object method of utils")
+    logger.info("Entered the load_object method of utils")
 
     try:
 
         with open(file_path, "rb") as file_obj:
             obj = dill.load(file_obj)
 
-        logging.info("Exited the load_object method of utils")
+        logger.info("Exited the load_object method of utils")
 
         return obj
 
@@ -75,14 +112,126 @@ def load_numpy_array_data(file_path: str) -> np.array:
 
 
 def save_object(file_path: str, obj: object) -> None:
-    logging.info("Entered the save_object method of utils")
+    logger.info("Entered the save_object method of utils")
 
     try:
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
         with open(file_path, "wb") as file_obj:
             dill.dump(obj, file_obj)
 
-        logging.info("Exited the save_object method of utils")
+        logger.info("Exited the save_object method of utils")
+
+    except Exception as e:
+        raise final_except(e, sys) from e
+
+
+class _ArrayExtractingPickler(dill.Pickler):
+    """
+    Pickler writing large numeric arrays as persistent ids instead of inline bytes
+    """
+
+    def __init__(self, file, min_array_bytes: int):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.min_array_bytes = min_array_bytes
+        self.arrays = []
+        self._array_ids = {}
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, np.ndarray) or obj.dtype.hasobject or obj.nbytes < max(self.min_array_bytes, 1):
+            return None
+        # an array shared by several objects is stored once and stays shared after loading
+        index = self._array_ids.get(id(obj))
+        if index is None:
+            index = self._array_ids[id(obj)] = len(self.arrays)
+            self.arrays.append(obj)
+        return ("ndarray", index)
+
+
+class _ArrayMappingUnpickler(dill.Unpickler):
+    def __init__(self, file, arrays: list):
+        super().__init__(file)
+        self.arrays = arrays
+
+    def persistent_load(self, pid):
+        kind, index = pid
+        if kind != "ndarray":
+            raise pickle.UnpicklingError(f"Unknown persistent id {pid}")
+        return self.arrays[index]
+
+
+def mmap_artifact_path(file_path: str) -> str:
+    """
+    Path of the memory-mappable artifact stored next to the file_path pickle, e.g. model.pkl -> model.mmap
+    """
+    return os.path.splitext(file_path)[0] + MODEL_MMAP_FILE_EXTENSION
+
+
+def save_mmap_object(file_path: str, obj: object, min_array_bytes: int = MODEL_MMAP_MIN_ARRAY_BYTES) -> None:
+    """
+    Save obj as an uncompressed tar holding a pickle manifest of the Python structure and every
+    numeric array of at least min_array_bytes as its own .npy member, so load_mmap_object can map them
+    file_path: str location of file to save
+    obj: object to save
+    """
+    logger.info("Entered the save_mmap_object method of utils")
+
+    try:
+        manifest = io.BytesIO()
+        pickler = _ArrayExtractingPickler(manifest, min_array_bytes=min_array_bytes)
+        pickler.dump(obj)
+
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        with tarfile.open(file_path + ".tmp", "w", format=tarfile.PAX_FORMAT) as tar:
+            members = [(MMAP_MANIFEST_NAME, manifest)]
+            for index, array in enumerate(pickler.arrays):
+                block = io.BytesIO()
+                np.lib.format.write_array(block, array, allow_pickle=False)
+                members.append((f"{MMAP_ARRAY_DIR}/{index}.npy", block))
+            for name, content in members:
+                tar_info = tarfile.TarInfo(name)
+                tar_info.size = content.getbuffer().nbytes
+                content.seek(0)
+                tar.addfile(tar_info, content)
+        os.replace(file_path + ".tmp", file_path)
+
+        logger.info(f"Saved {len(pickler.arrays)} arrays "
+                     f"({sum(array.nbytes for array in pickler.arrays)} bytes) as mappable blocks in {file_path}")
+
+    except Exception as e:
+        raise final_except(e, sys) from e
+
+
+def load_mmap_object(file_path: str) -> object:
+    """
+    Load an object saved by save_mmap_object. Arrays are copy-on-write memory maps of the file,
+    so every process loading the same file shares the same physical pages
+    file_path: str location of file to load
+    return: object with np.memmap arrays
+    """
+    logger.info("Entered the load_mmap_object method of utils")
+
+    try:
+        with tarfile.open(file_path, "r:") as tar:
+            members = {member.name: member for member in tar.getmembers()}
+            manifest = tar.extractfile(members[MMAP_MANIFEST_NAME]).read()
+
+        arrays = []
+        with open(file_path, "rb") as file_obj:
+            for index in range(len(members) - 1):
+                file_obj.seek(members[f"{MMAP_ARRAY_DIR}/{index}.npy"].offset_data)
+                version = np.lib.format.read_magic(file_obj)
+                if version == (1, 0):
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file_obj)
+                else:
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file_obj)
+                arrays.append(np.memmap(file_path, dtype=dtype, mode="c", shape=shape,
+                                        order="F" if fortran_order else "C", offset=file_obj.tell()))
+
+        obj = _ArrayMappingUnpickler(io.BytesIO(manifest), arrays).load()
+
+        logger.info(f"Exited the load_mmap_object method of utils, mapped {len(arrays)} arrays")
+
+        return obj
 
     except Exception as e:
         raise final_except(e, sys) from e
@@ -95,13 +244,315 @@ def drop_columns(df: DataFrame, cols: list)-> DataFrame:
     df: pandas DataFrame
     cols: list of columns to be dropped
     """
-    logging.info("Entered drop_columns methon of utils")
+    logger.info("Entered drop_columns methon of utils")
 
     try:
         df = df.drop(columns=cols, axis=1)
 
-        logging.info("Exited the drop_columns method of utils")
+        logger.info("Exited the drop_columns method of utils")
         
         return df
     except Exception as e:
-        raise final_except(e, sys) from e
\ No newline at end of file
+        raise final_except(e, sys) from e
+
+def get_schema_column_types(schema_config: dict) -> Dict[str, str]:
+    """
+    Returns the column name to type ("category", "int", "float") mapping of the columns section of schema.yaml
+    """
+    return {name: column_type for column in schema_config["columns"] for name, column_type in column.items()}
+
+
+def count_non_numeric_values(df: DataFrame, column_types: Dict[str, str]) -> Dict[str, int]:
+    """
+    Returns, for the int and float columns of column_types in df, the number of present values that are not
+    numbers, i.e. that pd.to_numeric(errors="coerce") turns into NaN. Columns without such values are left out
+    """
+    counts = {}
+    for column, column_type in column_types.items():
+        if column in df.columns and column_type in ("int", "float"):
+            n_values = int((pd.to_numeric(df[column], errors="coerce").isna() & df[column].notna()).sum())
+            if n_values:
+                counts[column] = n_values
+    return counts
+
+
+def read_file_schema(file_path: str):
+    """
+    Returns the Arrow schema stored in a Parquet (.parquet) or Arrow IPC (.arrow, .feather) file,
+    None for CSV files, whose columns have no stored type
+    """
+    try:
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension in PARQUET_FILE_EXTENSIONS:
+            import pyarrow.parquet as pq
+
+            return pq.read_schema(file_path)
+        if extension in ARROW_FILE_EXTENSIONS:
+            import pyarrow as pa
+
+            with pa.memory_map(file_path) as source:
+                return pa.ipc.open_file(source).schema
+        return None
+
+    except Exception as e:
+        raise final_except(e, sys) from e
+
+
+def apply_schema_dtypes(df: DataFrame, column_types: Dict[str, str]) -> DataFrame:
+    """
+    Casts the columns of df to the types of column_types: category columns to pandas category, int and float
+    columns to the narrowest numeric type holding their values. Columns missing from df are skipped
+    """
+    try:
+        df = df.copy(deep=False)
+        for column, column_type in column_types.items():
+            if column not in df.columns:
+                continue
+            if column_type == "category":
+                df[column] = df[column].astype("category")
+            elif column_type in ("int", "float"):
+                values = pd.to_numeric(df[column], errors="coerce")
+                # int columns with missing or fractional values stay float64
+                df[column] = pd.to_numeric(values, downcast="integer") if column_type == "int" else values
+        return df
+
+    except Exception as e:
+        raise final_except(e, sys) from e
+
+
+def _to_arrow_table(df: DataFrame, column_types: Dict[str, str], schema=None):
+    import pyarrow as pa
+
+    df = df.copy(deep=False)
+    for column, column_type in column_types.items():
+        if column not in df.columns:
+            continue
+        if column_type == "category":
+            df[column] = df[column].astype(object).where(df[column].notna(), None)
+        else:
+            # chunks disagree on integer width and nullability, float64 holds them all
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype(np.float64)
+    if schema is None:
+        schema = pa.Schema.from_pandas(df, preserve_index=False)
+        for index, field in enumerate(schema):
+            if column_types.get(field.name) == "category":
+                schema = schema.set(index, pa.field(field.name, pa.string()))
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+
+class DataFrameChunkWriter:
+    """
+    Writes dataframe chunks one after the other into file_path, as Parquet (.parquet), Arrow IPC (.arrow, .feather)
+    or CSV (any other extension), so only one chunk is in memory at a time. In the columnar formats the category
+    columns of column_types are stored as strings and the numeric ones as float64, read_dataframe narrows them
+    again. The file is written next to file_path and renamed by close, abort leaves file_path untouched.
+    Use it as a context manager, an exception in the block aborts.
+    """
+
+    def __init__(self, file_path: str, column_types: Optional[Dict[str, str]] = None,
+                 columns: Optional[List[str]] = None):
+        """
+        :param file_path: Output file
+        :param column_types: Column name to schema type, see get_schema_column_types
+        :param columns: Columns written, in that order, missing ones are empty
+        """
+        self.file_path = file_path
+        self.column_types = column_types or {}
+        self.columns = columns
+        self.n_rows = 0
+        self._header_written = False
+        self._tmp_file_path = file_path + ".tmp"
+        self._extension = os.path.splitext(file_path)[1].lower()
+        self._columnar = self._extension in PARQUET_FILE_EXTENSIONS + ARROW_FILE_EXTENSIONS
+        self._writer = None
+        self._schema = None
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        if not self._columnar:
+            self._writer = open(self._tmp_file_path, "w", newline="")
+
+    def _open_columnar(self, schema) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._schema = schema
+        self._writer = (pq.ParquetWriter(self._tmp_file_path, schema) if self._extension in PARQUET_FILE_EXTENSIONS
+                        else pa.ipc.new_file(self._tmp_file_path, schema))
+
+    def write(self, chunk: DataFrame) -> None:
+        if self.columns is not None:
+            chunk = chunk.reindex(columns=self.columns)
+        if self._columnar:
+            if len(chunk) == 0:
+                return
+            table = _to_arrow_table(chunk, self.column_types, schema=self._schema)
+            if self._writer is None:
+                self._open_columnar(table.schema)
+            self._writer.write_table(table)
+        else:
+            # once only, empty chunks included: a header row must never land among the data rows
+            chunk.to_csv(self._writer, index=False, header=not self._header_written)
+            self._header_written = True
+        self.n_rows += len(chunk)
+
+    def close(self) -> int:
+        if self._columnar and self._writer is None:
+            import pyarrow as pa
+
+            # no rows: an empty file of the format, with the columns when they are known
+            self._open_columnar(pa.schema([(column, pa.string() if self.column_types.get(column) == "category"
+                                            else pa.float64()) for column in (self.columns or [])]))
+        self._writer.close()
+        os.replace(self._tmp_file_path, self.file_path)
+        return self.n_rows
+
+    def abort(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        if os.path.exists(self._tmp_file_path):
+            os.remove(self._tmp_file_path)
+
+    def __enter__(self) -> "DataFrameChunkWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_dataframe_chunks(file_path: str, chunks: Iterable[DataFrame], column_types: Optional[Dict[str, str]] = None,
+                           columns: Optional[List[str]] = None) -> int:
+    """
+    Writes chunks into file_path with a DataFrameChunkWriter and returns the number of rows written
+    file_path: output file
+    chunks: dataframes with the same columns
+    column_types: column name to schema type, see get_schema_column_types
+    columns: columns written, in that order, missing ones are empty
+    """
+    try:
+        with DataFrameChunkWriter(file_path, column_types=column_types, columns=columns) as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+        return writer.n_rows
+
+    except Exception as e:
+        raise final_except(e, sys) from e
+
+
+def iter_dataframe_chunks(file_path: str, chunk_size: int, columns: Optional[List[str]] = None,
+                          column_types: Optional[Dict[str, str]] = None) -> Iterator[DataFrame]:
+    """
+    Reads a file written by write_dataframe or write_dataframe_chunks as dataframes of at most chunk_size rows,
+    only columns when given, with the columns of column_types cast by apply_schema_dtypes
+    """
+    try:
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension in PARQUET_FILE_EXTENSIONS:
+            import pyarrow.parquet as pq
+
+            batches = (batch.to_pandas() for batch in
+                       pq.ParquetFile(file_path).iter_batches(batch_size=chunk_size, columns=columns))
+        elif extension in ARROW_FILE_EXTENSIONS:
+            import pyarrow as pa
+
+            def read_batches() -> Iterator[DataFrame]:
+                with pa.memory_map(file_path) as source:
+                    reader = pa.ipc.open_file(source)
+                    for index in range(reader.num_record_batches):
+                        batch = reader.get_batch(index)
+                        if columns is not None:
+                            batch = batch.select(columns)
+                        for offset in range(0, batch.num_rows, chunk_size):
+                            yield batch.slice(offset, chunk_size).to_pandas()
+
+            batches = read_batches()
+        else:
+            batches = (chunk[columns] if columns is not None else chunk
+                       for chunk in pd.read_csv(file_path, usecols=columns, chunksize=chunk_size))
+        for chunk in batches:
+            yield apply_schema_dtypes(chunk, column_types) if column_types else chunk
+
+    except Exception as e:
+        raise final_except(e, sys) from e
+
+
+def read_dataframe_sample(file_path: str, n_rows: int, n_parts: int) -> DataFrame:
+    """
+    Reads about n_rows rows of a file written by write_dataframe or write_dataframe_chunks, as runs of consecutive
+    rows from up to n_parts row groups (Parquet) or record batches (Arrow IPC) spread evenly over the file, the
+    first and the last included, so rows appended at the end of a file are sampled too.
+    CSV files cannot be sought by row, only their first n_rows rows are read
+    """
+    try:
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension in PARQUET_FILE_EXTENSIONS:
+            import pyarrow.parquet as pq
+
+            parquet_file = pq.ParquetFile(file_path)
+            indices = np.unique(np.linspace(0, parquet_file.num_row_groups - 1,
+                                            min(n_parts, parquet_file.num_row_groups)).round().astype(int))
+            part_rows = max(1, -(-n_rows // max(len(indices), 1)))
+            batches = [next(parquet_file.iter_batches(batch_size=part_rows, row_groups=[int(index)]), None)
+                       for index in indices]
+            parts = [batch.to_pandas() for batch in batches if batch is not None and batch.num_rows]
+        elif extension in ARROW_FILE_EXTENSIONS:
+            import pyarrow as pa
+
+            with pa.memory_map(file_path) as source:
+                reader = pa.ipc.open_file(source)
+                indices = np.unique(np.linspace(0, reader.num_record_batches - 1,
+                                                min(n_parts, reader.num_record_batches)).round().astype(int))
+                part_rows = max(1, -(-n_rows // max(len(indices), 1)))
+                # converted while the file is still mapped
+                parts = [reader.get_batch(int(index)).slice(0, part_rows).to_pandas() for index in indices]
+                parts = [part for part in parts if len(part)]
+        else:
+            return pd.read_csv(file_path, nrows=n_rows)
+
+        # a file without rows has no part to read, reading it whole is cheap
+        return pd.concat(parts, ignore_index=True) if parts else read_dataframe(file_path)
+
+    except Exception as e:
+        raise final_except(e, sys) from e
+
+
+def write_dataframe(file_path: str, df: DataFrame) -> None:
+    """
+    Writes df to file_path as Parquet (.parquet), Arrow IPC (.arrow, .feather) or CSV (any other extension),
+    keeping its dtypes in the columnar formats
+    """
+    try:
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension in PARQUET_FILE_EXTENSIONS:
+            df.to_parquet(file_path, index=False)
+        elif extension in ARROW_FILE_EXTENSIONS:
+            df.reset_index(drop=True).to_feather(file_path)
+        else:
+            df.to_csv(file_path, index=False, header=True)
+
+    except Exception as e:
+        raise final_except(e, sys) from e
+
+
+def read_dataframe(file_path: str, columns: Optional[List[str]] = None,
+                   column_types: Optional[Dict[str, str]] = None) -> DataFrame:
+    """
+    Reads a file written by write_dataframe or write_dataframe_chunks, only columns when given, and casts
+    the columns of column_types with apply_schema_dtypes
+    """
+    try:
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension in PARQUET_FILE_EXTENSIONS:
+            df = pd.read_parquet(file_path, columns=columns)
+        elif extension in ARROW_FILE_EXTENSIONS:
+            df = pd.read_feather(file_path, columns=columns)
+        else:
+            df = pd.read_csv(file_path, usecols=columns)
+            if columns is not None:
+                df = df[columns]
+        return apply_schema_dtypes(df, column_types) if column_types else df
+
+    except Exception as e:
+        raise final_except(e, sys) from e
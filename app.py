@@ -1,17 +1,31 @@
+import asyncio
+import multiprocessing
+import os
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, File, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.responses import HTMLResponse, RedirectResponse
 from uvicorn import run as app_run
 
-from typing import Optional
+from dataclasses import asdict
+from typing import List, Optional
+from pydantic import BaseModel
 
 from Primary_Folder.constants import APP_HOST, APP_PORT
-from Primary_Folder.pipline.prediction_pipeline import USvisaData, USvisaClassifier
-from Primary_Folder.pipline.training_pipeline import TrainPipeline
+from Primary_Folder.entity.config_entity import USvisaPredictorConfig
+from Primary_Folder.entity.estimator import TargetValueMapping
+from Primary_Folder.exceptions import InvalidInputError
+from Primary_Folder.logger import logging
+from Primary_Folder.metrics import REGISTRY, stage_histogram
+from Primary_Folder.pipline.batching import PredictionBatcher
+from Primary_Folder.pipline.bulk_scoring import StreamingCSVScorer
+from Primary_Folder.pipline.executor import InferenceExecutor
+from Primary_Folder.pipline.prediction_cache import PredictionCache
+from Primary_Folder.pipline.prediction_pipeline import USvisaData, USvisaClassifier, warm_up_worker
+from Primary_Folder.pipline.training_jobs import TrainingJobManager
 
 app = FastAPI()
 
@@ -19,6 +33,59 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 
 templates = Jinja2Templates(directory='templates')
 
+prediction_config = USvisaPredictorConfig()
+
+# process pool workers hold their own model, each one warms it up in the pool initializer and counts itself here
+warmed_inference_workers = multiprocessing.Value("i", 0)
+
+inference_executor = InferenceExecutor(
+    max_workers=prediction_config.executor_max_workers,
+    max_queue_size=prediction_config.executor_max_queue_size,
+    use_processes=prediction_config.executor_use_processes,
+    initializer=warm_up_worker if prediction_config.executor_use_processes else None,
+    initargs=(prediction_config, prediction_config.warmup_rounds, warmed_inference_workers),
+)
+
+model_predictor = USvisaClassifier(prediction_pipeline_config=prediction_config)
+
+prediction_batcher = PredictionBatcher(
+    predict_fn=model_predictor.predict_with_version,
+    max_batch_size=prediction_config.batch_max_size,
+    max_wait_ms=prediction_config.batch_max_wait_ms,
+    executor=inference_executor,
+    predict_record_fn=model_predictor.predict_record_with_version,
+)
+
+prediction_cache = PredictionCache(
+    max_size=prediction_config.cache_max_size,
+    ttl_seconds=prediction_config.cache_ttl_seconds,
+) if prediction_config.cache_enabled else None
+
+training_job_manager = TrainingJobManager()
+
+# set by the startup warm-up once the production model has served synthetic predictions
+model_readiness = {"ready": False, "error": None}
+
+FORM_LATENCY = stage_histogram("form")
+PREDICT_ROUTE_LATENCY = stage_histogram("predict_route")
+
+
+def route_counters(route: str):
+    """
+    Returns the (requests, errors) counters of one prediction route
+    """
+    return (REGISTRY.counter("usvisa_requests_total", "Number of prediction requests", {"route": route}),
+            REGISTRY.counter("usvisa_request_errors_total", "Number of failed prediction requests", {"route": route}))
+
+
+PREDICT_REQUESTS, PREDICT_ERRORS = route_counters("/")
+BATCH_PREDICT_REQUESTS, BATCH_PREDICT_ERRORS = route_counters("/predict/batch")
+PREDICT_REJECTED = REGISTRY.counter("usvisa_rejected_inputs_total", "Number of inputs rejected by validation",
+                                    {"route": "/"})
+BATCH_PREDICT_REJECTED = REGISTRY.counter("usvisa_rejected_inputs_total", "Number of inputs rejected by validation",
+                                          {"route": "/predict/batch"})
+CSV_PREDICT_REQUESTS, CSV_PREDICT_ERRORS = route_counters("/predict/csv")
+
 origins = ["*"]
 
 app.add_middleware(
@@ -45,17 +112,35 @@ class DataForm:
         
 
     async def get_usvisa_data(self):
-        form = await self.request.form()
-        self.continent = form.get("continent")
-        self.education_of_employee = form.get("education_of_employee")
-        self.has_job_experience = form.get("has_job_experience")
-        self.requires_job_training = form.get("requires_job_training")
-        self.no_of_employees = form.get("no_of_employees")
-        self.company_age = form.get("company_age")
-        self.region_of_employment = form.get("region_of_employment")
-        self.prevailing_wage = form.get("prevailing_wage")
-        self.unit_of_wage = form.get("unit_of_wage")
-        self.full_time_position = form.get("full_time_position")
+        with FORM_LATENCY.time():
+            form = await self.request.form()
+            self.continent = form.get("continent")
+            self.education_of_employee = form.get("education_of_employee")
+            self.has_job_experience = form.get("has_job_experience")
+            self.requires_job_training = form.get("requires_job_training")
+            self.no_of_employees = form.get("no_of_employees")
+            self.company_age = form.get("company_age")
+            self.region_of_employment = form.get("region_of_employment")
+            self.prevailing_wage = form.get("prevailing_wage")
+            self.unit_of_wage = form.get("unit_of_wage")
+            self.full_time_position = form.get("full_time_position")
+
+class USvisaRecord(BaseModel):
+    continent: str
+    education_of_employee: str
+    has_job_experience: str
+    requires_job_training: str
+    no_of_employees: float
+    region_of_employment: str
+    prevailing_wage: float
+    unit_of_wage: str
+    full_time_position: str
+    company_age: float
+
+
+class BatchPredictionRequest(BaseModel):
+    records: List[USvisaRecord]
+    return_probability: bool = False
 
 @app.get("/", tags=["authentication"])
 async def index(request: Request):
@@ -65,57 +150,237 @@ async def index(request: Request):
 
 
 @app.get("/train")
-async def trainRouteClient():
+def trainRouteClient(full_refresh: bool = False):
     try:
-        train_pipeline = TrainPipeline()
+        job = training_job_manager.submit(full_refresh=full_refresh)
 
-        train_pipeline.run_pipeline()
-
-        return Response("Training successful !!")
+        return {"status": True, "job_id": job.job_id, "job_status": job.status}
 
     except Exception as e:
         return Response(f"Error Occurred! {e}")
 
 
+@app.get("/train/{job_id}")
+def trainStatusRouteClient(job_id: str):
+    job = training_job_manager.get_job(job_id)
+    if job is None:
+        return JSONResponse({"status": False, "error": f"Unknown training job {job_id}"}, status_code=404)
+
+    return {"status": True, "job": asdict(job)}
+
+
+@app.get("/train/{job_id}/artifacts")
+def trainArtifactsRouteClient(job_id: str):
+    job = training_job_manager.get_job(job_id)
+    if job is None:
+        return JSONResponse({"status": False, "error": f"Unknown training job {job_id}"}, status_code=404)
+
+    return {"status": True, "job_id": job.job_id, "job_status": job.status, "artifacts": job.artifacts}
+
+
+async def predict_usvisa_data(usvisa_data: USvisaData):
+    """
+    Predicts one application, answering repeats from prediction_cache
+    """
+    if prediction_cache is None:
+        predictions, _ = await prediction_batcher.predict_record(usvisa_data.get_usvisa_data_as_dict())
+        return predictions[0]
+
+    cache_key = PredictionCache.make_key(usvisa_data.get_usvisa_data_as_dict())
+    model_cache = model_predictor.get_model_cache()
+    value = prediction_cache.get(cache_key, model_cache.model_version)
+    if value is None:
+        predictions, prediction_model_version = await prediction_batcher.predict_record(
+            usvisa_data.get_usvisa_data_as_dict())
+        value = predictions[0]
+        # a model swapped in while predicting, or another one in a pool worker process, must not reset the cache
+        if prediction_model_version == model_cache.model_version:
+            prediction_cache.put(cache_key, value, prediction_model_version)
+    return value
+
+
 @app.post("/")
 async def predictRouteClient(request: Request):
-    try:
-        form = DataForm(request)
-        await form.get_usvisa_data()
+    PREDICT_REQUESTS.inc()
+    with PREDICT_ROUTE_LATENCY.time():
+        try:
+            form = DataForm(request)
+            await form.get_usvisa_data()
+
+            # numbers arrive as text and categories unchecked, reject bad input before any model work
+            usvisa_record = model_predictor.get_input_validator().validate_record(dict(
+                                    continent= form.continent,
+                                    education_of_employee = form.education_of_employee,
+                                    has_job_experience = form.has_job_experience,
+                                    requires_job_training = form.requires_job_training,
+                                    no_of_employees= form.no_of_employees,
+                                    company_age= form.company_age,
+                                    region_of_employment = form.region_of_employment,
+                                    prevailing_wage= form.prevailing_wage,
+                                    unit_of_wage= form.unit_of_wage,
+                                    full_time_position= form.full_time_position,
+                                    ))
+            usvisa_data = USvisaData(**usvisa_record)
         
-        usvisa_data = USvisaData(
-                                continent= form.continent,
-                                education_of_employee = form.education_of_employee,
-                                has_job_experience = form.has_job_experience,
-                                requires_job_training = form.requires_job_training,
-                                no_of_employees= form.no_of_employees,
-                                company_age= form.company_age,
-                                region_of_employment = form.region_of_employment,
-                                prevailing_wage= form.prevailing_wage,
-                                unit_of_wage= form.unit_of_wage,
-                                full_time_position= form.full_time_position,
-                                )
+            value = await predict_usvisa_data(usvisa_data)
+
+            status = None
+            if value == 1:
+                status = "Visa-approved"
+            else:
+                status = "Visa Not-Approved"
+
+            return templates.TemplateResponse(
+                "usvisa.html",
+                {"request": request, "context": status},
+            )
+
+        except InvalidInputError as e:
+            PREDICT_REJECTED.inc()
+            return JSONResponse({"status": False, "error": f"{e}", "errors": e.errors}, status_code=422)
         
-        usvisa_df = usvisa_data.get_usvisa_input_data_frame()
+        except Exception as e:
+            PREDICT_ERRORS.inc()
+            return {"status": False, "error": f"{e}"}
 
-        model_predictor = USvisaClassifier()
 
-        value = model_predictor.predict(dataframe=usvisa_df)[0]
+@app.get("/predict/cache")
+async def predictionCacheRouteClient():
+    if prediction_cache is None:
+        return {"status": False, "error": "Prediction cache is disabled"}
 
-        status = None
-        if value == 1:
-            status = "Visa-approved"
-        else:
-            status = "Visa Not-Approved"
+    return {"status": True, "cache": prediction_cache.stats()}
+
+
+@app.post("/predict/batch")
+async def batchPredictRouteClient(batch_request: BatchPredictionRequest):
+    BATCH_PREDICT_REQUESTS.inc()
+    try:
+        usvisa_df = USvisaData.get_usvisa_batch_data_frame(
+            [record.dict() for record in batch_request.records])
+
+        valid_df, errors = model_predictor.get_input_validator().validate_dataframe(usvisa_df)
+        if errors:
+            BATCH_PREDICT_REJECTED.inc(len(usvisa_df) - len(valid_df))
+
+        predictions, probabilities = [], None
+        if len(valid_df):
+            predictions, probabilities = await inference_executor.run(
+                model_predictor.predict_batch, dataframe=valid_df,
+                return_probability=batch_request.return_probability)
+
+        # rejected records keep their position in the response with a null prediction
+        target_mapping = TargetValueMapping().reverse_mapping()
+        positions = {int(row): position for position, row in enumerate(valid_df.index)}
+        response = {
+            "status": True,
+            "predictions": [int(predictions[positions[row]]) if row in positions else None
+                            for row in range(len(usvisa_df))],
+        }
+        response["case_status"] = [None if value is None else target_mapping[value] for value in response["predictions"]]
+        if probabilities is not None:
+            response["probabilities"] = [
+                {target_mapping[label]: float(probability) for label, probability in enumerate(probabilities[positions[row]])}
+                if row in positions else None
+                for row in range(len(usvisa_df))
+            ]
+        if errors:
+            response["errors"] = [{**error, "row": int(error["row"])} for error in errors]
+        return response
+
+    except InvalidInputError as e:
+        BATCH_PREDICT_REJECTED.inc(len(batch_request.records))
+        return JSONResponse({"status": False, "error": f"{e}", "errors": e.errors}, status_code=422)
+
+    except Exception as e:
+        BATCH_PREDICT_ERRORS.inc()
+        return {"status": False, "error": f"{e}"}
+
+
+@app.post("/predict/csv")
+async def csvPredictRouteClient(file: UploadFile = File(...)):
+    CSV_PREDICT_REQUESTS.inc()
+    try:
+        # the scorer runs in this process, so load the model here: the cache holds a lock and a watcher
+        # thread and cannot be pickled to a process pool worker
+        model = await asyncio.get_running_loop().run_in_executor(None, model_predictor.get_model_cache().get_model)
+
+        scorer = StreamingCSVScorer(model=model, chunk_size=prediction_config.csv_chunk_size)
+
+        # a plain generator is iterated in starlette's threadpool, so chunks are scored off the event loop
+        return StreamingResponse(scorer.iter_csv(file.file), media_type="text/csv",
+                                 headers={"Content-Disposition": f"attachment; filename=scored_{file.filename}"})
 
-        return templates.TemplateResponse(
-            "usvisa.html",
-            {"request": request, "context": status},
-        )
-        
     except Exception as e:
+        CSV_PREDICT_ERRORS.inc()
         return {"status": False, "error": f"{e}"}
 
 
+@app.get("/metrics")
+async def metricsRouteClient():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/ready")
+async def readinessRouteClient():
+    if not model_readiness["ready"]:
+        return JSONResponse({"status": False, **model_readiness}, status_code=503)
+
+    return {"status": True, **model_readiness, "model_version": model_predictor.get_model_cache().model_version}
+
+
+async def warm_up_inference_workers():
+    """
+    Starts every worker of the inference process pool and waits until all of them warmed their model up
+    """
+    # workers start on demand: one call per worker starts them all, each running warm_up_worker first
+    await asyncio.gather(*[inference_executor.run(os.getpid) for _ in range(inference_executor.max_workers)])
+    while warmed_inference_workers.value < inference_executor.max_workers:
+        await asyncio.sleep(0.1)
+        # raises once a failed warm-up broke the pool
+        await inference_executor.run(os.getpid)
+
+
+async def warm_up_model():
+    """
+    Loads the production model and warms it up off the event loop, in this process and in every
+    inference pool worker process, retrying until it succeeds
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, model_predictor.warm_up, prediction_config.warmup_rounds)
+            if inference_executor.use_processes:
+                await warm_up_inference_workers()
+            model_readiness.update(ready=True, error=None)
+            logging.info(f"Model {model_predictor.get_model_cache().model_version} warmed up, worker is ready")
+            return
+        except Exception as e:
+            model_readiness["error"] = f"{e}"
+            logging.error(f"Model warm-up failed, retrying in {prediction_config.warmup_retry_interval_seconds}s: {e}")
+            if inference_executor.use_processes:
+                # start a fresh pool, its workers warm up again
+                inference_executor.shutdown(wait=False)
+                warmed_inference_workers.value = 0
+            await asyncio.sleep(prediction_config.warmup_retry_interval_seconds)
+
+
+@app.on_event("startup")
+async def startupModelWarmUp():
+    # keep a reference so the task is not garbage collected while it runs
+    app.state.warm_up_task = asyncio.create_task(warm_up_model())
+
+
+@app.on_event("shutdown")
+async def shutdownPredictionBatcher():
+    # before the executor shuts down: the running batches still need its workers
+    await prediction_batcher.shutdown()
+
+
+@app.on_event("shutdown")
+def shutdownInferenceExecutor():
+    inference_executor.shutdown(wait=False)
+
+
 if __name__ == "__main__":
     app_run(app, host=APP_HOST, port=APP_PORT)
\ No newline at end of file
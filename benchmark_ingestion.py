@@ -0,0 +1,57 @@
+import argparse
+import time
+
+from Primary_Folder.constants import SCHEMA_FILE_PATH
+from Primary_Folder.database_access.db_extract import USvisaData
+from Primary_Folder.entity.config_entity import DataIngestionConfig
+from Primary_Folder.utils.main import read_yaml_file
+
+
+def time_export(chunks) -> tuple:
+    start = time.perf_counter()
+    n_rows = sum(len(chunk) for chunk in chunks)
+    return n_rows, time.perf_counter() - start
+
+
+def run_benchmark(args, data_ingestion_config: DataIngestionConfig) -> list:
+    usvisa_data = USvisaData()
+    column_types = {name: column_type for column in read_yaml_file(file_path=SCHEMA_FILE_PATH)["columns"]
+                    for name, column_type in column.items()}
+    batch_size = args.batch_size or data_ingestion_config.export_batch_size
+
+    runs = [("single cursor", 1, 1)] + [(f"{n_partitions} partitions / {n_workers} threads", n_partitions, n_workers)
+                                       for n_partitions in args.partitions for n_workers in args.workers]
+    results = []
+    for name, n_partitions, n_workers in runs:
+        timings = []
+        for _ in range(args.rounds):
+            if n_partitions == 1:
+                chunks = usvisa_data.iter_collection_chunks(args.collection, batch_size, column_types=column_types)
+            else:
+                chunks = usvisa_data.iter_collection_chunks_parallel(args.collection, batch_size,
+                                                                     n_partitions=n_partitions,
+                                                                     max_workers=n_workers,
+                                                                     column_types=column_types)
+            n_rows, seconds = time_export(chunks)
+            timings.append(seconds)
+        results.append({"run": name, "rows": n_rows, "seconds": min(timings)})
+
+    baseline = results[0]["seconds"]
+    print(f"{'run':<32} {'rows':>10} {'best (s)':>9} {'rows/s':>10} {'speedup':>8}")
+    for result in results:
+        print(f"{result['run']:<32} {result['rows']:>10} {result['seconds']:>9.2f} "
+              f"{result['rows'] / result['seconds']:>10.0f} {baseline / result['seconds']:>7.2f}x")
+    return results
+
+
+if __name__ == "__main__":
+    data_ingestion_config = DataIngestionConfig()
+
+    parser = argparse.ArgumentParser(description="Single cursor against partitioned parallel export "
+                                                 "of the visa collection, best of --rounds runs")
+    parser.add_argument("--collection", default=data_ingestion_config.collection_name)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--partitions", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--workers", type=int, nargs="+", default=[data_ingestion_config.export_max_workers])
+    parser.add_argument("--rounds", type=int, default=3)
+    run_benchmark(parser.parse_args(), data_ingestion_config)
@@ -0,0 +1,60 @@
+import argparse
+
+from dataclasses import replace
+
+from Primary_Folder.entity.config_entity import CollectionScoringConfig, USvisaPredictorConfig
+from Primary_Folder.entity.s3_estimator import USvisaEstimator
+from Primary_Folder.pipline.bulk_scoring import StreamingCSVScorer
+from Primary_Folder.pipline.collection_scoring import CollectionScoringPipeline
+from Primary_Folder.utils.main import load_object
+
+
+def load_model(model_path: str, prediction_config: USvisaPredictorConfig):
+    if model_path is not None:
+        return load_object(file_path=model_path)
+    return USvisaEstimator(bucket_name=prediction_config.model_bucket_name,
+                           model_path=prediction_config.model_file_path).load_model()
+
+
+def score_csv(args, prediction_config: USvisaPredictorConfig) -> None:
+    scorer = StreamingCSVScorer(model=load_model(args.model_path, prediction_config),
+                                chunk_size=args.chunk_size or prediction_config.csv_chunk_size)
+    n_rows = scorer.score_to_file(source=args.input_file, output_file_path=args.output_file)
+    print(f"Scored {n_rows} rows into {args.output_file}")
+
+
+def score_collection(args, prediction_config: USvisaPredictorConfig) -> None:
+    collection_scoring_config = CollectionScoringConfig()
+    overrides = {"n_partitions": args.partitions, "max_workers": args.workers, "batch_size": args.batch_size}
+    collection_scoring_config = replace(collection_scoring_config,
+                                        **{key: value for key, value in overrides.items() if value is not None})
+    artifact = CollectionScoringPipeline(collection_scoring_config).run(restart=args.restart)
+    print(f"Scored {artifact.n_scored_documents} documents of {artifact.collection_name} "
+          f"with model {artifact.model_version}, {artifact.n_rejected_documents} rejected by input validation")
+
+
+if __name__ == "__main__":
+    prediction_config = USvisaPredictorConfig()
+
+    parser = argparse.ArgumentParser(description="Bulk scoring of us visa applications")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    csv_parser = subparsers.add_parser("csv", help="Score a CSV export in fixed-size chunks")
+    csv_parser.add_argument("input_file", help="CSV file of applications")
+    csv_parser.add_argument("-o", "--output-file", required=True, help="CSV file receiving the scored rows")
+    csv_parser.add_argument("--chunk-size", type=int, default=None,
+                            help=f"Rows per chunk (default {prediction_config.csv_chunk_size})")
+    csv_parser.add_argument("--model-path", default=None,
+                            help="Local model.pkl, by default the production model is read from s3")
+    csv_parser.set_defaults(func=score_csv)
+
+    collection_parser = subparsers.add_parser("collection", help="Re-score the whole mongodb collection")
+    collection_parser.add_argument("--partitions", type=int, default=None, help="Number of _id ranges")
+    collection_parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    collection_parser.add_argument("--batch-size", type=int, default=None, help="Documents per bulk write")
+    collection_parser.add_argument("--restart", action="store_true",
+                                   help="Ignore the checkpoint of an unfinished run and start over")
+    collection_parser.set_defaults(func=score_collection)
+
+    args = parser.parse_args()
+    args.func(args, prediction_config)
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from Primary_Folder.components.data_transformation import DataTransformation
+from Primary_Folder.entity.compiled_preprocessor import CompiledPreprocessor
+from Primary_Folder.pipline.prediction_pipeline import USvisaData
+
+
+def fitted_preprocessor():
+    data_transformation = DataTransformation(data_ingestion_artifact=None, data_transformation_config=None,
+                                             data_validation_artifact=None)
+    dataframe = USvisaData.get_warmup_data_frame()
+    rng = np.random.default_rng(0)
+    dataframe["no_of_employees"] = rng.integers(1, 100000, len(dataframe))
+    dataframe["prevailing_wage"] = rng.uniform(10, 300000, len(dataframe))
+    dataframe["company_age"] = rng.integers(1, 200, len(dataframe))
+    preprocessor = data_transformation.get_data_transformer_object()
+    preprocessor.fit(dataframe)
+    return preprocessor, dataframe
+
+
+def test_transform_matches_sklearn():
+    preprocessor, dataframe = fitted_preprocessor()
+    expected = np.asarray(preprocessor.transform(dataframe), dtype=np.float64)
+
+    compiled_preprocessor = CompiledPreprocessor.compile(preprocessor)
+
+    np.testing.assert_array_equal(compiled_preprocessor.transform(dataframe), expected)
+
+
+def test_transform_record_matches_sklearn():
+    preprocessor, dataframe = fitted_preprocessor()
+    expected = np.asarray(preprocessor.transform(dataframe), dtype=np.float64)
+
+    compiled_preprocessor = CompiledPreprocessor.compile(preprocessor)
+
+    for row, record in enumerate(dataframe.to_dict(orient="records")):
+        np.testing.assert_array_equal(compiled_preprocessor.transform_record(record)[0], expected[row])
+        # the form route passes the one-element lists of USvisaData.get_usvisa_data_as_dict
+        np.testing.assert_array_equal(
+            compiled_preprocessor.transform_record({column: [value] for column, value in record.items()})[0],
+            expected[row])